@@ -0,0 +1,146 @@
+import argparse
+import heapq
+import json
+import random
+import signal
+import sys
+import threading
+import time
+
+from N_T_G_CLI import TEST_ALIASES, add_tester_arguments, check_tester_arguments, make_tester, start_metrics_server
+from Results_Store import ResultsWriter
+
+DEFAULT_SCHEDULE = "ping=10,qos=60,bandwidth=3600"
+DEFAULT_JITTER = 0.1  # Each interval varies by up to this fraction, so agents started together drift apart
+DEFAULT_STORE = "agent_results.jsonl"
+DEFAULT_RESULTS = "agent_results.ntgr"
+
+
+def parse_schedule(spec):
+    # "ping=10,qos=60" -> {"Ping Test": 10.0, "QoS Metrics": 60.0}
+    schedule = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        alias, _, interval = item.partition("=")
+        alias = alias.strip()
+        if alias not in TEST_ALIASES:
+            raise ValueError(f"Unknown test in schedule: {alias}")
+        interval = float(interval)
+        if interval <= 0:
+            raise ValueError(f"Interval for {alias} must be positive")
+        schedule[TEST_ALIASES[alias]] = interval
+    if not schedule:
+        raise ValueError("Schedule is empty")
+    return schedule
+
+
+class ResultStore:
+    # Append-only JSON Lines file: one record per test run
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+class Agent:
+    # Runs tests on a recurring schedule with one warm NetworkTester: scapy and the
+    # other test dependencies are imported once, and with a persistent tester the
+    # raw sockets stay open between runs.
+    def __init__(self, tester, schedule, store, jitter=DEFAULT_JITTER, results=None):
+        self.tester = tester
+        self.schedule = schedule
+        self.store = store
+        self.results = results  # Results_Store.ResultsWriter for the numeric results, queryable in bulk
+        self.jitter = jitter
+        self.runs = 0
+        self.stop_event = threading.Event()
+
+    def _next_interval(self, interval):
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def run(self):
+        # Each test first runs at a random point within its interval, spreading out agents started together
+        now = time.monotonic()
+        due = [(now + random.uniform(0, interval), name) for name, interval in self.schedule.items()]
+        heapq.heapify(due)
+        try:
+            while not self.stop_event.is_set():
+                if self.stop_event.wait(max(0.0, due[0][0] - time.monotonic())):
+                    break
+                now = time.monotonic()
+                ready = []
+                while due and due[0][0] <= now:
+                    scheduled, name = heapq.heappop(due)
+                    ready.append(name)
+                    # Schedule from the planned time so runs do not drift, but skip runs missed while busy
+                    heapq.heappush(due, (max(scheduled + self._next_interval(self.schedule[name]), now), name))
+                self._run(ready)
+        finally:
+            self.tester.close()
+            if self.results is not None:
+                self.results.close()
+
+    def stop(self):
+        self.stop_event.set()
+        self.tester.stop()  # Also cut short a test that is running
+
+    def _run(self, names):
+        # Tests that fall due together share one scheduler run, so shared tests overlap
+        started = time.time()
+        _, scheduler = self.tester.run_tests(names, raise_errors=False)
+        for test in scheduler.tests:
+            if not test.ran:
+                continue
+            self.store.append({
+                "time": started,
+                "test": test.name,
+                "wall_time": test.wall_time,
+                "result": test.result,
+                "error": repr(test.error) if test.error is not None else None,
+            })
+        records = self.tester.take_records()
+        if self.results is not None:
+            self.results.append(records)
+        self.runs += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run network tests on a recurring schedule")
+    add_tester_arguments(parser)
+    parser.add_argument("--schedule", default=DEFAULT_SCHEDULE,
+                        help=f"Comma-separated test=seconds pairs, tests: {', '.join(TEST_ALIASES)} "
+                             f"(default: {DEFAULT_SCHEDULE})")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER,
+                        help="Random variation of each interval, as a fraction of it")
+    parser.add_argument("--store", default=DEFAULT_STORE, help="JSON Lines file results are appended to")
+    parser.add_argument("--results", default=DEFAULT_RESULTS,
+                        help="Results store the numeric results are also appended to, for queries and "
+                             "export with Results_Store.py (empty to disable)")
+    args = parser.parse_args(argv)
+    check_tester_arguments(parser, args)
+    try:
+        schedule = parse_schedule(args.schedule)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = ResultsWriter(args.results) if args.results else None
+    agent = Agent(make_tester(args, persistent=True), schedule, ResultStore(args.store), args.jitter, results)
+    server = start_metrics_server(args)  # Counters run on across the agent's test runs
+    signal.signal(signal.SIGTERM, lambda signum, frame: agent.stop())
+    try:
+        agent.run()
+    except KeyboardInterrupt:
+        agent.stop()
+    finally:
+        if server is not None:
+            server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
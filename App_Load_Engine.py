@@ -0,0 +1,246 @@
+import asyncio
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from Histogram import DEFAULT_PERCENTILES, Histogram
+
+DEFAULT_CONCURRENCY = 100
+REQUESTS_PER_CONNECTION = 100  # Keep-alive reuse before a connection is recycled
+DEFAULT_TIMEOUT = 5.0
+ERROR_BACKOFF = 0.1  # Pause after a failed connection so a dead service is not hammered in a tight loop
+
+
+async def _read_line_reply(reader):
+    # SMTP/FTP style reply: "250-..." continuation lines up to a final "250 ..." line
+    line = await reader.readline()
+    first_ns = time.perf_counter_ns()
+    while True:
+        if not line:
+            raise asyncio.IncompleteReadError(b"", None)
+        if len(line) < 4 or line[3:4] != b"-":
+            return first_ns, True
+        line = await reader.readline()
+
+
+async def _read_banner(reader):
+    line = await reader.readline()
+    if not line:
+        raise asyncio.IncompleteReadError(b"", None)
+    return time.perf_counter_ns(), True
+
+
+async def _read_chunk(reader):
+    # Telnet servers open with option negotiation rather than a line of text
+    if not await reader.read(4096):
+        raise asyncio.IncompleteReadError(b"", None)
+    return time.perf_counter_ns(), True
+
+
+async def _read_http_response(reader):
+    status = await reader.readline()
+    first_ns = time.perf_counter_ns()
+    if not status:
+        raise asyncio.IncompleteReadError(b"", None)
+    keep_alive = status.startswith(b"HTTP/1.1")
+    length = None
+    chunked = False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        value = value.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"transfer-encoding":
+            chunked = b"chunked" in value
+        elif name == b"connection":
+            keep_alive = value == b"keep-alive" or (keep_alive and value != b"close")
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)  # Chunk data and its CRLF
+            if size == 0:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()  # Body runs to the end of the connection
+        keep_alive = False
+    return first_ns, keep_alive
+
+
+class Dialogue:
+    # How to drive one application protocol over a connection: whether the server
+    # speaks first, the request repeated on a kept-alive connection, and how to
+    # read one reply. read_reply returns (time of the first reply line, keep alive).
+    def __init__(self, read_reply=None, greeting=False, request=None, goodbye=None):
+        self.read_reply = read_reply
+        self.greeting = greeting
+        self.request = request
+        self.goodbye = goodbye
+
+
+def _http_dialogue(host):
+    request = f"GET / HTTP/1.1\r\nHost: {host}\r\nUser-Agent: N_T_G\r\nConnection: keep-alive\r\n\r\n".encode()
+    return Dialogue(_read_http_response, request=request)
+
+
+APP_DIALOGUES = {
+    "TCP": lambda host: Dialogue(),  # Connection setup and teardown only
+    "HTTP": _http_dialogue,
+    "SMTP": lambda host: Dialogue(_read_line_reply, greeting=True, request=b"NOOP\r\n", goodbye=b"QUIT\r\n"),
+    "FTP": lambda host: Dialogue(_read_line_reply, greeting=True, request=b"NOOP\r\n", goodbye=b"QUIT\r\n"),
+    "POP3": lambda host: Dialogue(_read_banner, greeting=True, goodbye=b"QUIT\r\n"),
+    "SSH": lambda host: Dialogue(_read_banner, greeting=True),
+    "Telnet": lambda host: Dialogue(_read_chunk, greeting=True),
+}
+
+
+class AppLoadResult:
+    # Times are recorded in nanoseconds, reported in seconds
+    def __init__(self, traffic_type, concurrency):
+        self.traffic_type = traffic_type
+        self.concurrency = concurrency
+        self.connect_time = Histogram()
+        self.first_byte = Histogram()  # Request sent (or connection up, for greetings) to first reply line
+        self.response_time = Histogram()
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.active = 0
+        self.peak_connections = 0
+        self.elapsed = 0.0
+
+    @property
+    def connections_per_second(self):
+        return self.connections / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def requests_per_second(self):
+        return self.requests / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self, percents=DEFAULT_PERCENTILES):
+        # Numeric results in seconds and per second
+        summary = {
+            "connections": self.connections,
+            "requests": self.requests,
+            "errors": self.errors,
+            "connections_per_second": self.connections_per_second,
+            "requests_per_second": self.requests_per_second,
+            "peak_connections": self.peak_connections,
+            "average_connect_time": self.connect_time.mean / 1_000_000_000,
+            "average_first_byte": self.first_byte.mean / 1_000_000_000,
+            "average_response_time": self.response_time.mean / 1_000_000_000,
+        }
+        for percent in percents:
+            summary[f"connect_p{percent:g}"] = self.connect_time.percentile(percent) / 1_000_000_000
+            summary[f"response_p{percent:g}"] = self.response_time.percentile(percent) / 1_000_000_000
+        return summary
+
+
+def _raise_fd_limit(needed):
+    # Every concurrent connection holds a descriptor; lift the soft limit as far as allowed
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = needed + 64
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+
+class AppLoadEngine:
+    # Real kernel TCP connections (no raw sockets, so no root needed): `concurrency`
+    # connections per traffic type stay open at once, each reused for up to
+    # requests_per_connection requests while the protocol allows keep-alive.
+    def __init__(self, host, concurrency=DEFAULT_CONCURRENCY, requests_per_connection=REQUESTS_PER_CONNECTION,
+                 timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.concurrency = concurrency
+        self.requests_per_connection = requests_per_connection
+        self.timeout = timeout
+        self._stop_event = None
+
+    def run(self, targets, duration, stop_event=None):
+        # targets: {traffic_type: port}; returns {traffic_type: AppLoadResult}.
+        # Setting stop_event (a threading.Event) winds the run down early.
+        targets = {traffic_type: port for traffic_type, port in targets.items() if traffic_type in APP_DIALOGUES}
+        _raise_fd_limit(self.concurrency * len(targets))
+        self._stop_event = stop_event
+        return asyncio.run(self._run(targets, duration))
+
+    def _running(self, deadline):
+        return time.monotonic() < deadline and not (self._stop_event is not None and self._stop_event.is_set())
+
+    async def _run(self, targets, duration):
+        results = {traffic_type: AppLoadResult(traffic_type, self.concurrency) for traffic_type in targets}
+        start_time = time.monotonic()
+        deadline = start_time + duration
+        workers = []
+        for traffic_type, port in targets.items():
+            dialogue = APP_DIALOGUES[traffic_type](self.host)
+            workers.extend(self._worker(dialogue, port, results[traffic_type], deadline)
+                           for _ in range(self.concurrency))
+        await asyncio.gather(*workers)
+        elapsed = time.monotonic() - start_time
+        for result in results.values():
+            result.elapsed = elapsed
+        return results
+
+    async def _worker(self, dialogue, port, result, deadline):
+        while self._running(deadline):
+            try:
+                await self._session(dialogue, port, result, deadline)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                result.errors += 1
+                await asyncio.sleep(min(ERROR_BACKOFF, max(0.0, deadline - time.monotonic())))
+
+    async def _session(self, dialogue, port, result, deadline):
+        start_ns = time.perf_counter_ns()
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, port), self.timeout)
+        connected_ns = time.perf_counter_ns()
+        result.connect_time.record(connected_ns - start_ns)
+        result.connections += 1
+        result.active += 1
+        result.peak_connections = max(result.peak_connections, result.active)
+        try:
+            if dialogue.greeting:
+                first_ns, _ = await asyncio.wait_for(dialogue.read_reply(reader), self.timeout)
+                result.first_byte.record(first_ns - connected_ns)
+                # Like requests, timed from when the server could start answering; the
+                # handshake is in connect_time
+                result.response_time.record(time.perf_counter_ns() - connected_ns)
+                result.requests += 1
+            elif dialogue.request is None:
+                result.requests += 1  # Connect-only: the handshake is the request
+
+            if dialogue.request is not None:
+                for _ in range(self.requests_per_connection):
+                    if not self._running(deadline):
+                        break
+                    sent_ns = time.perf_counter_ns()
+                    writer.write(dialogue.request)
+                    await writer.drain()
+                    first_ns, keep_alive = await asyncio.wait_for(dialogue.read_reply(reader), self.timeout)
+                    result.first_byte.record(first_ns - sent_ns)
+                    result.response_time.record(time.perf_counter_ns() - sent_ns)
+                    result.requests += 1
+                    if not keep_alive:
+                        break
+
+            if dialogue.goodbye is not None:
+                writer.write(dialogue.goodbye)
+        finally:
+            result.active -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
@@ -0,0 +1,23 @@
+from App_Load_Engine import APP_DIALOGUES, AppLoadEngine
+
+def perform_app_load_test():
+    network_ip = input("Enter the IP address for application load test: ")
+    traffic_type = input(f"Enter the service ({', '.join(APP_DIALOGUES)}): ")
+    port = int(input("Enter the service port: "))
+    duration = int(input("Enter the duration for application load test (seconds): "))
+    concurrency = int(input("Enter the number of concurrent connections: ") or 100)
+
+    result = AppLoadEngine(network_ip, concurrency).run({traffic_type: port}, duration)[traffic_type]
+    summary = result.summary()
+    return (f"Connections: {result.connections} ({summary['connections_per_second']:.0f}/s), "
+            f"peak {summary['peak_connections']} concurrent, {summary['errors']} errors",
+            f"Requests: {result.requests} ({summary['requests_per_second']:.0f}/s)",
+            f"Connect time p50/p90/p99: {summary['connect_p50']:.6f} / {summary['connect_p90']:.6f} / "
+            f"{summary['connect_p99']:.6f} seconds",
+            f"Response time p50/p90/p99: {summary['response_p50']:.6f} / {summary['response_p90']:.6f} / "
+            f"{summary['response_p99']:.6f} seconds",
+            f"Average time to first byte: {summary['average_first_byte']:.6f} seconds")
+
+if __name__ == "__main__":
+    for line in perform_app_load_test():
+        print(line)
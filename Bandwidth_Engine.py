@@ -0,0 +1,297 @@
+import argparse
+import random
+import socket
+import struct
+import threading
+import time
+
+DEFAULT_PORT = 5201
+TCP_BLOCK_SIZE = 128 * 1024
+UDP_DATAGRAM_SIZE = 1472  # Fills a 1500 byte MTU after the IP and UDP headers
+RECEIVE_BUFFER_SIZE = 256 * 1024
+
+# Every TCP connection to the server starts with this header:
+# magic, version, kind, stream count, session token
+_HEADER = struct.Struct("!4sBBHQ")
+_MAGIC = b"NTGB"
+_VERSION = 1
+_KIND_TCP_DATA = 1
+_KIND_UDP_CONTROL = 2
+_UDP_PREFIX = struct.Struct("!QQ")  # Session token, datagram sequence number
+_UDP_REPORT = struct.Struct("!QQ")  # Bytes, datagrams received
+_TCP_REPORT = struct.Struct("!Q")
+_END = b"END!"
+_UDP_DRAIN_TIME = 0.25
+_STOP_POLL = 0.05  # How often a run checks for failed streams and stop requests between reports
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed by bandwidth peer")
+        data += chunk
+    return bytes(data)
+
+
+class BandwidthResult:
+    def __init__(self, protocol, streams):
+        self.protocol = protocol
+        self.streams = streams
+        self.sent_bytes = 0
+        self.received_bytes = 0
+        self.datagrams_sent = 0
+        self.datagrams_received = 0
+        self.elapsed = 0.0
+        self.intervals = []  # (start, end, bytes sent) per reporting interval
+
+    @property
+    def sent_mbps(self):
+        return self.sent_bytes * 8 / self.elapsed / 1_000_000 if self.elapsed > 0 else 0.0
+
+    @property
+    def received_mbps(self):
+        return self.received_bytes * 8 / self.elapsed / 1_000_000 if self.elapsed > 0 else 0.0
+
+    @property
+    def loss_percentage(self):
+        if not self.datagrams_sent:
+            return 0.0
+        return max(0, self.datagrams_sent - self.datagrams_received) / self.datagrams_sent * 100
+
+    def interval_lines(self):
+        return [f"{start:6.2f}-{end:6.2f} sec: {sent * 8 / (end - start) / 1_000_000:.2f} Mbps"
+                for start, end, sent in self.intervals if end > start]
+
+
+class BandwidthServer:
+    # Counts what the client sends over N TCP connections, or UDP datagrams tagged
+    # with the session token from a TCP control connection, and reports it back
+    def __init__(self, host="0.0.0.0", port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self._tcp = None
+        self._udp = None
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self._threads = []
+
+    def start(self):
+        self._tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._tcp.bind((self.host, self.port))
+        self.port = self._tcp.getsockname()[1]
+        self._tcp.listen(128)
+        self._tcp.settimeout(0.5)
+
+        self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        self._udp.bind((self.host, self.port))
+        self._udp.settimeout(0.5)
+
+        self._running = True
+        self._threads = [threading.Thread(target=self._accept_loop, daemon=True),
+                         threading.Thread(target=self._udp_loop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join()
+        self._tcp.close()
+        self._udp.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(1)
+        finally:
+            self.stop()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._tcp.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            try:
+                magic, version, kind, _, token = _HEADER.unpack(_recv_exactly(conn, _HEADER.size))
+                if magic != _MAGIC or version != _VERSION:
+                    return
+                if kind == _KIND_TCP_DATA:
+                    conn.sendall(_TCP_REPORT.pack(self._drain(conn)))
+                elif kind == _KIND_UDP_CONTROL:
+                    with self._lock:
+                        self._sessions[token] = [0, 0]
+                    _recv_exactly(conn, len(_END))
+                    time.sleep(_UDP_DRAIN_TIME)  # Let datagrams still queued in the socket be counted
+                    with self._lock:
+                        received_bytes, datagrams = self._sessions.pop(token)
+                    conn.sendall(_UDP_REPORT.pack(received_bytes, datagrams))
+            except (ConnectionError, OSError):
+                return
+
+    def _drain(self, conn):
+        # recv_into a reused buffer: nothing is allocated per read
+        buffer = bytearray(RECEIVE_BUFFER_SIZE)
+        view = memoryview(buffer)
+        total = 0
+        while True:
+            received = conn.recv_into(view)
+            if not received:
+                return total
+            total += received
+
+    def _udp_loop(self):
+        buffer = bytearray(65536)
+        while self._running:
+            try:
+                received = self._udp.recv_into(buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if received < _UDP_PREFIX.size:
+                continue
+            token = _UDP_PREFIX.unpack_from(buffer)[0]
+            session = self._sessions.get(token)
+            if session is not None:
+                session[0] += received
+                session[1] += 1
+
+
+class BandwidthClient:
+    def __init__(self, server, port=DEFAULT_PORT, streams=1, protocol="tcp", block_size=None, interval=1.0):
+        if protocol not in ("tcp", "udp"):
+            raise ValueError(f"Unknown bandwidth protocol: {protocol}")
+        self.server = server
+        self.port = port
+        self.streams = streams
+        self.protocol = protocol
+        self.block_size = block_size or (TCP_BLOCK_SIZE if protocol == "tcp" else UDP_DATAGRAM_SIZE)
+        self.interval = interval
+
+    def run(self, duration, on_interval=None, stop_event=None):
+        # on_interval(start, end, bytes sent) after every reporting interval; stop_event ends the run early
+        result = BandwidthResult(self.protocol, self.streams)
+        token = random.getrandbits(64)
+        stop = threading.Event()
+        sent = [0] * self.streams  # Each stream thread only writes its own slot
+        datagrams = [0] * self.streams
+        received = [0] * self.streams
+        errors = []
+
+        control = None
+        if self.protocol == "udp":
+            control = socket.create_connection((self.server, self.port), timeout=10)
+            control.sendall(_HEADER.pack(_MAGIC, _VERSION, _KIND_UDP_CONTROL, self.streams, token))
+            target = self._udp_stream
+        else:
+            target = self._tcp_stream
+
+        threads = [threading.Thread(target=target, args=(i, token, stop, sent, datagrams, received, errors),
+                                    daemon=True) for i in range(self.streams)]
+        start_time = time.monotonic()
+        for thread in threads:
+            thread.start()
+
+        # Per-interval report from the senders' counters
+        last_time, last_sent = start_time, 0
+        deadline = start_time + duration
+        stopped = lambda: stop.is_set() or (stop_event is not None and stop_event.is_set())
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            # A failing stream sets `stop`, so a refused connection ends the run at once
+            report_time = now + min(self.interval, deadline - now)
+            while not stopped() and now < report_time:
+                stop.wait(min(_STOP_POLL, report_time - now))
+                now = time.monotonic()
+            if stopped():
+                break
+            total = sum(sent)
+            interval = (last_time - start_time, now - start_time, total - last_sent)
+            result.intervals.append(interval)
+            if on_interval is not None:
+                on_interval(*interval)
+            last_time, last_sent = now, total
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+        result.elapsed = time.monotonic() - start_time
+        if errors:
+            if control is not None:
+                control.close()
+            raise errors[0]
+
+        result.sent_bytes = sum(sent)
+        result.datagrams_sent = sum(datagrams)
+        if control is not None:
+            with control:
+                control.sendall(_END)
+                result.received_bytes, result.datagrams_received = _UDP_REPORT.unpack(
+                    _recv_exactly(control, _UDP_REPORT.size))
+        else:
+            result.received_bytes = sum(received)
+        return result
+
+    def _tcp_stream(self, index, token, stop, sent, datagrams, received, errors):
+        try:
+            with socket.create_connection((self.server, self.port), timeout=10) as sock:
+                sock.sendall(_HEADER.pack(_MAGIC, _VERSION, _KIND_TCP_DATA, self.streams, token))
+                # One buffer for the whole run; send() of a memoryview does not copy it
+                view = memoryview(bytearray(self.block_size))
+                while not stop.is_set():
+                    sent[index] += sock.send(view)
+                sock.shutdown(socket.SHUT_WR)
+                received[index] = _TCP_REPORT.unpack(_recv_exactly(sock, _TCP_REPORT.size))[0]
+        except OSError as e:
+            errors.append(e)
+            stop.set()
+
+    def _udp_stream(self, index, token, stop, sent, datagrams, received, errors):
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.connect((self.server, self.port))
+                buffer = bytearray(self.block_size)
+                view = memoryview(buffer)
+                sequence = 0
+                while not stop.is_set():
+                    _UDP_PREFIX.pack_into(buffer, 0, token, sequence)
+                    try:
+                        sent[index] += sock.send(view)
+                    except (BlockingIOError, ConnectionRefusedError):
+                        continue
+                    sequence += 1
+                datagrams[index] = sequence
+        except OSError as e:
+            errors.append(e)
+            stop.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bandwidth test server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    print(f"Bandwidth server listening on {args.host}:{args.port}")
+    BandwidthServer(args.host, args.port).serve_forever()
@@ -1,27 +1,29 @@
-import iperf3
-
-from N_T_G import IPERF3_AVAILABLE
+from Bandwidth_Engine import DEFAULT_PORT, BandwidthClient, BandwidthServer
 
 def measure_bandwidth():
-    if not IPERF3_AVAILABLE:
-        return "iperf3 is not installed or not available"
-
-    server = input("Enter the server IP for bandwidth test: ")
-    port = int(input("Enter the port for bandwidth test: "))
+    server = input("Enter the server IP for bandwidth test (blank for a local loopback server): ").strip()
+    port = int(input(f"Enter the port for bandwidth test [{DEFAULT_PORT}]: ") or DEFAULT_PORT)
     duration = int(input("Enter the duration for bandwidth test (seconds): "))
+    streams = int(input("Enter the number of parallel streams [1]: ") or 1)
+    protocol = (input("Enter the protocol, tcp or udp [tcp]: ").strip().lower() or "tcp")
+
+    try:
+        if server:
+            result = BandwidthClient(server, port, streams, protocol).run(duration, print_interval)
+        else:
+            with BandwidthServer("127.0.0.1", 0) as local_server:
+                result = BandwidthClient("127.0.0.1", local_server.port, streams, protocol).run(duration, print_interval)
+    except OSError as e:
+        return f"Bandwidth server not reachable: {e}"
 
-    client = iperf3.Client()
-    client.duration = duration
-    client.server_hostname = server
-    client.port = port
+    sent = f"Sent: {result.sent_mbps:.2f} Mbps"
+    received = f"Received: {result.received_mbps:.2f} Mbps"
+    if protocol == "udp":
+        received += f" ({result.loss_percentage:.2f}% datagram loss)"
+    return sent, received
 
-    result = client.run()
-    if result.error:
-        return result.error
-    else:
-        sent = f"Sent: {result.sent_Mbps:.2f} Mbps"
-        received = f"Received: {result.received_Mbps:.2f} Mbps"
-        return sent, received
+def print_interval(start, end, sent_bytes):
+    print(f"{start:6.2f}-{end:6.2f} sec: {sent_bytes * 8 / (end - start) / 1_000_000:.2f} Mbps")
 
 bandwidth_results = measure_bandwidth()
 if isinstance(bandwidth_results, tuple):
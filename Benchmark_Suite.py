@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+
+from Convergence import RunningStats
+from Histogram import Histogram
+from Packet_Template import PacketTemplate, build_icmp_echo
+from Probe_Engine import ICMP_ECHO_REPLY, PROBE_TAG_SPACE, ProbeEngine, ProbeResult, _Probe, _ProbeCounters
+from Send_Engine import LoopbackTransport, MemoryTransport, SendEngine
+
+# Micro-benchmarks of the generator's hot paths. They need neither root nor a
+# network: sends go to an in-memory transport or a UDP sink on loopback, and
+# replies are synthesized. Every result is a rate, so higher is better.
+DEFAULT_SECONDS = 0.5
+DEFAULT_RUNS = 5
+DEFAULT_TOLERANCE = 15.0  # Percent a rate may drop below its baseline before it counts as a regression
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+FRAME_LENGTH = 1000
+TARGET = "127.0.0.1"
+
+BENCHMARKS = {}  # name -> (function(seconds) returning a rate, unit)
+
+
+def benchmark(name, unit):
+    def register(function):
+        BENCHMARKS[name] = (function, unit)
+        return function
+    return register
+
+
+class BenchmarkSkipped(Exception):
+    pass
+
+
+def _rate(operation, seconds, chunk=1000):
+    # Calls operation() in chunks until `seconds` have passed; returns calls per second
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for _ in range(chunk):
+            operation()
+        calls += chunk
+        now = time.perf_counter()
+        if now >= deadline:
+            return calls / (now - start)
+
+
+def _tester():
+    try:
+        import scapy.all  # noqa: F401  Imported here so its load time is not benchmarked
+    except ImportError:
+        raise BenchmarkSkipped("scapy is not installed")
+    from N_T_G import NetworkTester
+
+    return NetworkTester(TARGET, 1, ["TCP"], FRAME_LENGTH, lambda *args: None)
+
+
+@benchmark("create_packet", "packets/s")
+def bench_create_packet(seconds):
+    # Full scapy build and serialization, as on a template cache miss
+    tester = _tester()
+
+    def build():
+        tester.templates.clear()
+        tester.create_packet("TCP")
+    return _rate(build, seconds, chunk=50)
+
+
+@benchmark("create_rtp_packet", "packets/s")
+def bench_create_rtp_packet(seconds):
+    tester = _tester()
+    tester.create_rtp_packet()
+    return _rate(tester.create_rtp_packet, seconds, chunk=50)
+
+
+@benchmark("template_next_frame", "frames/s")
+def bench_template_next_frame(seconds):
+    template = PacketTemplate(build_icmp_echo(TARGET, payload=bytes(FRAME_LENGTH - 28)))
+    buffer = template.new_buffer()
+    return _rate(lambda: template.next_frame(buffer), seconds)
+
+
+def _send_rate(transport, seconds):
+    template = PacketTemplate(build_icmp_echo(TARGET, payload=bytes(FRAME_LENGTH - 28)))
+    with SendEngine(TARGET, transport=transport) as engine:
+        return engine.run(template, seconds).pps
+
+
+@benchmark("send_loop_memory", "packets/s")
+def bench_send_loop_memory(seconds):
+    # The send loop alone: batching, per-frame patching and accounting
+    return _send_rate(MemoryTransport(), seconds)
+
+
+@benchmark("send_loop_loopback", "packets/s")
+def bench_send_loop_loopback(seconds):
+    # The send loop with real sendmmsg() calls into a UDP sink on loopback
+    transport = LoopbackTransport()
+    try:
+        return _send_rate(transport, seconds)
+    finally:
+        transport.close()
+
+
+@benchmark("probe_matching", "replies/s")
+def bench_probe_matching(seconds):
+    # Reply parsing and matching against outstanding probes, as in the receiver thread
+    engine = ProbeEngine(TARGET, kernel_timestamps=False)
+    engine._slots = threading.Semaphore(0)
+    engine._counters = {"ICMP": _ProbeCounters("ICMP")}
+    result = ProbeResult("ICMP", PROBE_TAG_SPACE)
+    replies = []
+    for key in range(PROBE_TAG_SPACE):
+        reply = bytearray(build_icmp_echo("0.0.0.0", engine.icmp_id, key, bytes(32), source=TARGET))
+        reply[20] = ICMP_ECHO_REPLY
+        replies.append(bytes(reply))
+    outstanding = engine._outstanding
+    position = 0
+
+    def match():
+        nonlocal position
+        key = position % PROBE_TAG_SPACE
+        position += 1
+        outstanding[key] = _Probe(result, key, None, 0)
+        tag, reply_port = engine._parse_reply(replies[key])
+        engine._complete(tag, reply_port, 25_000 + key, None)
+    try:
+        return _rate(match, seconds)
+    finally:
+        engine.close()
+
+
+@benchmark("probe_result_record", "samples/s")
+def bench_probe_result_record(seconds):
+    result = ProbeResult("ICMP", 0)
+    rtts = [20_000 + (i * 7919) % 500_000 for i in range(4096)]
+    position = 0
+
+    def record():
+        nonlocal position
+        result.record(0, rtts[position & 4095])
+        position += 1
+    return _rate(record, seconds)
+
+
+@benchmark("histogram_merge_percentiles", "merges/s")
+def bench_histogram_merge(seconds):
+    # Combining per-worker histograms into a report
+    parts = []
+    for worker in range(8):
+        histogram = Histogram()
+        for i in range(10_000):
+            histogram.record(10_000 + (i * 7919 + worker * 104_729) % 2_000_000)
+        parts.append(histogram)
+
+    def aggregate():
+        total = Histogram()
+        for part in parts:
+            total.merge(part)
+        total.percentiles()
+    return _rate(aggregate, seconds, chunk=10)
+
+
+@benchmark("running_stats_add", "samples/s")
+def bench_running_stats(seconds):
+    stats = RunningStats()
+    return _rate(lambda: stats.add(942.5), seconds)
+
+
+def run_benchmarks(names, seconds=DEFAULT_SECONDS, runs=DEFAULT_RUNS):
+    # {name: best rate of `runs`}, or the reason a benchmark was skipped
+    results = {}
+    for name in names:
+        function, _ = BENCHMARKS[name]
+        try:
+            results[name] = max(function(seconds) for _ in range(runs))
+        except BenchmarkSkipped as error:
+            results[name] = str(error)
+    return results
+
+
+def load_baseline(path):
+    try:
+        with open(path) as file:
+            return json.load(file)["results"]
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    # Skipped benchmarks keep their previous baseline
+    saved = load_baseline(path)
+    saved.update({name: {"value": rate, "unit": BENCHMARKS[name][1]}
+                  for name, rate in results.items() if not isinstance(rate, str)})
+    document = {"python": platform.python_version(), "machine": platform.machine(),
+                "host": socket.gethostname(), "saved": time.strftime("%Y-%m-%d %H:%M:%S"), "results": saved}
+    with open(path, "w") as file:
+        json.dump(document, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # [(name, rate or skip reason, change in percent or None, regressed)]
+    rows = []
+    for name, rate in results.items():
+        reference = baseline.get(name)
+        if isinstance(rate, str) or not reference:
+            rows.append((name, rate, None, False))
+            continue
+        change = (rate / reference["value"] - 1) * 100
+        rows.append((name, rate, change, change < -tolerance))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the generator's hot paths without root or a network")
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK",
+                        help=f"Benchmarks to run (default all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS, help="Length of one run")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="Runs per benchmark; the best one counts")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results file (JSON)")
+    parser.add_argument("--save", action="store_true", help="Record these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Fail if a rate drops more than this many percent below its baseline")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark: {', '.join(unknown)}")
+
+    results = run_benchmarks(args.benchmarks or list(BENCHMARKS), args.seconds, args.runs)
+    baseline = load_baseline(args.baseline)
+    rows = compare(results, baseline, args.tolerance)
+    regressions = [name for name, _, _, regressed in rows if regressed]
+    for name, rate, change, regressed in rows:
+        if isinstance(rate, str):
+            print(f"{name:<28} skipped: {rate}")
+            continue
+        line = f"{name:<28} {rate:>14,.0f} {BENCHMARKS[name][1]}"
+        if change is not None:
+            line += f"  ({change:+.1f}% vs baseline)"
+        print(line + ("  REGRESSION" if regressed else ""))
+
+    if args.save:
+        save_baseline(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+    elif not baseline:
+        print(f"No baseline in {args.baseline}; run with --save to record one")
+    if regressions:
+        print(f"FAIL: {', '.join(regressions)} slower than the baseline by more than {args.tolerance:g}%")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import math
+import time
+from functools import lru_cache
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_SAMPLES = 10
+
+
+class RunningStats:
+    # Welford's online mean and variance: numerically stable, O(1) per sample
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    def half_width(self, confidence=DEFAULT_CONFIDENCE):
+        # Half-width of the confidence interval of the mean, Student's t
+        if self.count < 2:
+            return math.inf
+        return _t_quantile(confidence, self.count - 1) * self.stddev / math.sqrt(self.count)
+
+
+@lru_cache(maxsize=None)
+def _z_quantile(confidence):
+    from statistics import NormalDist  # Imported on use: statistics pulls in decimal and fractions
+
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def _t_central(t, df):
+    # P(|T| <= t) for Student's t with integer df, in closed form (Abramowitz & Stegun 26.7.3-4)
+    theta = math.atan(t / math.sqrt(df))
+    cos2 = math.cos(theta) ** 2
+    if df % 2:
+        total = term = 1.0
+        for k in range(3, df, 2):
+            term *= (k - 1) / k * cos2
+            total += term
+        return 2 / math.pi * (theta + (math.sin(theta) * math.cos(theta) * total if df > 1 else 0.0))
+    total = term = 1.0
+    for k in range(2, df, 2):
+        term *= (k - 1) / k * cos2
+        total += term
+    return math.sin(theta) * total
+
+
+@lru_cache(maxsize=None)
+def _t_quantile(confidence, df):
+    # Two-sided Student's t critical value, no scipy needed. Up to 30 degrees of
+    # freedom it is exact, by bisecting the closed-form distribution; the normal
+    # quantile's Cornish-Fisher expansion is far off there (7.2 for 12.7 at df=1,
+    # 95%) but within 0.1% beyond.
+    if df > 30:
+        z = _z_quantile(confidence)
+        return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+    low, high = 0.0, 1.0
+    while _t_central(high, df) < confidence:
+        low, high = high, high * 2
+    for _ in range(60):
+        middle = (low + high) / 2
+        if _t_central(middle, df) < confidence:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+class ConvergenceTarget:
+    # A measurement has converged once the confidence interval of its mean is within
+    # ±absolute (in the samples' unit) or ±relative (a fraction of the mean), after at
+    # least min_samples samples. The test's fixed length stays the upper bound.
+    def __init__(self, relative=None, absolute=None, confidence=DEFAULT_CONFIDENCE, min_samples=DEFAULT_MIN_SAMPLES):
+        if relative is None and absolute is None:
+            raise ValueError("A convergence target needs a relative or an absolute width")
+        self.relative = relative
+        self.absolute = absolute
+        self.confidence = confidence
+        self.min_samples = max(2, min_samples)
+
+    def allowed_width(self, stats):
+        widths = []
+        if self.relative is not None:
+            widths.append(self.relative * abs(stats.mean))
+        if self.absolute is not None:
+            widths.append(self.absolute)
+        return max(widths)
+
+    def converged(self, stats):
+        return stats.count >= self.min_samples and stats.half_width(self.confidence) <= self.allowed_width(stats)
+
+
+class ConvergenceMonitor:
+    # Running statistics per label, stopping a run once every label has converged.
+    # It stands in for the threading.Event the engines take as stop_event: is_set()
+    # is true once all labels converged or the parent event is set.
+    def __init__(self, target, labels, stop_event=None):
+        self.target = target
+        self.stats = {label: RunningStats() for label in labels}
+        self.stop_event = stop_event
+        self._converged = set()
+
+    def add(self, label, value):
+        stats = self.stats[label]
+        stats.add(value)
+        if label not in self._converged and self.target.converged(stats):
+            self._converged.add(label)
+
+    def converged(self, label=None):
+        if label is None:
+            return len(self._converged) == len(self.stats)
+        return label in self._converged
+
+    def is_set(self):
+        return self.converged() or (self.stop_event is not None and self.stop_event.is_set())
+
+    def wait(self, timeout=None):
+        if self.is_set():
+            return True
+        if self.stop_event is not None:
+            self.stop_event.wait(timeout)
+        elif timeout is not None:
+            time.sleep(timeout)
+        return self.is_set()
+
+    def summary(self, label):
+        stats = self.stats[label]
+        half_width = stats.half_width(self.target.confidence)
+        return {
+            "samples": stats.count,
+            "mean": stats.mean,
+            "half_width": half_width if math.isfinite(half_width) else None,
+            "confidence": self.target.confidence,
+            "converged": label in self._converged,
+        }
@@ -0,0 +1,101 @@
+from array import array
+
+# Log-linear buckets in the style of HdrHistogram: values below 2**SUB_BUCKET_BITS
+# get exact buckets, above that every power of two is split into
+# 2**(SUB_BUCKET_BITS - 1) buckets, so any recorded value is kept to within
+# 1 / 2**(SUB_BUCKET_BITS - 1) (under 1%) of its true value.
+SUB_BUCKET_BITS = 8
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+_HALF_SUB_BUCKETS = _SUB_BUCKETS >> 1
+
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def _bucket_index(value):
+    if value < _SUB_BUCKETS:
+        return value
+    exponent = value.bit_length() - SUB_BUCKET_BITS
+    return _SUB_BUCKETS + (exponent - 1) * _HALF_SUB_BUCKETS + (value >> exponent) - _HALF_SUB_BUCKETS
+
+
+def _bucket_value(index):
+    # Midpoint of the values that map to the bucket
+    if index < _SUB_BUCKETS:
+        return index
+    exponent = (index - _SUB_BUCKETS) // _HALF_SUB_BUCKETS + 1
+    mantissa = (index - _SUB_BUCKETS) % _HALF_SUB_BUCKETS + _HALF_SUB_BUCKETS
+    return (mantissa << exponent) + ((1 << exponent) >> 1)
+
+
+class Histogram:
+    # Streaming histogram of non-negative integers (we record nanoseconds).
+    # Recording is O(1) and memory grows only with the log of the largest value.
+    def __init__(self):
+        self.counts = array("Q")
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value, count=1):
+        value = int(value)
+        if value < 0:
+            raise ValueError("Histogram values must be non-negative")
+        index = _bucket_index(value)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        if percent >= 100:
+            return self.max
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(max(_bucket_value(index), self.min), self.max)
+        return self.max
+
+    def percentiles(self, percents=DEFAULT_PERCENTILES):
+        return {percent: self.percentile(percent) for percent in percents}
+
+
+class JitterEstimator:
+    # Interarrival jitter from RFC 3550 section 6.4.1: J += (|D| - J) / 16, where D
+    # is the change in transit time between consecutive packets in arrival order
+    def __init__(self):
+        self.jitter = 0.0
+        self._last_transit = None
+
+    def update(self, transit):
+        if self._last_transit is not None:
+            self.jitter += (abs(transit - self._last_transit) - self.jitter) / 16
+        self._last_transit = transit
+        return self.jitter
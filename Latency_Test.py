@@ -1,23 +1,29 @@
-from scapy.all import IP, ICMP, sr1
-import time
+from scapy.all import IP, ICMP
+
+from Packet_Template import PacketTemplate
+from Probe_Engine import ProbeEngine
 
 def measure_latency():
     network_ip = input("Enter the IP address for latency test: ")
     packet_count = int(input("Enter the number of packets for latency test: "))
+    calibrate = input("Calibrate the tool's own overhead on loopback first? (y/n): ").strip().lower() == "y"
     latencies = []
 
-    for _ in range(packet_count):
-        packet = IP(dst=network_ip) / ICMP()
-        start_time = time.time()
-        response = sr1(packet, timeout=1, verbose=False)
-        end_time = time.time()
+    template = PacketTemplate(IP(dst=network_ip) / ICMP())
+    engine = ProbeEngine(network_ip, timeout=1)
+    if calibrate:
+        print(f"Tool overhead: {engine.calibrate() / 1000:.1f} microseconds")
+    probe_result = engine.run({"ICMP": template}, packet_count, keep_samples=True)["ICMP"]
 
-        if response:
-            latency = end_time - start_time
+    for latency in probe_result.rtts:
+        if latency is not None:
             latencies.append(f"Latency: {latency:.6f} seconds")
         else:
             latencies.append("Latency: No response")
 
+    if probe_result.received:
+        percentiles = " / ".join(f"{probe_result.percentile(percent):.6f}" for percent in (50, 90, 99, 99.9))
+        latencies.append(f"Latency p50/p90/p99/p99.9: {percentiles} seconds")
     return latencies
 
 latency_results = measure_latency()
@@ -1,24 +1,34 @@
-from scapy.all import IP, TCP, Raw, send
-import time
+from scapy.all import IP, TCP, Raw
+
+from Pacer import UNIT_MBPS, ConstantRate
+from Packet_Template import PacketTemplate
+from Send_Engine import SendEngine
+from Traffic_Pool import TrafficPool, split_by_flow
 
 def perform_load_test():
     network_ip = input("Enter the IP address for load test: ")
     frame_length = int(input("Enter the frame length for load test: "))
     duration = int(input("Enter the duration for load test (seconds): "))
+    workers = int(input("Enter the number of sender processes (1 to send in-process): ") or 1)
+    target_mbps = input("Enter the target rate in Mbps (blank to send as fast as possible): ")
+    profile = ConstantRate(float(target_mbps), UNIT_MBPS) if target_mbps.strip() else None
     payload = 'X' * (frame_length - 20 - 20)
     packet = IP(dst=network_ip) / TCP(dport=80) / Raw(load=payload)
-    start_time = time.time()
-    packet_count = 0
 
-    while time.time() - start_time < duration:
-        send(packet, verbose=False)
-        packet_count += 1
+    if workers > 1:
+        assignments = split_by_flow("TCP", PacketTemplate(packet), workers)
+        stats = TrafficPool(network_ip, workers).run(assignments, duration, profile)["TCP"]
+    else:
+        with SendEngine(network_ip) as engine:
+            stats = engine.run(packet, duration, profile)
 
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    load_throughput = (frame_length * packet_count * 8) / elapsed_time  # bits per second
-    load_throughput_mbps = load_throughput / 1_000_000  # Mbps
-    return f"Load Test Throughput: {load_throughput_mbps:.2f} Mbps"
+    results = (f"Load Test Throughput: {stats.mbps:.2f} Mbps",
+               f"Packets: {stats.packets} ({stats.pps:.0f} pps) in {stats.syscalls} syscalls")
+    if stats.target_pps:
+        results += (f"Rate deviation: {stats.rate_deviation:+.2f}% from target {stats.target_pps:.0f} pps",)
+    return results
 
-load_test_result = perform_load_test()
-print(load_test_result)
+if __name__ == "__main__":
+    load_test_results = perform_load_test()
+    for result in load_test_results:
+        print(result)
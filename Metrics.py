@@ -0,0 +1,208 @@
+import threading
+import time
+
+# Counters and timers for the tool's own hot paths, so a slow result can be told
+# apart from a slow tool. Engines look their metrics up once and keep the handle;
+# updating one is a lock and an add. Metrics of traffic pool worker processes are
+# not seen here, only the totals the pool reports back.
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_METRICS_PORT = 9464
+COUNTER = "counter"
+TIMER = "summary"  # Exposed as a Prometheus summary without quantiles: _count and _sum
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def add(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Timer:
+    # Count and total seconds of what it timed; every observation also goes to the registry's hooks
+    __slots__ = ("name", "labels", "count", "total", "max", "_hooks", "_lock")
+
+    def __init__(self, name, labels, hooks):
+        self.name = name
+        self.labels = labels
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._hooks = hooks
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+        for hook in self._hooks:
+            hook(self.name, self.labels, seconds)
+
+    def time(self):
+        return _Timing(self)
+
+
+class _Timing:
+    __slots__ = ("timer", "start")
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.observe(time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}  # (name, sorted label items) -> Counter or Timer
+        self._families = {}  # name -> (kind, help)
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help="", **labels):
+        return self._get(name, COUNTER, help, labels, Counter)
+
+    def timer(self, name, help="", **labels):
+        return self._get(name, TIMER, help, labels, lambda: Timer(name, labels, self._hooks))
+
+    def _get(self, name, kind, help, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                family = self._families.setdefault(name, (kind, help))
+                if family[0] != kind:
+                    raise ValueError(f"Metric {name} is a {family[0]}, not a {kind}")
+                metric = self._metrics.setdefault(key, factory())
+        return metric
+
+    def add_hook(self, hook):
+        # hook(name, labels, seconds) is called for every timer observation, from the
+        # thread that made it; it must return quickly. The hook list is replaced rather
+        # than changed, so timers iterating it never see it change under them.
+        with self._lock:
+            self._set_hooks(self._hooks + [hook])
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self._set_hooks([known for known in self._hooks if known is not hook])
+
+    def _set_hooks(self, hooks):
+        self._hooks = hooks
+        for metric in self._metrics.values():
+            if isinstance(metric, Timer):
+                metric._hooks = hooks
+
+    def snapshot(self):
+        # [{"name", "labels", "value"}] for counters, with "count", "sum" and "max" in seconds for timers
+        with self._lock:
+            metrics = list(self._metrics.items())
+        snapshot = []
+        for (name, labels), metric in metrics:
+            entry = {"name": name, "labels": dict(labels)}
+            if isinstance(metric, Timer):
+                entry.update(count=metric.count, sum=metric.total, max=metric.max)
+            else:
+                entry["value"] = metric.value
+            snapshot.append(entry)
+        return snapshot
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4
+        with self._lock:
+            metrics = sorted(self._metrics.items(), key=lambda item: item[0])
+            families = dict(self._families)
+        lines = []
+        current = None
+        for (name, labels), metric in metrics:
+            if name != current:
+                kind, help = families[name]
+                if help:
+                    lines.append(f"# HELP {name} {_escape(help, quote=False)}")
+                lines.append(f"# TYPE {name} {kind}")
+                current = name
+            label_text = _labels(labels)
+            if isinstance(metric, Timer):
+                lines.append(f"{name}_count{label_text} {metric.count}")
+                lines.append(f"{name}_sum{label_text} {metric.total!r}")
+            else:
+                lines.append(f"{name}{label_text} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        # Zeroes every metric; handles held by the engines stay valid
+        with self._lock:
+            for metric in self._metrics.values():
+                with metric._lock:
+                    if isinstance(metric, Timer):
+                        metric.count = 0
+                        metric.total = metric.max = 0.0
+                    else:
+                        metric.value = 0
+
+
+def _escape(value, quote=True):
+    value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quote else value
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    # Serves REGISTRY.render() at /metrics from a daemon thread
+    def __init__(self, registry=REGISTRY, host=DEFAULT_METRICS_HOST, port=DEFAULT_METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def start(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Imported on use: http.server loads email
+
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
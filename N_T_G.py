@@ -1,24 +1,32 @@
 import warnings
 warnings.filterwarnings("ignore", message="Wireshark is installed, but cannot read manuf")
 
-import tkinter as tk
-from tkinter import ttk
-from scapy.all import IP, ICMP, sr1, send, UDP, TCP, Raw
-import speedtest
-import ping3
+# tkinter, scapy, speedtest and ping3 are slow to import (and tkinter needs a
+# display), as are the asyncio-based engines, so they are imported by the tests
+# and the GUI that use them. Startup_Benchmark.py keeps an eye on this.
 import time
 import threading
-import statistics
-import subprocess
 import random
 import struct
-
-# Attempt to import iperf3, handle if not available
-try:
-    import iperf3
-    IPERF3_AVAILABLE = True
-except ImportError:
-    IPERF3_AVAILABLE = False
+from collections import deque
+from contextlib import contextmanager
+
+from Bandwidth_Engine import DEFAULT_PORT, BandwidthClient, BandwidthServer
+from Convergence import ConvergenceMonitor
+from Metrics import REGISTRY
+from Packet_Template import PacketTemplate, TemplateCache
+from Pcap_Replay import PcapReplay
+from Path_Trace import DEFAULT_MAX_HOPS, DEFAULT_TRACE_ROUNDS, PathTrace, format_path
+from Ping_Sweep import DEFAULT_SWEEP_COUNT, PingSweep, expand_targets
+from Port_Scanner import SynScanner
+from Probe_Engine import ProbeEngine
+from RFC2544_Engine import format_rfc2544, packet_length
+from Results_Store import ResultRecord, flatten_metrics
+from Send_Engine import SendEngine
+from Soak import DEFAULT_SOAK_INTERVAL, DEFAULT_WINDOWS, SoakTest
+from Test_Scheduler import RESOURCE_EXCLUSIVE, RESOURCE_SHARED, TestScheduler
+from Traffic_Mix import ETHERNET_OVERHEAD, MixStats
+from Traffic_Pool import POOL_BY_FLOW, POOL_BY_TRAFFIC_TYPE, TrafficPool, split_by_flow, split_by_traffic_type
 
 # Map traffic types to their corresponding port numbers
 TRAFFIC_TYPE_PORT_MAP = {
@@ -35,20 +43,236 @@ TRAFFIC_TYPE_PORT_MAP = {
     "RTP": 5004,  # Standard RTP port
 }
 
+# Traffic types sent as TCP; NTP and RTP are UDP and the rest ICMP placeholders,
+# both with an 8 byte header
+TCP_TRAFFIC_TYPES = ("TCP", "FTP", "HTTP", "SMTP", "POP3", "SSH", "Telnet")
+
+# Reflector stream ids per traffic type: one per sender flow
+STREAMS_PER_TYPE = 256
+REFLECTOR_SETTLE_TIME = 0.25
+
+SAMPLE_INTERVAL = 0.1  # Live rate samples are published at most this often per traffic type
+
+TEST_NAMES = ["Speed Test", "Latency Test", "Ping Test", "Ping Sweep", "QoS Metrics", "Port Scan", "Throughput Test",
+              "Bandwidth Test", "Load Test", "Application Load Test", "Capture Replay", "RFC 2544", "Path Trace"]
+RFC2544_PROBE_INTERVAL = 0.01  # RTT probes through the device while the RFC 2544 latency stream runs
+
+def _traffic_counters(traffic_type):
+    return (REGISTRY.counter("ntg_sent_packets_total", "Packets sent, per traffic type", traffic_type=traffic_type),
+            REGISTRY.counter("ntg_sent_bytes_total", "IP bytes sent, per traffic type", traffic_type=traffic_type))
+
+
+class _RateSampler:
+    # Turns running packet/byte totals into pps and Mbps samples, one per SAMPLE_INTERVAL;
+    # a ConvergenceMonitor gets every Mbps sample too. The totals also go to the
+    # label's sent packet and byte counters, unless counted is false.
+    def __init__(self, label, publish, monitor=None, counted=True):
+        self.label = label
+        self.publish = publish
+        self.monitor = monitor
+        self.packets = 0
+        self.bytes_sent = 0
+        self._counters = _traffic_counters(label) if counted else None
+        self._last = (time.monotonic(), 0, 0)
+
+    def add(self, packets, bytes_sent):
+        self.update(self.packets + packets, self.bytes_sent + bytes_sent)
+
+    def update(self, packets, bytes_sent):
+        if self._counters is not None:
+            self._counters[0].add(packets - self.packets)
+            self._counters[1].add(bytes_sent - self.bytes_sent)
+        self.packets = packets
+        self.bytes_sent = bytes_sent
+        now = time.monotonic()
+        last_time, last_packets, last_bytes = self._last
+        if now - last_time >= SAMPLE_INTERVAL:
+            elapsed = now - last_time
+            mbps = (bytes_sent - last_bytes) * 8 / elapsed / 1_000_000
+            self.publish("pps", self.label, (packets - last_packets) / elapsed)
+            self.publish("mbps", self.label, mbps)
+            if self.monitor is not None:
+                self.monitor.add(self.label, mbps)
+            self._last = (now, packets, bytes_sent)
+
+
 class NetworkTester:
-    def __init__(self, network_ip, packet_count, traffic_types, frame_length, update_progress):
+    def __init__(self, network_ip, packet_count, traffic_types, frame_length, update_progress,
+                 workers=1, pool_split=POOL_BY_FLOW, rate_profile=None, calibrate=False, reflector_port=None,
+                 persistent=False, throughput_target=None, rtt_target=None, sweep_targets=None,
+                 replay_capture=None, replay_speed=1.0, replay_rewrite=True, traffic_mix=None, rfc2544=None,
+                 trace_hops=DEFAULT_MAX_HOPS, trace_rounds=DEFAULT_TRACE_ROUNDS):
         self.network_ip = network_ip
         self.packet_count = packet_count
         self.traffic_types = traffic_types
         self.frame_length = frame_length
         self.update_progress = update_progress
-        self.total_tests = 8  # Number of tests to perform, including port scan and load test
+        self.workers = workers  # Sender processes for throughput/load traffic; 1 sends in-process
+        self.pool_split = pool_split
+        self.rate_profile = rate_profile  # Pacer.RateProfile for throughput/load traffic; None sends flat out
+        self.calibrate = calibrate  # Subtract the tool's own loopback overhead from RTTs
+        # Port of a Reflector.py daemon on the target; throughput/load traffic then becomes
+        # sequence-numbered UDP test streams whose far-end receive stats are reported too
+        self.reflector_port = reflector_port
+        self._timing_overhead_ns = None
+        # CIDR blocks and hosts for the ping sweep, as for Ping_Sweep.expand_targets; default network_ip
+        self.sweep_targets = sweep_targets
+        # pcap/pcapng file for the capture replay, its timing scale factor (None for
+        # full speed), and whether packets are readdressed to network_ip
+        self.replay_capture = replay_capture
+        self.replay_speed = replay_speed
+        self.replay_rewrite = replay_rewrite
+        # Traffic_Mix.TrafficMix: the load test then sends one interleaved stream of
+        # weighted traffic types and frame sizes instead of one run per type
+        self.traffic_mix = traffic_mix
+        # RFC2544_Engine.RFC2544Test run against the reflector at reflector_port, with
+        # test streams of the first traffic type's source port; None skips the test
+        self.rfc2544 = rfc2544
+        # Path trace: highest TTL probed and probes per hop
+        self.trace_hops = trace_hops
+        self.trace_rounds = trace_rounds
+        self.total_tests = len(TEST_NAMES)  # Number of tests to perform, including port scan and load tests
+        self.templates = TemplateCache()
+        self._rtp_stream = None
+        self._completed_tests = 0
+        self._progress_lock = threading.Lock()
+        # A persistent tester keeps its engines and their raw sockets open between
+        # runs (for a long-running agent); close() releases them
+        self.persistent = persistent
+        self._warm = {}
+        self._warm_lock = threading.Lock()
+        # stop() cancels the running tests. on_sample(kind, label, value) receives live
+        # "pps"/"mbps" samples and "rtt" samples in seconds from the test threads;
+        # it must return immediately, or it slows the senders down.
+        self.stop_event = threading.Event()
+        self.on_sample = None
+        # Adaptive test lengths (Convergence.ConvergenceTarget): throughput, load and
+        # bandwidth runs end once the Mbps estimate converges, QoS once the mean RTT
+        # (in seconds) does. The fixed duration or packet count stays the upper bound.
+        self.throughput_target = throughput_target
+        self.rtt_target = rtt_target
+        # Results_Store.ResultRecords of the tests run so far, one per test, target and
+        # traffic type; take_records() hands them over, e.g. to a ResultsWriter
+        self.records = []
+        self._records_lock = threading.Lock()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _publish_sample(self, kind, label, value):
+        on_sample = self.on_sample
+        if on_sample is not None:
+            on_sample(kind, label, value)
+
+    def _on_rtt(self, monitor=None):
+        if self.on_sample is None and monitor is None:
+            return None
+
+        def on_rtt(traffic_type, rtt_ns):
+            self._publish_sample("rtt", traffic_type, rtt_ns / 1_000_000_000)
+            if monitor is not None:
+                monitor.add(traffic_type, rtt_ns / 1_000_000_000)
+        return on_rtt
+
+    def _throughput_monitor(self, labels):
+        # Stands in for stop_event in an adaptive run; None for a fixed-length one
+        if self.throughput_target is None:
+            return None
+        return ConvergenceMonitor(self.throughput_target, labels, self.stop_event)
+
+    @contextmanager
+    def _warm_resource(self, key, factory):
+        # Hands out the cached engine for `key` when persistent, otherwise a fresh one
+        # that is closed after use. Tests running at the same time never share one.
+        with self._warm_lock:
+            resource = self._warm.pop(key, None) if self.persistent else None
+        if resource is None:
+            resource = factory()
+        try:
+            yield resource
+        finally:
+            if self.persistent:
+                with self._warm_lock:
+                    if key not in self._warm:
+                        self._warm[key] = resource
+                        resource = None
+            if resource is not None:
+                resource.close()
+
+    def close(self):
+        with self._warm_lock:
+            resources = list(self._warm.values())
+            self._warm.clear()
+        for resource in resources:
+            resource.close()
+
+    @contextmanager
+    def _probe_engine(self, **options):
+        key = ("probe",) + tuple(sorted(options.items()))
+        factory = lambda: ProbeEngine(self.network_ip, keep_open=self.persistent, **options)
+        with self._warm_resource(key, factory) as engine:
+            if self.calibrate:
+                if self._timing_overhead_ns is None:
+                    self._timing_overhead_ns = engine.calibrate()
+                engine.overhead_ns = self._timing_overhead_ns
+            yield engine
+
+    def _record(self, test, metrics, traffic_type=None, target=None, frame_length=None):
+        # metrics may nest dicts; only their numeric leaves are kept
+        metrics = flatten_metrics(metrics)
+        if not metrics:
+            return
+        record = ResultRecord(time.time(), test, target or self.network_ip, traffic_type,
+                              self.frame_length if frame_length is None else frame_length, metrics)
+        with self._records_lock:
+            self.records.append(record)
+
+    def _record_send_stats(self, test, results):
+        # Mix classes are "<type> <size>B" labels, recorded under their type and frame
+        # size; the mix's "Total" is recorded with no frame size
+        classes = {}
+        if test == "Load Test" and self.traffic_mix is not None:
+            classes = {self.traffic_mix.label(traffic_type, size): (traffic_type, size)
+                       for traffic_type, size in self.traffic_mix.classes}
+        for label, stats in results.items():
+            traffic_type, frame_length = classes.get(label, (label, 0 if classes else None))
+            self._record(test, stats.summary(), traffic_type, frame_length=frame_length)
+
+    def take_records(self):
+        with self._records_lock:
+            records, self.records = self.records, []
+        return records
+
+    def _start_step(self, message):
+        with self._progress_lock:
+            self.update_progress(message, self._completed_tests, self.total_tests)
+
+    def _finish_step(self, message):
+        # Steps can finish in any order when tests overlap, so progress counts completions
+        with self._progress_lock:
+            self._completed_tests += 1
+            self.update_progress(message, self._completed_tests, self.total_tests)
 
     def create_packet(self, traffic_type):
-        payload = 'X' * (self.frame_length - 20 - 20)  # Adjust for IP and TCP/UDP headers
-
         if traffic_type == "RTP":
             return self.create_rtp_packet()
+        return self.packet_template(traffic_type).packet
+
+    def packet_template(self, traffic_type, frame_length=None):
+        # Packets are built and serialized once per (traffic type, frame length, destination)
+        frame_length = frame_length or self.frame_length
+        return self.templates.get(traffic_type, frame_length, self.network_ip,
+                                  lambda: self._build_packet(traffic_type, frame_length))
+
+    def _build_packet(self, traffic_type, frame_length=None):
+        from scapy.all import IP, ICMP, UDP, TCP, Raw
+
+        frame_length = frame_length or self.frame_length
+        # Adjust for the IP header and the traffic type's own transport header
+        payload = 'X' * max(0, frame_length - 20 - (20 if traffic_type in TCP_TRAFFIC_TYPES else 8))
+
+        if traffic_type == "RTP":
+            return self._build_rtp_packet(frame_length)
 
         elif traffic_type == "TCP":
             return IP(dst=self.network_ip) / TCP(dport=TRAFFIC_TYPE_PORT_MAP["TCP"]) / Raw(load=payload)
@@ -75,8 +299,38 @@ class NetworkTester:
         else:
             return IP(dst=self.network_ip) / ICMP() / Raw(load=payload)
 
+    def reflector_template(self, traffic_type, stream_id, frame_length=None):
+        # UDP test stream standing in for traffic_type, sized to the frame length.
+        # Built fresh for every run: the reflector expects each stream to start at sequence 0.
+        from scapy.all import IP, UDP, Raw
+        from Reflector import test_payload
+
+        # Adjust for IP and UDP headers
+        payload = test_payload(stream_id, (frame_length or self.frame_length) - 20 - 8)
+        sport = TRAFFIC_TYPE_PORT_MAP.get(traffic_type, self.reflector_port)
+        packet = IP(dst=self.network_ip) / UDP(sport=sport, dport=self.reflector_port) / Raw(load=payload)
+        return PacketTemplate(packet, test_header_offset=20 + 8)
+
+    def _reflector_streams(self):
+        # {traffic_type: first stream id}; flows of a type number their streams up from there
+        base = random.getrandbits(24) * STREAMS_PER_TYPE
+        return {traffic_type: (base + i * STREAMS_PER_TYPE) & 0xFFFFFFFF
+                for i, traffic_type in enumerate(self.traffic_types)}
+
     def create_rtp_packet(self):
-        # Create a dummy RTP packet
+        # Each call returns the next packet of one RTP stream: sequence number
+        # and timestamp advance in a reused buffer instead of being re-randomized
+        template = self.packet_template("RTP")
+        if self._rtp_stream is None or self._rtp_stream[0] is not template:
+            self._rtp_stream = (template, template.new_buffer())
+        frame = template.next_frame(self._rtp_stream[1])
+        from scapy.all import IP
+        return IP(bytes(frame))
+
+    def _build_rtp_packet(self, frame_length=None):
+        # Create a dummy RTP packet; the initial sequence number and timestamp are random as in RFC 3550
+        from scapy.all import IP, UDP, Raw
+
         rtp_version = 2
         rtp_padding = 0
         rtp_extension = 0
@@ -86,7 +340,7 @@ class NetworkTester:
         rtp_sequence_number = random.randint(0, 65535)
         rtp_timestamp = random.randint(0, 4294967295)
         rtp_ssrc = random.randint(0, 4294967295)
-        rtp_payload = 'A' * (self.frame_length - 12)  # RTP header is 12 bytes
+        rtp_payload = 'A' * ((frame_length or self.frame_length) - 12)  # RTP header is 12 bytes
 
         rtp_header = (
             (rtp_version << 6) | (rtp_padding << 5) | (rtp_extension << 4) | rtp_csrc_count,
@@ -100,214 +354,618 @@ class NetworkTester:
         return IP(dst=self.network_ip) / UDP(dport=TRAFFIC_TYPE_PORT_MAP["RTP"]) / Raw(load=rtp_packet)
 
     def measure_speed(self):
-        self.update_progress("Running Speed Test...", 0, self.total_tests)
+        self._start_step("Running Speed Test...")
         try:
+            import speedtest
             st = speedtest.Speedtest()
             st.download()
             st.upload()
             results = st.results.dict()
+            self._record("Speed Test", {"download_mbps": results["download"] / 1_000_000,
+                                        "upload_mbps": results["upload"] / 1_000_000, "ping": results.get("ping")},
+                         frame_length=0)
             download_speed = f"Download speed: {results['download'] / 1_000_000:.2f} Mbps"
             upload_speed = f"Upload speed: {results['upload'] / 1_000_000:.2f} Mbps"
         except Exception as e:
             download_speed = "Speed Test Failed"
             upload_speed = str(e)
-        self.update_progress("Speed Test Completed", 1, self.total_tests)
+        self._finish_step("Speed Test Completed")
         return download_speed, upload_speed
 
     def measure_latency(self):
-        self.update_progress("Running Latency Test...", 1, self.total_tests)
-        latencies = []
+        # Returns {traffic_type: RTT in seconds, or None when there was no response}
+        self._start_step("Running Latency Test...")
+        templates = {traffic_type: self.packet_template(traffic_type) for traffic_type in self.traffic_types}
+        with self._probe_engine() as engine:
+            probe_results = engine.run(templates, 1, stop_event=self.stop_event, on_rtt=self._on_rtt())
+
+        latencies = {}
         for traffic_type in self.traffic_types:
-            packet = self.create_packet(traffic_type)
-            start_time = time.time()
-            response = sr1(packet, timeout=1, verbose=False)
-            end_time = time.time()
-
-            if response:
-                latency = end_time - start_time
-                latencies.append(f"{traffic_type} Latency: {latency:.6f} seconds")
-            else:
-                latencies.append(f"{traffic_type} Latency: No response")
+            probe_result = probe_results[traffic_type]
+            latencies[traffic_type] = probe_result.average_latency if probe_result.received else None
+            self._record("Latency Test", {"latency": latencies[traffic_type], "received": probe_result.received},
+                         traffic_type)
 
-        self.update_progress("Latency Test Completed", 2, self.total_tests)
+        self._finish_step("Latency Test Completed")
         return latencies
 
-    def measure_throughput(self, packet_size=1024, duration=10):
-        self.update_progress("Running Throughput Test...", 2, self.total_tests)
-        throughputs = []
-
-        for traffic_type in self.traffic_types:
-            packet = self.create_packet(traffic_type)
-            start_time = time.time()
-            packet_count = 0
-
-            while time.time() - start_time < duration:
-                send(packet, verbose=False)
-                packet_count += 1
+    def _send_traffic(self, duration):
+        # Returns {traffic_type: SendStats}. In-process, one raw socket serves the whole
+        # run; with several workers each sender process owns its own socket.
+        if self.reflector_port is not None:
+            streams = self._reflector_streams()
+            templates = {traffic_type: self.reflector_template(traffic_type, stream_id)
+                         for traffic_type, stream_id in streams.items()}
+        else:
+            templates = {traffic_type: self.packet_template(traffic_type) for traffic_type in self.traffic_types}
+
+        if self.workers <= 1:
+            with self._warm_resource(("send",), lambda: SendEngine(self.network_ip)) as engine:
+                results = {}
+                for traffic_type, template in templates.items():
+                    if self.stop_event.is_set():
+                        break
+                    monitor = self._throughput_monitor([traffic_type])
+                    sampler = _RateSampler(traffic_type, self._publish_sample, monitor)
+
+                    def on_batch(index, packets, bytes_sent, syscalls, sampler=sampler):
+                        sampler.add(packets, bytes_sent)
+                    results[traffic_type] = engine.run(template, duration, self.rate_profile,
+                                                       monitor or self.stop_event, on_batch)
+                    if monitor is not None:
+                        results[traffic_type].convergence = monitor.summary(traffic_type)
+        else:
+            pool = TrafficPool(self.network_ip, self.workers)
+            if self.pool_split == POOL_BY_TRAFFIC_TYPE:
+                results = self._run_pool(pool, split_by_traffic_type(templates, self.workers), duration)
+            else:
+                results = {traffic_type: self._run_pool(pool, split_by_flow(traffic_type, template, self.workers),
+                                                        duration)[traffic_type]
+                           for traffic_type, template in templates.items()
+                           if not self.stop_event.is_set()}
 
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-            throughput = (packet_size * packet_count * 8) / elapsed_time  # bits per second
-            throughput_mbps = throughput / 1_000_000  # Mbps
-            throughputs.append(f"{traffic_type} Throughput: {throughput_mbps:.2f} Mbps")
+        if self.reflector_port is not None:
+            self._collect_reflector_stats(results, streams)
+        return results
 
-        self.update_progress("Throughput Test Completed", 3, self.total_tests)
-        return throughputs
+    def _mix_template(self, traffic_type, frame_size):
+        # Template for one class of the traffic mix; frame sizes count Ethernet framing
+        ip_length = frame_size - ETHERNET_OVERHEAD
+        if traffic_type == "RTP":
+            ip_length -= 20 + 8  # The RTP builder sizes the UDP payload, not the packet
+        template = self.packet_template(traffic_type, ip_length)
+        if len(template) != frame_size - ETHERNET_OVERHEAD:
+            raise ValueError(f"{traffic_type} packets for {frame_size} byte frames came out as "
+                             f"{len(template) + ETHERNET_OVERHEAD} byte frames")
+        return template
+
+    def _send_mix(self, duration):
+        # Returns {class label: SendStats} plus "Total". The whole mix is one paced
+        # stream from this process, so its classes share the link as they would in service.
+        mix = self.traffic_mix
+        templates = [self._mix_template(traffic_type, size) for traffic_type, size in mix.classes]
+        monitor = self._throughput_monitor(["Mix"])
+        sampler = _RateSampler("Mix", self._publish_sample, monitor, counted=False)
+        with self._warm_resource(("send",), lambda: SendEngine(self.network_ip)) as engine:
+            batches = mix.build_batches(templates, engine.address, engine.batch_size)
+            stats = MixStats(mix, batches)
+
+            def on_batch(index, packets, bytes_sent, syscalls):
+                stats.on_batch(index, packets, bytes_sent, syscalls)
+                sampler.add(packets, bytes_sent)
+            total = engine.pump([mix_batch.batch for mix_batch in batches], duration, self.rate_profile, on_batch,
+                                monitor or self.stop_event)
+        if monitor is not None:
+            total.convergence = monitor.summary("Mix")
+        for (traffic_type, _), packets, bytes_sent in zip(mix.classes, stats.packets, stats.bytes):
+            packet_counter, byte_counter = _traffic_counters(traffic_type)
+            packet_counter.add(packets)
+            byte_counter.add(bytes_sent)
+        results = stats.results(total)
+        results["Total"] = total
+        return results
 
-    def measure_bandwidth(self, server='iperf-server.example.com', port=5201, duration=10):
-        self.update_progress("Running Bandwidth Test...", 3, self.total_tests)
-        if not IPERF3_AVAILABLE:
-            self.update_progress("Bandwidth Test Failed: iperf3 not available", 4, self.total_tests)
-            return "iperf3 is not installed or not available"
+    def _run_pool(self, pool, assignments, duration):
+        labels = list(dict.fromkeys(label for assignment in assignments for label, _ in assignment))
+        monitor = self._throughput_monitor(labels)
+        samplers = {label: _RateSampler(label, self._publish_sample, monitor) for label in labels}
+        results = pool.run(assignments, duration, self.rate_profile, monitor or self.stop_event,
+                           lambda label, packets, bytes_sent: samplers[label].update(packets, bytes_sent))
+        for label, stats in results.items():
+            samplers[label].update(stats.packets, stats.bytes_sent)  # Counts what came after the last report
+        if monitor is not None:
+            for label, stats in results.items():
+                stats.convergence = monitor.summary(label)
+        return results
 
-        # Check if iperf3 executable is available
-        try:
-            result = subprocess.run(["iperf3", "--version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            print(result.stdout.decode())  # This will print the version info to the console for verification
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            self.update_progress("Bandwidth Test Failed: iperf3 executable not found", 4, self.total_tests)
-            return "iperf3 executable not found or not accessible"
-
-        client = iperf3.Client()
-        client.duration = duration
-        client.server_hostname = server
-        client.port = port
-
-        result = client.run()
-        if result.error:
-            self.update_progress(f"Bandwidth Test Failed: {result.error}", 4, self.total_tests)
-            return result.error
+    def _collect_reflector_stats(self, results, streams):
+        from Reflector import ReflectorClient
+
+        time.sleep(REFLECTOR_SETTLE_TIME)  # Let packets still in flight reach the reflector
+        client = ReflectorClient(self.network_ip, self.reflector_port)
+        for traffic_type, stream_id in streams.items():
+            if traffic_type not in results:
+                continue  # Not sent: the run was stopped first
+            try:
+                results[traffic_type].received = client.query(stream_id, max(1, self.workers),
+                                                              results[traffic_type].packets)
+                client.reset(stream_id, max(1, self.workers))
+            except OSError:
+                results[traffic_type].received = None
+
+    def _format_send_stats(self, stats):
+        details = f"{stats.pps:.0f} pps"
+        if stats.syscalls:
+            details += f", {stats.syscalls} syscalls"
+        if stats.target_pps:
+            details += f", {stats.rate_deviation:+.2f}% from target"
+        text = f"{stats.mbps:.2f} Mbps ({details})"
+        received = stats.received
+        if received is not None:
+            text += (f", received {received['receive_mbps']:.2f} Mbps ({received['receive_pps']:.0f} pps, "
+                     f"{received['loss_percentage']:.2f}% loss, {received['reordered']} reordered, "
+                     f"{received['duplicates']} duplicates, one-way delay p50 "
+                     f"{received['one_way_delay_p50']:.6f} seconds)")
+        elif self.reflector_port is not None:
+            text += ", no answer from reflector"
+        if stats.convergence is not None:
+            text += f", {self._format_convergence(stats.convergence, relative=True)}"
+        return text
+
+    @staticmethod
+    def _format_convergence(convergence, relative=False):
+        # "converged after 23 samples (±1.52% at 95% confidence)"; absolute widths are in seconds
+        half_width = convergence["half_width"]
+        if half_width is None:
+            width = "no spread yet"
+        elif relative:
+            width = f"±{half_width / convergence['mean'] * 100:.2f}%" if convergence["mean"] else "±inf%"
         else:
-            sent = f"Sent: {result.sent_Mbps:.2f} Mbps"
-            received = f"Received: {result.received_Mbps:.2f} Mbps"
-            self.update_progress("Bandwidth Test Completed", 4, self.total_tests)
-            return sent, received
-
-    def measure_ping(self):
-        self.update_progress("Running Ping Test...", 4, self.total_tests)
-        latency = ping3.ping(self.network_ip)
-        self.update_progress("Ping Test Completed", 5, self.total_tests)
-        return f"Ping latency: {latency:.6f} seconds"
+            width = f"±{half_width:.6f} seconds"
+        state = "converged" if convergence["converged"] else "not converged"
+        return f"{state} after {convergence['samples']} samples ({width} at {convergence['confidence']:.0%} confidence)"
 
-    def measure_qos(self):
-        self.update_progress("Running QoS Metrics...", 5, self.total_tests)
-        results = []
-
-        for traffic_type in self.traffic_types:
-            latencies = []
-            packet_loss_count = 0
+    def measure_throughput(self, duration=10):
+        self._start_step("Running Throughput Test...")
+        throughputs = []
 
-            for _ in range(self.packet_count):
-                packet = self.create_packet(traffic_type)
-                start_time = time.time()
-                response = sr1(packet, timeout=1, verbose=False)
-                end_time = time.time()
+        results = self._send_traffic(duration)
+        self._record_send_stats("Throughput Test", results)
+        for traffic_type, stats in results.items():
+            throughputs.append(f"{traffic_type} Throughput: {self._format_send_stats(stats)}")
 
-                if response:
-                    latencies.append(end_time - start_time)
-                else:
-                    packet_loss_count += 1
+        self._finish_step("Throughput Test Completed")
+        return throughputs
 
-            if latencies:
-                average_latency = sum(latencies) / len(latencies)
-                jitter = statistics.stdev(latencies) if len(latencies) > 1 else 0.0
+    def measure_bandwidth(self, server=None, port=DEFAULT_PORT, duration=10, streams=4, protocol="tcp"):
+        # Runs against a bandwidth server (python Bandwidth_Engine.py) on `server`;
+        # without one, a server is started locally on loopback
+        self._start_step("Running Bandwidth Test...")
+        # An adaptive run needs many short intervals rather than a few one-second ones
+        monitor = self._throughput_monitor(["Bandwidth"])
+        interval = SAMPLE_INTERVAL if monitor is not None else 1.0
+        on_interval = None
+        if self.on_sample is not None or monitor is not None:
+            def on_interval(start, end, sent):
+                mbps = sent * 8 / (end - start) / 1_000_000
+                self._publish_sample("mbps", "Bandwidth", mbps)
+                if monitor is not None:
+                    monitor.add("Bandwidth", mbps)
+        try:
+            if server is None:
+                with BandwidthServer("127.0.0.1", 0) as local_server:
+                    result = BandwidthClient("127.0.0.1", local_server.port, streams, protocol,
+                                             interval=interval).run(duration, on_interval, monitor or self.stop_event)
             else:
-                average_latency = jitter = 0.0
+                result = BandwidthClient(server, port, streams, protocol, interval=interval).run(
+                    duration, on_interval, monitor or self.stop_event)
+        except OSError as e:
+            self._finish_step(f"Bandwidth Test Failed: {e}")
+            return f"Bandwidth server not reachable: {e}"
+
+        self._record("Bandwidth Test", {"sent_mbps": result.sent_mbps, "received_mbps": result.received_mbps,
+                                        "elapsed": result.elapsed, "streams": result.streams},
+                     result.protocol.upper(), server or "127.0.0.1", frame_length=0)
+        sent = f"Sent: {result.sent_mbps:.2f} Mbps over {result.streams} {result.protocol.upper()} stream(s)"
+        received = f"Received: {result.received_mbps:.2f} Mbps"
+        self._finish_step("Bandwidth Test Completed")
+        if monitor is not None:
+            convergence = self._format_convergence(monitor.summary("Bandwidth"), relative=True)
+            return sent, received, f"Run length: {result.elapsed:.2f} seconds, {convergence}"
+        return sent, received
 
-            packet_loss_percentage = (packet_loss_count / self.packet_count) * 100
+    def measure_ping(self):
+        self._start_step("Running Ping Test...")
+        import ping3
+        latency = ping3.ping(self.network_ip)
+        self._record("Ping Test", {"latency": latency}, "ICMP", frame_length=0)
+        self._finish_step("Ping Test Completed")
+        return f"Ping latency: {latency:.6f} seconds"
 
-            results.append((f"{traffic_type} Average Latency: {average_latency:.6f} seconds",
-                            f"{traffic_type} Jitter: {jitter:.6f} seconds",
-                            f"{traffic_type} Packet Loss: {packet_loss_percentage:.2f}%"))
+    def measure_ping_sweep(self, count=None):
+        # Returns {host: HostPingResult.summary()} for every host of sweep_targets,
+        # all pinged at once through one raw socket
+        self._start_step("Running Ping Sweep...")
+        hosts = expand_targets(self.sweep_targets or self.network_ip)
+        sweep = PingSweep(hosts, count or DEFAULT_SWEEP_COUNT)
+        results = {host: result.summary() for host, result in sweep.run(self.stop_event).items()}
+        for host, summary in results.items():
+            self._record("Ping Sweep", summary, "ICMP", host, frame_length=0)
+        self._finish_step("Ping Sweep Completed")
+        return results
 
-        self.update_progress("QoS Metrics Completed", 6, self.total_tests)
+    def trace_path(self):
+        # Returns {traffic type: PathResult.summary()}: every traffic type's packets
+        # are traced at once, on its own ports, so each follows its own policy route
+        self._start_step("Running Path Trace...")
+        templates = {traffic_type: self.packet_template(traffic_type) for traffic_type in self.traffic_types}
+        trace = PathTrace(self.network_ip, templates, self.trace_hops, self.trace_rounds)
+        paths = {traffic_type: path.summary() for traffic_type, path in trace.run(self.stop_event).items()}
+        for traffic_type, path in paths.items():
+            for hop in path["hops"]:
+                self._record("Path Trace", hop, traffic_type, hop["address"] or f"hop {hop['ttl']}", frame_length=0)
+        self._finish_step("Path Trace Completed")
+        return paths
+
+    def measure_qos(self, interval=0.01, window=64):
+        # Returns {traffic_type: ProbeResult.summary()}: latency percentiles and
+        # RFC 3550 jitter in seconds, packet loss in percent
+        self._start_step("Running QoS Metrics...")
+
+        # Keep up to `window` probes in flight instead of waiting on each reply in turn.
+        # A reflector in reflect mode echoes UDP probes, which nothing else would answer.
+        templates = {traffic_type: self.packet_template(traffic_type) for traffic_type in self.traffic_types}
+        if self.reflector_port is not None:
+            streams = self._reflector_streams()
+            for traffic_type, template in templates.items():
+                if template.protocol == 17:
+                    templates[traffic_type] = self.reflector_template(traffic_type, streams[traffic_type])
+        # An adaptive run sends up to packet_count probes per type, until every mean RTT converges
+        monitor = None
+        if self.rtt_target is not None:
+            monitor = ConvergenceMonitor(self.rtt_target, templates, self.stop_event)
+        with self._probe_engine(interval=interval, window=window, timeout=1) as engine:
+            probe_results = engine.run(templates, self.packet_count, stop_event=monitor or self.stop_event,
+                                       on_rtt=self._on_rtt(monitor))
+        results = {traffic_type: probe_results[traffic_type].summary() for traffic_type in self.traffic_types}
+        if monitor is not None:
+            for traffic_type, summary in results.items():
+                summary["convergence"] = monitor.summary(traffic_type)
+        for traffic_type, summary in results.items():
+            self._record("QoS Metrics", summary, traffic_type)
+        if self.reflector_port is not None:
+            from Reflector import ReflectorClient
+            try:
+                client = ReflectorClient(self.network_ip, self.reflector_port)
+                for traffic_type, stream_id in streams.items():
+                    client.reset(stream_id)
+            except OSError:
+                pass
+
+        self._finish_step("QoS Metrics Completed")
         return results
 
-    def perform_port_scan(self):
-        self.update_progress("Performing Port Scan...", 6, self.total_tests)
+    def perform_port_scan(self, ports=None):
+        self._start_step("Performing Port Scan...")
         open_ports = []
+        service_ports = {}
         for traffic_type in self.traffic_types:
             port = TRAFFIC_TYPE_PORT_MAP.get(traffic_type, None)
             if port:
-                packet = IP(dst=self.network_ip) / TCP(dport=port, flags="S")
-                response = sr1(packet, timeout=0.5, verbose=False)
-                if response and response.haslayer(TCP) and response.getlayer(TCP).flags == 0x12:
+                service_ports.setdefault(port, []).append(traffic_type)
+
+        # Scan the selected services plus any extra ports in one batched SYN sweep
+        scan_ports = sorted(set(service_ports) | set(ports or ()))
+        if scan_ports:
+            scan_result = SynScanner([self.network_ip], scan_ports).run(self.stop_event)[self.network_ip]
+            for port in scan_result.open_ports:
+                for traffic_type in service_ports.get(port, ["TCP"]):
                     open_ports.append((traffic_type, port))
-                    send(IP(dst=self.network_ip) / TCP(dport=port, flags="R"), verbose=False)
-        self.update_progress("Port Scan Completed", 7, self.total_tests)
+            for port in scan_ports:
+                for traffic_type in service_ports.get(port, ["TCP"]):
+                    self._record("Port Scan", {"port": port, "open": int(port in scan_result.open_ports)},
+                                 traffic_type, frame_length=0)
+        self._finish_step("Port Scan Completed")
         return open_ports
 
     def perform_load_test(self, duration=30):
-        self.update_progress("Running Load Test...", 7, self.total_tests)
+        self._start_step("Running Load Test...")
         load_throughputs = []
 
-        for traffic_type in self.traffic_types:
-            packet = self.create_packet(traffic_type)
-            start_time = time.time()
-            packet_count = 0
+        results = self._send_mix(duration) if self.traffic_mix is not None else self._send_traffic(duration)
+        self._record_send_stats("Load Test", results)
+        for traffic_type, stats in results.items():
+            load_throughputs.append(f"{traffic_type} Load Test Throughput: {self._format_send_stats(stats)}")
 
-            while time.time() - start_time < duration:
-                send(packet, verbose=False)
-                packet_count += 1
+        self._finish_step("Load Test Completed")
+        return load_throughputs
 
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-            load_throughput = (self.frame_length * packet_count * 8) / elapsed_time  # bits per second
-            load_throughput_mbps = load_throughput / 1_000_000  # Mbps
-            load_throughputs.append(f"{traffic_type} Load Test Throughput: {load_throughput_mbps:.2f} Mbps")
+    def measure_app_load(self, duration=10, concurrency=None):
+        # Returns {traffic_type: AppLoadResult.summary()} for the types that are real
+        # TCP services, driven over kernel connections with keep-alive
+        from App_Load_Engine import APP_DIALOGUES, DEFAULT_CONCURRENCY, AppLoadEngine
+
+        self._start_step("Running Application Load Test...")
+        targets = {traffic_type: TRAFFIC_TYPE_PORT_MAP[traffic_type] for traffic_type in self.traffic_types
+                   if traffic_type in APP_DIALOGUES}
+        engine = AppLoadEngine(self.network_ip, concurrency or DEFAULT_CONCURRENCY)
+        results = engine.run(targets, duration, self.stop_event) if targets else {}
+        results = {traffic_type: result.summary() for traffic_type, result in results.items()}
+        for traffic_type, summary in results.items():
+            self._record("Application Load Test", summary, traffic_type, frame_length=0)
+        self._finish_step("Application Load Test Completed")
+        return results
 
-        self.update_progress("Load Test Completed", 8, self.total_tests)
-        return load_throughputs
+    def replay_capture_file(self):
+        # Returns ReplayStats.summary(), or None when no capture was given
+        self._start_step("Running Capture Replay...")
+        if self.replay_capture is None:
+            self._finish_step("Capture Replay Skipped")
+            return None
+        replay = PcapReplay(self.replay_capture, self.network_ip, self.replay_speed, self.replay_rewrite)
+        stats = replay.run(self.stop_event, _RateSampler("Replay", self._publish_sample).add)
+        summary = stats.summary()
+        self._record("Capture Replay", summary, "Replay", frame_length=0)
+        self._finish_step("Capture Replay Completed")
+        return summary
+
+    def run_rfc2544(self, on_trial=None):
+        # Returns {frame size: FrameSizeResult.summary()} of the RFC 2544 benchmark, or
+        # None when it is not configured or there is no reflector to count what arrives.
+        # on_trial(frame_size, kind, Trial) sees every trial as it finishes.
+        self._start_step("Running RFC 2544 Benchmark...")
+        if self.rfc2544 is None or self.reflector_port is None:
+            self._finish_step("RFC 2544 Benchmark Skipped")
+            return None
+        from Reflector import ReflectorClient
+
+        traffic_type = self.traffic_types[0]
+        templates = {size: self.reflector_template(traffic_type, 0, packet_length(size))
+                     for size in self.rfc2544.frame_sizes}
+        for size, template in templates.items():
+            assert len(template) == packet_length(size), f"{size} byte frame template is {len(template)} bytes of IP"
+        probe_template = {"ICMP": self.packet_template("ICMP")}
+
+        def probe(duration):
+            count = max(1, int(duration / RFC2544_PROBE_INTERVAL))
+            with self._probe_engine(interval=RFC2544_PROBE_INTERVAL, window=64, timeout=1) as engine:
+                return engine.run(probe_template, count, stop_event=self.stop_event)["ICMP"].summary()
+
+        def publish(frame_size, kind, trial):
+            if kind == "rate":
+                self._publish_sample("pps", f"{frame_size}B", trial.pps)
+            if on_trial is not None:
+                on_trial(frame_size, kind, trial)
+
+        client = ReflectorClient(self.network_ip, self.reflector_port)
+        with self._warm_resource(("send",), lambda: SendEngine(self.network_ip)) as engine:
+            results = self.rfc2544.run(engine, templates, client, probe, self.stop_event, publish)
+        results = {frame_size: result.summary() for frame_size, result in results.items()}
+        for frame_size, summary in results.items():
+            self._record("RFC 2544", summary, traffic_type, frame_length=frame_size)
+        self._finish_step("RFC 2544 Benchmark Completed")
+        return results
 
-    def run_all_tests(self):
+    def run_soak(self, path, duration, windows=DEFAULT_WINDOWS, interval=DEFAULT_SOAK_INTERVAL, resume=False,
+                 on_window=None, window=64):
+        # QoS probing for hours, rolled up into windows appended to `path` (see Soak.py);
+        # with resume a run cut short continues from the file. Returns SoakTest.summary().
+        # on_window(WindowSummary) gets every closed window and must not block.
+        templates = {traffic_type: self.packet_template(traffic_type) for traffic_type in self.traffic_types}
+        soak = SoakTest(path, templates, duration, windows,
+                        settings={"network_ip": self.network_ip, "interval": interval})
+        with self._probe_engine(interval=interval, window=window, timeout=1) as engine:
+            return soak.run(engine, self.stop_event, on_window, resume, self._on_rtt())
+
+    def _test_table(self):
+        # (name, test, resource class) for each of TEST_NAMES
+        return [
+            ("Speed Test", self.measure_speed, RESOURCE_EXCLUSIVE),
+            ("Latency Test", self.measure_latency, RESOURCE_SHARED),
+            ("Ping Test", self.measure_ping, RESOURCE_SHARED),
+            ("Ping Sweep", self.measure_ping_sweep, RESOURCE_SHARED),
+            ("QoS Metrics", self.measure_qos, RESOURCE_SHARED),
+            ("Port Scan", self.perform_port_scan, RESOURCE_SHARED),
+            ("Throughput Test", lambda: self.measure_throughput(duration=self.packet_count), RESOURCE_EXCLUSIVE),
+            ("Bandwidth Test", lambda: self.measure_bandwidth(server=self.network_ip), RESOURCE_EXCLUSIVE),
+            ("Load Test", self.perform_load_test, RESOURCE_EXCLUSIVE),
+            ("Application Load Test", self.measure_app_load, RESOURCE_EXCLUSIVE),
+            ("Capture Replay", self.replay_capture_file, RESOURCE_EXCLUSIVE),
+            ("RFC 2544", self.run_rfc2544, RESOURCE_EXCLUSIVE),
+            ("Path Trace", self.trace_path, RESOURCE_SHARED),
+        ]
+
+    def run_tests(self, tests=None, raise_errors=True, on_test_done=None):
+        # Runs the named tests (all of TEST_NAMES by default); returns ({name: raw result}, scheduler).
+        # With raise_errors=False failed tests are missing from the results, as are tests
+        # skipped after stop(); see TestScheduler.run.
+        selected = [entry for entry in self._test_table() if tests is None or entry[0] in tests]
+        self._completed_tests = 0
+        self.total_tests = len(selected)
+        scheduler = TestScheduler()
+        for name, test, resource_class in selected:
+            scheduler.add(name, test, resource_class)
+        self.stop_event.clear()
+        return scheduler.run(raise_errors, self.stop_event, on_test_done), scheduler
+
+    def run_all_tests(self, tests=None):
+        test_results, scheduler = self.run_tests(tests)
+        return self.format_results(test_results, scheduler)
+
+    def format_results(self, test_results, scheduler=None, header=True):
         results = []
 
-        results.append("Running Network Tests...\n")
+        if header:
+            results.append("Running Network Tests...\n")
 
-        results.append("Speed Test:")
-        download_speed, upload_speed = self.measure_speed()
-        results.append(download_speed)
-        results.append(upload_speed)
+        if "Speed Test" in test_results:
+            results.append("Speed Test:")
+            download_speed, upload_speed = test_results["Speed Test"]
+            results.append(download_speed)
+            results.append(upload_speed)
 
-        results.append("\nLatency Test:")
-        latency_results = self.measure_latency()
-        results.extend(latency_results)
+        if "Latency Test" in test_results:
+            results.append("\nLatency Test:")
+            for traffic_type, latency in test_results["Latency Test"].items():
+                if latency is not None:
+                    results.append(f"{traffic_type} Latency: {latency:.6f} seconds")
+                else:
+                    results.append(f"{traffic_type} Latency: No response")
 
-        results.append("\nThroughput Test:")
-        throughput_results = self.measure_throughput(duration=self.packet_count)
-        results.extend(throughput_results)
+        if "Throughput Test" in test_results:
+            results.append("\nThroughput Test:")
+            results.extend(test_results["Throughput Test"])
 
-        results.append("\nBandwidth Test:")
-        bandwidth_results = self.measure_bandwidth(server=self.network_ip)
-        if isinstance(bandwidth_results, tuple):
-            results.extend(bandwidth_results)
-        else:
-            results.append(bandwidth_results)
+        if "Bandwidth Test" in test_results:
+            results.append("\nBandwidth Test:")
+            bandwidth_results = test_results["Bandwidth Test"]
+            if isinstance(bandwidth_results, tuple):
+                results.extend(bandwidth_results)
+            else:
+                results.append(bandwidth_results)
+
+        if "Ping Test" in test_results:
+            results.append("\nPing Test:")
+            results.append(test_results["Ping Test"])
+
+        if "Ping Sweep" in test_results:
+            results.append("\nPing Sweep:")
+            sweep = test_results["Ping Sweep"]
+            # Only hosts that answered are listed; a /22 of silent hosts would drown the report
+            for host, ping in sweep.items():
+                if ping["received"]:
+                    results.append(f"{host}: {ping['received']}/{ping['sent']} replies, "
+                                   f"{ping['packet_loss']:.2f}% loss, average {ping['average_latency']:.6f} seconds "
+                                   f"(min {ping['min_latency']:.6f}, max {ping['max_latency']:.6f})")
+            alive = sum(1 for ping in sweep.values() if ping["received"])
+            results.append(f"{alive} of {len(sweep)} hosts answered")
+
+        if "QoS Metrics" in test_results:
+            results.append("\nQoS Metrics:")
+            for traffic_type, qos in test_results["QoS Metrics"].items():
+                results.append(f"{traffic_type} Average Latency: {qos['average_latency']:.6f} seconds")
+                results.append(f"{traffic_type} Latency p50/p90/p99/p99.9/max: {qos['p50']:.6f} / {qos['p90']:.6f} / "
+                               f"{qos['p99']:.6f} / {qos['p99.9']:.6f} / {qos['max_latency']:.6f} seconds")
+                results.append(f"{traffic_type} Jitter: {qos['jitter']:.6f} seconds")
+                results.append(f"{traffic_type} Packet Loss: {qos['packet_loss']:.2f}%")
+                if "convergence" in qos:
+                    results.append(f"{traffic_type} Probes: {qos['sent']} sent, "
+                                   f"{self._format_convergence(qos['convergence'])}")
+
+        if "Port Scan" in test_results:
+            results.append("\nPort Scan:")
+            open_ports = test_results["Port Scan"]
+            for port in open_ports:
+                results.append(f"{port[0]} Open port: {port[1]}")
+            if not open_ports:
+                results.append("No open ports found.")
+
+        if "Load Test" in test_results:
+            results.append("\nLoad Test:")
+            results.extend(test_results["Load Test"])
+
+        if "Application Load Test" in test_results:
+            results.append("\nApplication Load Test:")
+            for traffic_type, load in test_results["Application Load Test"].items():
+                results.append(f"{traffic_type} Connections: {load['connections_per_second']:.0f}/s, "
+                               f"{load['peak_connections']} concurrent, {load['errors']} errors")
+                results.append(f"{traffic_type} Requests: {load['requests_per_second']:.0f}/s")
+                results.append(f"{traffic_type} Connect p50/p99: {load['connect_p50']:.6f} / {load['connect_p99']:.6f} seconds")
+                results.append(f"{traffic_type} Response p50/p99: {load['response_p50']:.6f} / "
+                               f"{load['response_p99']:.6f} seconds, first byte avg {load['average_first_byte']:.6f} seconds")
+            if not test_results["Application Load Test"]:
+                results.append("No TCP service traffic types selected.")
+
+        if "Capture Replay" in test_results:
+            results.append("\nCapture Replay:")
+            replay = test_results["Capture Replay"]
+            if replay is None:
+                results.append("No capture file given.")
+            else:
+                speed = f"{replay['speed']:g}x timing" if replay["speed"] is not None else "full speed"
+                results.append(f"Replayed {replay['packets']} packets ({replay['skipped']} skipped) at {speed}: "
+                               f"{replay['mbps']:.2f} Mbps, {replay['pps']:.0f} pps")
+                results.append(f"Run time: {replay['elapsed']:.2f} seconds for {replay['capture_duration']:.2f} "
+                               f"seconds of capture")
+                if replay["speed"] is not None:
+                    results.append(f"Timing error p50/p99/max: {replay['timing_error_p50']:.6f} / "
+                                   f"{replay['timing_error_p99']:.6f} / {replay['timing_error_max']:.6f} seconds")
+
+        if "RFC 2544" in test_results:
+            results.append("\nRFC 2544 Benchmark:")
+            benchmark = test_results["RFC 2544"]
+            if benchmark is None:
+                results.append("Not configured, or no reflector to count received frames.")
+            else:
+                results.extend(format_rfc2544(benchmark))
 
-        results.append("\nPing Test:")
-        results.append(self.measure_ping())
+        if "Path Trace" in test_results:
+            results.append("\nPath Trace:")
+            for traffic_type, path in test_results["Path Trace"].items():
+                results.extend(format_path(traffic_type, path))
 
-        results.append("\nQoS Metrics:")
-        qos_results = self.measure_qos()
-        for result in qos_results:
-            results.extend(result)
+        if scheduler is not None:
+            results.append("\nSchedule:")
+            results.extend(scheduler.summary())
 
-        results.append("\nPort Scan:")
-        open_ports = self.perform_port_scan()
-        for port in open_ports:
-            results.append(f"{port[0]} Open port: {port[1]}")
-        if not open_ports:
-            results.append("No open ports found.")
+        return "\n".join(results)
 
-        results.append("\nLoad Test:")
-        load_test_results = self.perform_load_test()
-        results.extend(load_test_results)
 
-        return "\n".join(results)
+GUI_POLL_MS = 100  # The Tk main loop drains worker events at 10 Hz
+GRAPH_POINTS = 300  # Points kept per graph line: 30 seconds at one point per drain
+GRAPH_COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b",
+                "#e377c2", "#7f7f7f", "#bcbd22", "#17becf", "#000000"]
+EVENT_BACKLOG = 100_000  # Oldest events are dropped rather than ever blocking a test thread
+
+
+class LiveGraph:
+    # Scrolling line chart on a Canvas, one line per traffic type
+    def __init__(self, parent, title, unit, scale=1.0, width=260, height=120):
+        import tkinter as tk
+
+        self.title = title
+        self.unit = unit
+        self.scale = scale
+        self.width = width
+        self.height = height
+        self.series = {}
+        self.canvas = tk.Canvas(parent, width=width, height=height, background="white")
+
+    def add(self, label, value):
+        self.series.setdefault(label, deque(maxlen=GRAPH_POINTS)).append(value * self.scale)
+
+    def clear(self):
+        self.series.clear()
+        self.redraw()
+
+    def redraw(self):
+        canvas = self.canvas
+        canvas.delete("all")
+        top = max((max(values) for values in self.series.values()), default=0.0) or 1.0
+        canvas.create_text(4, 2, anchor="nw", text=f"{self.title} (max {top:.4g} {self.unit})")
+        plot_top = 16
+        plot_height = self.height - plot_top - 4
+        step = self.width / (GRAPH_POINTS - 1)
+        for i, (label, values) in enumerate(self.series.items()):
+            color = GRAPH_COLORS[i % len(GRAPH_COLORS)]
+            first = GRAPH_POINTS - len(values)  # Newest point at the right edge
+            points = []
+            for j, value in enumerate(values):
+                points.extend(((first + j) * step, plot_top + plot_height * (1 - value / top)))
+            if len(points) >= 4:
+                canvas.create_line(*points, fill=color)
+            canvas.create_text(self.width - 4, plot_top + 12 * i, anchor="ne", fill=color,
+                               text=f"{label} {values[-1]:.4g}")
 
 
 class NetworkTesterGUI:
+    # Tests run on a worker thread that never touches Tk: it appends events to a
+    # deque (never blocks), and the main loop drains them every GUI_POLL_MS,
+    # applying only the latest progress and one averaged point per graph line.
     def __init__(self, root):
+        import tkinter as tk
+        from tkinter import ttk
+
         self.root = root
         self.root.title("Network Tester")
 
@@ -339,41 +997,127 @@ class NetworkTesterGUI:
         self.frame_length.set(self.frame_lengths[0])  # Default to the first frame length
 
         self.start_button = ttk.Button(root, text="Generate Traffic", command=self.start_tests)
-        self.start_button.grid(row=7, column=0, columnspan=2, padx=10, pady=10)
+        self.start_button.grid(row=7, column=0, padx=10, pady=10)
+
+        self.stop_button = ttk.Button(root, text="Stop", command=self.stop_tests, state=tk.DISABLED)
+        self.stop_button.grid(row=7, column=1, padx=10, pady=10)
 
         self.progress = ttk.Progressbar(root, orient=tk.HORIZONTAL, length=200, mode='determinate')
         self.progress.grid(row=7, column=2, padx=10, pady=10)
 
+        graph_frame = ttk.Frame(root)
+        graph_frame.grid(row=8, column=0, columnspan=3, padx=10, pady=5)
+        self.graphs = {
+            "pps": LiveGraph(graph_frame, "Packets/s", "pps"),
+            "mbps": LiveGraph(graph_frame, "Throughput", "Mbps"),
+            "rtt": LiveGraph(graph_frame, "RTT", "ms", scale=1000),
+        }
+        for column, graph in enumerate(self.graphs.values()):
+            graph.canvas.grid(row=0, column=column, padx=2)
+            graph.redraw()
+
         self.results_text = tk.Text(root, height=20, width=80)
-        self.results_text.grid(row=8, column=0, columnspan=3, padx=10, pady=10)
+        self.results_text.grid(row=9, column=0, columnspan=3, padx=10, pady=10)
 
         self.progress_label = ttk.Label(root, text="")
-        self.progress_label.grid(row=9, column=0, columnspan=3, padx=10, pady=10)
+        self.progress_label.grid(row=10, column=0, columnspan=3, padx=10, pady=10)
 
         self.tester = None
+        self.worker = None
         self.start_time = None
+        self.events = deque(maxlen=EVENT_BACKLOG)
+        self.root.after(GUI_POLL_MS, self._drain_events)
 
     def start_tests(self):
+        import tkinter as tk
+
+        if self.worker is not None and self.worker.is_alive():
+            return
         network_ip = self.network_ip_entry.get()
         packet_count = int(self.packet_count_entry.get())
         traffic_types = [traffic_type for traffic_type, var in self.traffic_type_vars.items() if var.get()]
         frame_length = int(self.frame_length.get())
         self.tester = NetworkTester(network_ip, packet_count, traffic_types, frame_length, self.update_progress)
+        self.tester.on_sample = self.post_sample
         self.results_text.delete(1.0, tk.END)
+        for graph in self.graphs.values():
+            graph.clear()
         self.progress["value"] = 0
         self.progress_label.config(text="Starting tests...")
+        self.start_button.config(state=tk.DISABLED)
+        self.stop_button.config(state=tk.NORMAL)
         self.start_time = time.time()
 
         # Run tests in a separate thread to keep the GUI responsive
-        threading.Thread(target=self.run_tests, args=(self.tester,)).start()
+        self.worker = threading.Thread(target=self.run_tests, args=(self.tester,), daemon=True)
+        self.worker.start()
+
+    def stop_tests(self):
+        import tkinter as tk
+
+        if self.tester is not None:
+            self.tester.stop()
+            self.stop_button.config(state=tk.DISABLED)
+            self.progress_label.config(text="Stopping...")
 
     def run_tests(self, tester):
-        results = tester.run_all_tests()
-        self.results_text.insert(tk.END, results)
-        self.progress_label.config(text="Tests completed.")
-        self.progress["value"] = 100
+        # Worker thread: reports only through self.events
+        def on_test_done(test):
+            if test.error is None:
+                self.events.append(("section", tester.format_results({test.name: test.result}, header=False)))
+
+        try:
+            test_results, scheduler = tester.run_tests(on_test_done=on_test_done)
+            self.events.append(("done", tester.format_results(test_results, scheduler), tester.stop_event.is_set()))
+        except Exception as e:
+            self.events.append(("error", f"Tests failed: {e}"))
 
     def update_progress(self, message, current_step, total_steps):
+        self.events.append(("progress", message, current_step, total_steps))
+
+    def post_sample(self, kind, label, value):
+        self.events.append(("sample", kind, label, value))
+
+    def _drain_events(self):
+        import tkinter as tk
+
+        progress = None
+        samples = {}
+        while True:
+            try:
+                event = self.events.popleft()
+            except IndexError:
+                break
+            kind = event[0]
+            if kind == "progress":
+                progress = event[1:]
+            elif kind == "sample":
+                _, sample_kind, label, value = event
+                total, count = samples.get((sample_kind, label), (0.0, 0))
+                samples[(sample_kind, label)] = (total + value, count + 1)
+            elif kind == "section":
+                self.results_text.insert(tk.END, event[1].lstrip("\n") + "\n\n")
+            elif kind in ("done", "error"):
+                progress = None
+                self.results_text.delete(1.0, tk.END)
+                self.results_text.insert(tk.END, event[1])
+                if kind == "done" and not event[2]:
+                    self.progress_label.config(text="Tests completed.")
+                    self.progress["value"] = 100
+                else:
+                    self.progress_label.config(text="Tests stopped." if kind == "done" else "Tests failed.")
+                self.start_button.config(state=tk.NORMAL)
+                self.stop_button.config(state=tk.DISABLED)
+
+        if progress is not None:
+            self._show_progress(*progress)
+        for (sample_kind, label), (total, count) in samples.items():
+            self.graphs[sample_kind].add(label, total / count)
+        for sample_kind in {sample_kind for sample_kind, _ in samples}:
+            self.graphs[sample_kind].redraw()
+        self.root.after(GUI_POLL_MS, self._drain_events)
+
+    def _show_progress(self, message, current_step, total_steps):
         progress_percentage = (current_step / total_steps) * 100
         elapsed_time = time.time() - self.start_time
         estimated_total_time = elapsed_time / current_step * total_steps if current_step > 0 else 0
@@ -385,6 +1129,7 @@ class NetworkTesterGUI:
 
 
 if __name__ == "__main__":
+    import tkinter as tk
     root = tk.Tk()
     app = NetworkTesterGUI(root)
     root.mainloop()
@@ -0,0 +1,294 @@
+import argparse
+import json
+import sys
+import time
+
+# Headless entry point for cron jobs and remote probes: nothing here imports
+# tkinter, and each test's heavy dependencies load only if that test runs.
+from Convergence import DEFAULT_CONFIDENCE, DEFAULT_MIN_SAMPLES, ConvergenceTarget
+from Metrics import DEFAULT_METRICS_HOST, REGISTRY, MetricsServer
+from N_T_G import TEST_NAMES, TRAFFIC_TYPE_PORT_MAP, NetworkTester
+from Path_Trace import DEFAULT_MAX_HOPS, DEFAULT_TRACE_ROUNDS, TAG_SPACE
+from Pcap_Replay import replay_speed
+from RFC2544_Engine import (DEFAULT_BURST_TRIALS, DEFAULT_LATENCY_DURATION, DEFAULT_RESOLUTION, DEFAULT_SETTLE_TIME,
+                            DEFAULT_TRIAL_DURATION, RFC2544_FRAME_SIZES, RFC2544Test, parse_frame_sizes)
+from Results_Store import ResultsWriter
+from Soak import DEFAULT_SOAK_FILE, DEFAULT_SOAK_INTERVAL, DEFAULT_WINDOWS, format_soak, parse_duration, parse_windows
+from Ping_Sweep import expand_targets
+from Traffic_Mix import TrafficMix, parse_frame_mix, parse_weights
+from Pacer import UNIT_MBPS, UNIT_PPS, ConstantRate
+from Traffic_Pool import POOL_BY_FLOW, POOL_BY_TRAFFIC_TYPE
+
+TEST_ALIASES = {
+    "speed": "Speed Test",
+    "latency": "Latency Test",
+    "ping": "Ping Test",
+    "sweep": "Ping Sweep",
+    "qos": "QoS Metrics",
+    "scan": "Port Scan",
+    "throughput": "Throughput Test",
+    "bandwidth": "Bandwidth Test",
+    "load": "Load Test",
+    "app-load": "Application Load Test",
+    "replay": "Capture Replay",
+    "rfc2544": "RFC 2544",
+    "trace": "Path Trace",
+}
+
+
+def _progress(message, current_step, total_steps):
+    print(f"[{current_step}/{total_steps}] {message}", file=sys.stderr, flush=True)
+
+
+def _comma_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _argument_type(parse):
+    # Turns a parser's ValueError into an argparse usage error
+    def convert(value):
+        try:
+            return parse(value)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    convert.__name__ = parse.__name__
+    return convert
+
+
+def _soak_progress(window):
+    # Longest windows only, as they close
+    started = time.strftime("%H:%M:%S", time.localtime(window.start))
+    print(f"[soak {started}] {window.traffic_type}: {window.received}/{window.sent} replies, "
+          f"{window.loss_percentage:.2f}% loss, p99 {window.percentiles.get(99, 0):.6f} seconds",
+          file=sys.stderr, flush=True)
+
+
+def add_tester_arguments(parser):
+    # Options shared by every headless entry point that builds a NetworkTester
+    parser.add_argument("network_ip", help="IP address of the network to test")
+    parser.add_argument("--count", type=int, default=10, help="Packets per probe test (and throughput seconds)")
+    parser.add_argument("--types", type=_comma_list, default=["TCP"],
+                        help=f"Comma-separated traffic types: {', '.join(TRAFFIC_TYPE_PORT_MAP)}")
+    parser.add_argument("--frame-length", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=1, help="Sender processes for throughput/load traffic")
+    parser.add_argument("--split", choices=(POOL_BY_FLOW, POOL_BY_TRAFFIC_TYPE), default=POOL_BY_FLOW)
+    parser.add_argument("--mix", metavar="WEIGHTS",
+                        help="Load test as one interleaved stream of weighted traffic types, e.g. TCP=5,HTTP=3,NTP=2")
+    parser.add_argument("--frame-mix", default="imix",
+                        help="Frame size weights for --mix, e.g. 64=7,594=4,1518=1 (default: imix)")
+    parser.add_argument("--rate", type=float, help="Pace throughput/load traffic at this rate")
+    parser.add_argument("--rate-unit", choices=(UNIT_PPS, UNIT_MBPS), default=UNIT_MBPS)
+    parser.add_argument("--sweep", metavar="TARGETS",
+                        help="Comma-separated CIDR blocks and hosts for the ping sweep (default: network_ip)")
+    parser.add_argument("--trace-hops", type=int, default=DEFAULT_MAX_HOPS,
+                        help=f"Highest TTL the path trace probes (default: {DEFAULT_MAX_HOPS})")
+    parser.add_argument("--trace-rounds", type=int, default=DEFAULT_TRACE_ROUNDS,
+                        help=f"Path trace probes per hop and traffic type (default: {DEFAULT_TRACE_ROUNDS})")
+    parser.add_argument("--replay", metavar="CAPTURE", help="pcap or pcapng file for the capture replay test")
+    parser.add_argument("--replay-speed", type=replay_speed, default=1.0,
+                        help="Replay timing scale factor such as 1, 2x or 10x; max sends as fast as possible")
+    parser.add_argument("--keep-destination", action="store_true",
+                        help="Replay packets to their captured destinations instead of network_ip")
+    parser.add_argument("--reflector-port", type=int, help="Port of a Reflector.py daemon on the target")
+    parser.add_argument("--calibrate", action="store_true", help="Subtract the tool's loopback overhead from RTTs")
+    adaptive = parser.add_argument_group("adaptive test length",
+                                         "End a measurement once its estimate is precise enough; the fixed "
+                                         "duration or packet count becomes the upper bound")
+    adaptive.add_argument("--throughput-ci", type=float, metavar="PERCENT",
+                          help="Stop throughput, load and bandwidth runs at this ± confidence interval on Mbps")
+    adaptive.add_argument("--rtt-ci", type=float, metavar="MICROSECONDS",
+                          help="Stop sending QoS probes at this ± confidence interval on the mean RTT")
+    adaptive.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE,
+                          help=f"Confidence level of the intervals (default: {DEFAULT_CONFIDENCE})")
+    adaptive.add_argument("--min-samples", type=int, default=DEFAULT_MIN_SAMPLES,
+                          help="Samples before a run may stop: RTTs, or 0.1 second throughput intervals "
+                               f"(default: {DEFAULT_MIN_SAMPLES})")
+    rfc2544 = parser.add_argument_group("RFC 2544 benchmark",
+                                        "Zero-loss throughput, latency and back-to-back bursts per frame size, "
+                                        "counted by the reflector at --reflector-port")
+    rfc2544.add_argument("--rfc2544", action="store_true", help="Run the RFC 2544 benchmark with the other tests")
+    rfc2544.add_argument("--rfc2544-sizes", type=_argument_type(parse_frame_sizes), default=RFC2544_FRAME_SIZES,
+                         metavar="SIZES", help="Comma-separated Ethernet frame sizes "
+                                               f"(default: {','.join(map(str, RFC2544_FRAME_SIZES))})")
+    rfc2544.add_argument("--trial-duration", type=float, default=DEFAULT_TRIAL_DURATION,
+                         help=f"Seconds per throughput trial (default: {DEFAULT_TRIAL_DURATION:g})")
+    rfc2544.add_argument("--loss-tolerance", type=float, default=0.0, metavar="PERCENT",
+                         help="Loss a throughput trial may show and still pass (default: 0)")
+    rfc2544.add_argument("--link-speed", type=float, metavar="MBPS",
+                         help="Link speed the maximum rate is derived from (default: the sender's unpaced rate)")
+    rfc2544.add_argument("--search-resolution", type=float, default=DEFAULT_RESOLUTION, metavar="PERCENT",
+                         help="Stop searching once the rate or burst length is known to within this "
+                              f"(default: {DEFAULT_RESOLUTION:g})")
+    rfc2544.add_argument("--latency-duration", type=float, default=DEFAULT_LATENCY_DURATION,
+                         help=f"Seconds of the latency stream, 0 to skip (default: {DEFAULT_LATENCY_DURATION:g})")
+    rfc2544.add_argument("--burst-trials", type=int, default=DEFAULT_BURST_TRIALS,
+                         help=f"Back-to-back searches per frame size, 0 to skip (default: {DEFAULT_BURST_TRIALS})")
+    rfc2544.add_argument("--settle-time", type=float, default=DEFAULT_SETTLE_TIME,
+                         help="Seconds to wait for frames in flight after each trial "
+                              f"(default: {DEFAULT_SETTLE_TIME:g})")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve the tool's own counters and timers in Prometheus text format on this port")
+    parser.add_argument("--metrics-host", default=DEFAULT_METRICS_HOST,
+                        help=f"Address the metrics endpoint listens on (default: {DEFAULT_METRICS_HOST})")
+    parser.add_argument("--quiet", action="store_true", help="No progress on stderr")
+
+
+def check_tester_arguments(parser, args):
+    unknown = [name for name in args.types if name not in TRAFFIC_TYPE_PORT_MAP]
+    if unknown:
+        parser.error(f"unknown traffic type(s): {', '.join(unknown)}")
+    if args.mix is not None:
+        try:
+            args.traffic_mix = TrafficMix(parse_weights(args.mix), parse_frame_mix(args.frame_mix))
+        except ValueError as e:
+            parser.error(f"bad --mix or --frame-mix: {e}")
+        unknown = [name for name, _ in args.traffic_mix.type_weights if name not in TRAFFIC_TYPE_PORT_MAP]
+        if unknown:
+            parser.error(f"unknown traffic type(s) in --mix: {', '.join(unknown)}")
+    else:
+        args.traffic_mix = None
+    if args.sweep is not None:
+        try:
+            expand_targets(args.sweep)
+        except (ValueError, OSError) as e:
+            parser.error(f"bad --sweep targets: {e}")
+    if not 1 <= args.trace_hops <= 255:
+        parser.error("--trace-hops must be between 1 and 255")
+    if args.trace_rounds < 1:
+        parser.error("--trace-rounds must be at least 1")
+    trace_probes = len(set(args.types)) * args.trace_rounds * args.trace_hops
+    if trace_probes > TAG_SPACE:
+        parser.error(f"--types, --trace-rounds and --trace-hops ask for {trace_probes} path trace probes, "
+                     f"more than the {TAG_SPACE} it can tell apart")
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence must be between 0 and 1")
+    for name in ("throughput_ci", "rtt_ci"):
+        if getattr(args, name) is not None and getattr(args, name) <= 0:
+            parser.error(f"--{name.replace('_', '-')} must be positive")
+    args.rfc2544_test = None
+    if args.rfc2544:
+        if args.reflector_port is None:
+            parser.error("--rfc2544 needs --reflector-port: received frames are counted by the reflector")
+        try:
+            args.rfc2544_test = RFC2544Test(args.rfc2544_sizes, args.trial_duration, args.loss_tolerance,
+                                            args.link_speed, args.search_resolution, args.latency_duration,
+                                            burst_trials=args.burst_trials, settle_time=args.settle_time)
+        except ValueError as e:
+            parser.error(f"bad RFC 2544 settings: {e}")
+
+
+def start_metrics_server(args):
+    # The metrics endpoint asked for with --metrics-port, already serving; None without one
+    if args.metrics_port is None:
+        return None
+    return MetricsServer(host=args.metrics_host, port=args.metrics_port).start()
+
+
+def make_tester(args, **options):
+    throughput_target = rtt_target = None
+    if args.throughput_ci is not None:
+        throughput_target = ConvergenceTarget(relative=args.throughput_ci / 100, confidence=args.confidence,
+                                              min_samples=args.min_samples)
+    if args.rtt_ci is not None:
+        rtt_target = ConvergenceTarget(absolute=args.rtt_ci / 1_000_000, confidence=args.confidence,
+                                       min_samples=args.min_samples)
+    return NetworkTester(args.network_ip, args.count, args.types, args.frame_length,
+                         (lambda *progress: None) if args.quiet else _progress,
+                         workers=args.workers, pool_split=args.split,
+                         rate_profile=ConstantRate(args.rate, args.rate_unit) if args.rate else None,
+                         calibrate=args.calibrate, reflector_port=args.reflector_port,
+                         throughput_target=throughput_target, rtt_target=rtt_target, sweep_targets=args.sweep,
+                         replay_capture=args.replay, replay_speed=args.replay_speed,
+                         replay_rewrite=not args.keep_destination, traffic_mix=args.traffic_mix,
+                         rfc2544=args.rfc2544_test, trace_hops=args.trace_hops,
+                         trace_rounds=args.trace_rounds, **options)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run network tests without the GUI")
+    add_tester_arguments(parser)
+    parser.add_argument("--tests", type=_comma_list, default=list(TEST_ALIASES),
+                        help=f"Comma-separated tests to run: {', '.join(TEST_ALIASES)} (default: all)")
+    parser.add_argument("--json", action="store_true", help="Print raw results as JSON")
+    parser.add_argument("--save-results", metavar="FILE",
+                        help="Append the numeric results to a results store (see Results_Store.py)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Print the tool's own counters and timers (Prometheus text format) to stderr")
+    soak = parser.add_argument_group("soak test", "Probe the traffic types for a long time instead of running "
+                                                  "the tests, saving RTT and loss per time window to a file")
+    soak.add_argument("--soak", type=_argument_type(parse_duration), metavar="DURATION",
+                      help="Soak test length, e.g. 3600, 90m or 12h")
+    soak.add_argument("--soak-file", default=DEFAULT_SOAK_FILE,
+                      help=f"File closed windows are appended to (default: {DEFAULT_SOAK_FILE})")
+    soak.add_argument("--soak-windows", type=_argument_type(parse_windows),
+                      default=list(DEFAULT_WINDOWS), metavar="SECONDS",
+                      help="Comma-separated window lengths in seconds (default: 1,60)")
+    soak.add_argument("--soak-interval", type=float, default=DEFAULT_SOAK_INTERVAL,
+                      help=f"Seconds between probes (default: {DEFAULT_SOAK_INTERVAL})")
+    soak.add_argument("--resume", action="store_true",
+                      help="Continue the soak test recorded in --soak-file for the time it still has to run")
+    args = parser.parse_args(argv)
+
+    check_tester_arguments(parser, args)
+    unknown = [name for name in args.tests if name not in TEST_ALIASES]
+    if unknown:
+        parser.error(f"unknown test(s): {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tests = [TEST_ALIASES[name] for name in args.tests]
+    tester = make_tester(args)
+    server = start_metrics_server(args)
+    try:
+        if args.soak is not None:
+            return _run_soak(args, tester)
+        test_results, scheduler = tester.run_tests(tests)
+    finally:
+        if server is not None:
+            server.close()
+    if args.save_results:
+        with ResultsWriter(args.save_results) as writer:
+            writer.append(tester.take_records())
+    if args.json:
+        ordered = {name: test_results[name] for name in TEST_NAMES if name in test_results}
+        json.dump(ordered, sys.stdout, indent=2, default=str)
+        print()
+    else:
+        print(tester.format_results(test_results, scheduler))
+    if args.metrics:
+        print(REGISTRY.render(), end="", file=sys.stderr)
+    return 0
+
+
+def _run_soak(args, tester):
+    longest = args.soak_windows[-1]
+    on_window = None
+    if not args.quiet:
+        on_window = lambda window: _soak_progress(window) if window.length == longest else None
+    try:
+        summary = tester.run_soak(args.soak_file, args.soak, args.soak_windows, args.soak_interval, args.resume,
+                                  on_window)
+    except FileExistsError:
+        print(f"{args.soak_file} already holds a soak test; pass --resume to continue it", file=sys.stderr)
+        return 2
+    except ValueError as e:
+        print(f"Cannot resume: {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print(f"Soak test interrupted; closed windows are in {args.soak_file}, --resume continues it",
+              file=sys.stderr)
+        return 130
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        print(format_soak(summary))
+    if args.metrics:
+        print(REGISTRY.render(), end="", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
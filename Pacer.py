@@ -0,0 +1,136 @@
+import copy
+import math
+
+UNIT_PPS = "pps"
+UNIT_MBPS = "mbps"
+
+# The sender never sleeps for less than this; at high rates it sends a
+# whole batch per wakeup instead of waking up once per packet.
+MIN_SLEEP = 0.001
+
+
+class RateProfile:
+    # A profile describes how many packets should have been sent `elapsed`
+    # seconds into a run (due) and the inverse (time_for). The sender compares
+    # its own count against due() and sleeps until the next batch is owed.
+    def __init__(self, unit=UNIT_PPS):
+        if unit not in (UNIT_PPS, UNIT_MBPS):
+            raise ValueError(f"Unknown rate unit: {unit}")
+        self.unit = unit
+
+    def _pps(self, rate, frame_bytes):
+        if self.unit == UNIT_MBPS:
+            return rate * 1_000_000 / (8 * frame_bytes)
+        return rate
+
+    def due(self, elapsed, frame_bytes):
+        raise NotImplementedError
+
+    def time_for(self, packets, frame_bytes):
+        raise NotImplementedError
+
+    def scaled(self, factor):
+        raise NotImplementedError
+
+    def target_pps(self, duration, frame_bytes):
+        return self.due(duration, frame_bytes) / duration if duration > 0 else 0.0
+
+    def allowance(self, elapsed, sent, frame_bytes, limit):
+        return max(0, min(limit, int(self.due(elapsed, frame_bytes)) - sent))
+
+    def next_send_time(self, sent, frame_bytes, batch_size):
+        # Wait until a batch worth MIN_SLEEP of traffic is owed, or a full batch at high rates
+        chunk = min(batch_size, max(1, int(self._chunk_rate(frame_bytes) * MIN_SLEEP)))
+        return self.time_for(sent + chunk, frame_bytes)
+
+    def _chunk_rate(self, frame_bytes):
+        return 0.0
+
+
+class ConstantRate(RateProfile):
+    def __init__(self, rate, unit=UNIT_PPS):
+        super().__init__(unit)
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.rate = rate
+
+    def due(self, elapsed, frame_bytes):
+        return self._pps(self.rate, frame_bytes) * elapsed
+
+    def time_for(self, packets, frame_bytes):
+        return packets / self._pps(self.rate, frame_bytes)
+
+    def scaled(self, factor):
+        profile = copy.copy(self)
+        profile.rate = self.rate * factor
+        return profile
+
+    def _chunk_rate(self, frame_bytes):
+        return self._pps(self.rate, frame_bytes)
+
+
+class BurstProfile(RateProfile):
+    # burst_size packets released at the start of every period
+    def __init__(self, burst_size, period):
+        super().__init__(UNIT_PPS)
+        if burst_size < 1 or period <= 0:
+            raise ValueError("Burst size must be at least 1 and period positive")
+        self.burst_size = burst_size
+        self.period = period
+
+    def due(self, elapsed, frame_bytes):
+        return self.burst_size * (math.floor(elapsed / self.period) + 1)
+
+    def time_for(self, packets, frame_bytes):
+        return self.period * max(0, math.ceil(packets / self.burst_size) - 1)
+
+    def next_send_time(self, sent, frame_bytes, batch_size):
+        return self.time_for(sent + 1, frame_bytes)
+
+    def target_pps(self, duration, frame_bytes):
+        # Bursts released in [0, duration), not the one due exactly at the deadline
+        return self.burst_size * math.ceil(duration / self.period) / duration if duration > 0 else 0.0
+
+    def scaled(self, factor):
+        profile = copy.copy(self)
+        profile.burst_size = max(1, round(self.burst_size * factor))
+        return profile
+
+
+class RampProfile(RateProfile):
+    # Rate rises (or falls) linearly from start_rate to end_rate over ramp_time, then holds
+    def __init__(self, start_rate, end_rate, ramp_time, unit=UNIT_PPS):
+        super().__init__(unit)
+        if start_rate < 0 or end_rate <= 0 or ramp_time <= 0:
+            raise ValueError("Ramp rates must be positive and ramp time non-zero")
+        self.start_rate = start_rate
+        self.end_rate = end_rate
+        self.ramp_time = ramp_time
+
+    def due(self, elapsed, frame_bytes):
+        start = self._pps(self.start_rate, frame_bytes)
+        end = self._pps(self.end_rate, frame_bytes)
+        ramp = min(elapsed, self.ramp_time)
+        packets = start * ramp + (end - start) * ramp * ramp / (2 * self.ramp_time)
+        return packets + end * max(0.0, elapsed - self.ramp_time)
+
+    def time_for(self, packets, frame_bytes):
+        start = self._pps(self.start_rate, frame_bytes)
+        end = self._pps(self.end_rate, frame_bytes)
+        ramp_packets = (start + end) * self.ramp_time / 2
+        if packets > ramp_packets:
+            return self.ramp_time + (packets - ramp_packets) / end
+        slope = (end - start) / self.ramp_time
+        if slope == 0:
+            return packets / start
+        # Solve start*t + slope*t^2/2 = packets for t
+        return (-start + math.sqrt(start * start + 2 * slope * packets)) / slope
+
+    def scaled(self, factor):
+        profile = copy.copy(self)
+        profile.start_rate = self.start_rate * factor
+        profile.end_rate = self.end_rate * factor
+        return profile
+
+    def _chunk_rate(self, frame_bytes):
+        return max(self._pps(self.start_rate, frame_bytes), self._pps(self.end_rate, frame_bytes))
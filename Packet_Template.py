@@ -0,0 +1,177 @@
+import socket
+import struct
+import time
+
+from Metrics import REGISTRY
+
+IP_ID_OFFSET = 4
+IP_CHECKSUM_OFFSET = 10
+IP_DESTINATION_OFFSET = 16
+RTP_HEADER_LENGTH = 12
+RTP_TIMESTAMP_STEP = 160  # 20 ms of 8 kHz audio per packet
+TEST_HEADER_LENGTH = 24  # Reflector.TEST_HEADER; shorter packets carry Reflector.SHORT_TEST_HEADER
+
+# Offset of the checksum inside each transport header, keyed by IP protocol number
+L4_CHECKSUM_OFFSETS = {
+    1: 2,    # ICMP
+    6: 16,   # TCP
+    17: 6,   # UDP
+}
+
+
+def internet_checksum(data):
+    if len(data) % 2:
+        data = bytes(data) + b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def build_icmp_echo(destination, identifier=0, sequence=0, payload=b"", source="0.0.0.0", ttl=64):
+    # Raw IPv4 + ICMP echo request; a zero source address is filled in by the kernel
+    icmp = struct.pack("!BBHHH", 8, 0, 0, identifier, sequence) + payload
+    icmp = icmp[:2] + internet_checksum(icmp).to_bytes(2, "big") + icmp[4:]
+    header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(icmp), 0, 0, ttl, 1, 0,
+                         socket.inet_aton(source), socket.inet_aton(destination))
+    header = header[:10] + internet_checksum(header).to_bytes(2, "big") + header[12:]
+    return header + icmp
+
+
+def _adjust_checksum(buf, checksum_offset, old_sum, new_sum, udp=False):
+    # Incremental update from RFC 1624: HC' = ~(~HC + ~m + m')
+    checksum = struct.unpack_from("!H", buf, checksum_offset)[0]
+    if udp and checksum == 0:
+        return  # UDP checksum disabled by the sender, leave it that way
+    total = (~checksum & 0xFFFF) + (~old_sum & 0xFFFF) + new_sum
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    checksum = ~total & 0xFFFF
+    if udp and checksum == 0:
+        checksum = 0xFFFF
+    struct.pack_into("!H", buf, checksum_offset, checksum)
+
+
+def _word_sum(data):
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return total
+
+
+def rewrite_destination(buf, destination):
+    # Point a raw IPv4 packet at `destination` (4 bytes, as from inet_aton) in place,
+    # fixing the IP checksum and the TCP/UDP checksum whose pseudo-header covers it
+    old_sum = _word_sum(buf[IP_DESTINATION_OFFSET:IP_DESTINATION_OFFSET + 4])
+    buf[IP_DESTINATION_OFFSET:IP_DESTINATION_OFFSET + 4] = destination
+    new_sum = _word_sum(destination)
+    _adjust_checksum(buf, IP_CHECKSUM_OFFSET, old_sum, new_sum)
+
+    protocol = buf[9]
+    first_fragment = struct.unpack_from("!H", buf, 6)[0] & 0x1FFF == 0  # Later fragments carry no L4 header
+    checksum_offset = (buf[0] & 0x0F) * 4 + L4_CHECKSUM_OFFSETS.get(protocol, 0)
+    if protocol in (6, 17) and first_fragment and len(buf) >= checksum_offset + 2:
+        _adjust_checksum(buf, checksum_offset, old_sum, new_sum, udp=protocol == 17)
+
+
+class PacketTemplate:
+    # A serialized packet plus the offsets needed to rewrite individual
+    # fields of a copy of it in place, fixing up checksums incrementally.
+    def __init__(self, packet, rtp=False, rtp_timestamp_step=RTP_TIMESTAMP_STEP, test_header_offset=None):
+        self.packet = packet
+        self.frame = bytes(packet)
+        self.ihl = (self.frame[0] & 0x0F) * 4
+        self.protocol = self.frame[9]
+        l4_offset = L4_CHECKSUM_OFFSETS.get(self.protocol)
+        self.l4_checksum_offset = self.ihl + l4_offset if l4_offset is not None else None
+        self.ip_id = struct.unpack_from("!H", self.frame, IP_ID_OFFSET)[0]
+
+        self.rtp_offset = self.ihl + 8 if rtp else None
+        self.rtp_timestamp_step = rtp_timestamp_step
+        if rtp:
+            self.rtp_sequence, self.rtp_timestamp = struct.unpack_from("!HI", self.frame, self.rtp_offset + 2)
+
+        # Reflector test header (magic, stream id, sequence, send time); the first frame sent is sequence 0.
+        # The short header has a 32-bit sequence and no send time.
+        self.test_header_offset = test_header_offset
+        self.short_test_header = (test_header_offset is not None
+                                  and len(self.frame) - test_header_offset < TEST_HEADER_LENGTH)
+        self.sequence = -1
+
+    def __len__(self):
+        return len(self.frame)
+
+    def new_buffer(self):
+        return bytearray(self.frame)
+
+    def patch(self, buf, offset, data):
+        # Overwrite an even-aligned run of bytes and keep every checksum covering it valid
+        old_sum = _word_sum(buf[offset:offset + len(data)])
+        buf[offset:offset + len(data)] = data
+        new_sum = _word_sum(data)
+        if offset < self.ihl:
+            _adjust_checksum(buf, IP_CHECKSUM_OFFSET, old_sum, new_sum)
+        elif self.l4_checksum_offset is not None:
+            _adjust_checksum(buf, self.l4_checksum_offset, old_sum, new_sum, udp=self.protocol == 17)
+
+    def for_flow(self, flow):
+        # Copy of this template on its own flow: the TCP/UDP source port (or ICMP
+        # identifier) is offset by `flow`. The copy holds only bytes, so it pickles cheaply.
+        frame = self.new_buffer()
+        offset = {1: self.ihl + 4, 6: self.ihl, 17: self.ihl}.get(self.protocol)
+        if offset is not None and flow:
+            value = (struct.unpack_from("!H", frame, offset)[0] + flow) & 0xFFFF
+            self.patch(frame, offset, value.to_bytes(2, "big"))
+        if self.test_header_offset is not None and flow:
+            # Each flow numbers its packets from 0, so it reports as its own reflector stream
+            stream_offset = self.test_header_offset + 4
+            stream_id = (struct.unpack_from("!I", frame, stream_offset)[0] + flow) & 0xFFFFFFFF
+            self.patch(frame, stream_offset, stream_id.to_bytes(4, "big"))
+        return PacketTemplate(bytes(frame), rtp=self.rtp_offset is not None, rtp_timestamp_step=self.rtp_timestamp_step,
+                              test_header_offset=self.test_header_offset)
+
+    def for_stream(self, stream_id):
+        # Copy of this test stream template as reflector stream `stream_id`, numbering
+        # its packets from 0 again; the addresses and ports stay as they are
+        frame = self.new_buffer()
+        self.patch(frame, self.test_header_offset + 4, (stream_id & 0xFFFFFFFF).to_bytes(4, "big"))
+        return PacketTemplate(bytes(frame), rtp=self.rtp_offset is not None, rtp_timestamp_step=self.rtp_timestamp_step,
+                              test_header_offset=self.test_header_offset)
+
+    def next_frame(self, buf):
+        # Advance the per-stream fields (IP ID, RTP sequence/timestamp, test header
+        # sequence/send time) in a buffer holding a copy of the frame
+        self.ip_id = (self.ip_id + 1) & 0xFFFF
+        self.patch(buf, IP_ID_OFFSET, self.ip_id.to_bytes(2, "big"))
+        if self.rtp_offset is not None:
+            self.rtp_sequence = (self.rtp_sequence + 1) & 0xFFFF
+            self.rtp_timestamp = (self.rtp_timestamp + self.rtp_timestamp_step) & 0xFFFFFFFF
+            self.patch(buf, self.rtp_offset + 2, struct.pack("!HI", self.rtp_sequence, self.rtp_timestamp))
+        if self.test_header_offset is not None:
+            self.sequence += 1
+            if self.short_test_header:
+                self.patch(buf, self.test_header_offset + 8, struct.pack("!I", self.sequence & 0xFFFFFFFF))
+            else:
+                self.patch(buf, self.test_header_offset + 8, struct.pack("!QQ", self.sequence, time.time_ns()))
+        return buf
+
+
+class TemplateCache:
+    def __init__(self):
+        self._templates = {}
+
+    def get(self, traffic_type, frame_length, destination, build):
+        key = (traffic_type, frame_length, destination)
+        template = self._templates.get(key)
+        if template is None:
+            with REGISTRY.timer("ntg_packet_build_seconds", "Building a packet with scapy",
+                                traffic_type=traffic_type).time():
+                packet = build()
+            with REGISTRY.timer("ntg_packet_serialize_seconds", "Serializing a packet into a template",
+                                traffic_type=traffic_type).time():
+                template = PacketTemplate(packet, rtp=traffic_type == "RTP")
+            self._templates[key] = template
+        return template
+
+    def clear(self):
+        self._templates.clear()
@@ -0,0 +1,328 @@
+import argparse
+import random
+import select
+import socket
+import struct
+import threading
+import time
+
+from Histogram import DEFAULT_PERCENTILES, Histogram
+from Packet_Template import IP_ID_OFFSET, PacketTemplate, build_icmp_echo
+from Probe_Engine import (ICMP_DEST_UNREACHABLE, ICMP_ECHO_REPLY, ICMP_TIME_EXCEEDED, RECEIVE_BUFFER_SIZE, SO_TIMESTAMPNS,
+                          _kernel_timestamp)
+from Send_Engine import FrameBatch, SendEngine
+
+DEFAULT_MAX_HOPS = 30
+DEFAULT_TRACE_ROUNDS = 5
+# Rounds go out this far apart. Routers rate-limit the ICMP errors they send to one
+# host (Linux allows a burst of 6, then one a second), so rounds much closer than
+# this turn into loss that is not there.
+DEFAULT_ROUND_INTERVAL = 0.1
+IP_TTL_OFFSET = 8  # TTL and protocol share the header word at this offset
+TAG_SPACE = 0xFFFF  # Tags are IP IDs from 1 on: an IP ID of 0 is replaced by the kernel
+
+
+class HopResult:
+    def __init__(self, ttl, sent=0):
+        self.ttl = ttl
+        self.sent = sent
+        self.histogram = Histogram()  # RTTs in nanoseconds
+        self.responders = {}  # address -> replies; more than one when the path changed between rounds
+        self.reached = False  # Answered by the target itself rather than a router on the way
+
+    def record(self, address, rtt_ns):
+        self.histogram.record(rtt_ns)
+        self.responders[address] = self.responders.get(address, 0) + 1
+
+    @property
+    def address(self):
+        # The address that answered most often; None for a silent hop
+        return max(self.responders, key=self.responders.get) if self.responders else None
+
+    @property
+    def received(self):
+        return self.histogram.count
+
+    @property
+    def loss_percentage(self):
+        return (self.sent - self.received) / self.sent * 100 if self.sent else 0.0
+
+    def summary(self, percents=DEFAULT_PERCENTILES):
+        # Numeric results in seconds and percent; latencies are None for a silent hop
+        received = self.received
+        summary = {
+            "ttl": self.ttl,
+            "address": self.address,
+            "responders": len(self.responders),
+            "sent": self.sent,
+            "received": received,
+            "packet_loss": self.loss_percentage,
+            "average_latency": self.histogram.mean / 1_000_000_000 if received else None,
+            "min_latency": self.histogram.min / 1_000_000_000 if received else None,
+            "max_latency": self.histogram.max / 1_000_000_000 if received else None,
+        }
+        for percent in percents:
+            summary[f"p{percent:g}"] = self.histogram.percentile(percent) / 1_000_000_000 if received else None
+        return summary
+
+
+class PathResult:
+    def __init__(self, traffic_type, hops):
+        self.traffic_type = traffic_type
+        self.hops = hops  # HopResult per TTL from 1, up to the target when it answered
+
+    @property
+    def reached(self):
+        return bool(self.hops) and self.hops[-1].reached
+
+    def summary(self):
+        return {"reached": self.reached, "hops": [hop.summary() for hop in self.hops]}
+
+
+def _flow_key(protocol, transport):
+    # What tells a probe's flow from other tests' packets to the same target: the
+    # ICMP identifier, or the TCP/UDP ports
+    if protocol == socket.IPPROTO_ICMP:
+        return protocol, bytes(transport[4:6])
+    if protocol in (socket.IPPROTO_TCP, socket.IPPROTO_UDP):
+        return protocol, bytes(transport[:4])
+    return protocol, b""
+
+
+class _TraceProbe:
+    __slots__ = ("hop", "flow", "sent_ns", "answered")
+
+    def __init__(self, hop, flow):
+        self.hop = hop
+        self.flow = flow
+        self.sent_ns = 0
+        self.answered = False
+
+
+class PathTrace:
+    # Traceroute with every TTL in flight at once: each round sends one probe per
+    # TTL and traffic type in a single sendmmsg() batch, and one receiver collects
+    # the ICMP time-exceeded replies of the routers on the way. A 30 hop trace so
+    # takes about one timeout rather than 30 of them.
+    #
+    # Probes keep the addresses and ports of their traffic type's template, so
+    # they are routed (and load-balanced) like that traffic. They are told apart by
+    # their IP ID, which routers quote back in their ICMP errors. The target's own
+    # answer is matched by the ICMP echo sequence (set so the ICMP checksum stays
+    # the same, as load balancers may hash it), by the quoted IP ID of a
+    # port-unreachable, or by the acknowledgment of a TCP RST/SYN-ACK. A UDP service
+    # that answers its probes cannot be told apart by TTL, so such a trace ends at
+    # the last router.
+    def __init__(self, network_ip, templates, max_hops=DEFAULT_MAX_HOPS, rounds=DEFAULT_TRACE_ROUNDS,
+                 interval=DEFAULT_ROUND_INTERVAL, timeout=1.0):
+        if not 1 <= max_hops <= 255 or rounds < 1:
+            raise ValueError("Hops must be 1 to 255 and rounds at least 1")
+        if len(templates) * rounds * max_hops > TAG_SPACE:
+            raise ValueError("Too many probes in one trace: fewer traffic types, rounds or hops")
+        self.network_ip = network_ip
+        self.templates = templates
+        self.max_hops = max_hops
+        self.rounds = rounds
+        self.interval = interval
+        self.timeout = timeout
+        self.target = socket.inet_aton(socket.gethostbyname(network_ip))
+        self._tag_base = random.randrange(TAG_SPACE)
+        self._probes = {}  # tag -> _TraceProbe
+        self._hops = {}
+        self._flows = {}  # traffic type -> (source port, destination port) of TCP templates
+        self._tcp_payload = {}
+        self._answered = 0
+        self._lock = threading.Lock()
+        self._running = False
+
+    def run(self, stop_event=None):
+        # Returns {traffic_type: PathResult}. Setting stop_event ends the trace after the current round.
+        self._hops = {traffic_type: [HopResult(ttl) for ttl in range(1, self.max_hops + 1)]
+                      for traffic_type in self.templates}
+        self._probes = {}
+        self._answered = 0
+        batches = {traffic_type: self._build_batch(traffic_type, template)
+                   for traffic_type, template in self.templates.items()}
+        protocols = {template.protocol for template in self.templates.values()} | {socket.IPPROTO_ICMP}
+        receivers = [self._open_receiver(protocol) for protocol in protocols if protocol != socket.IPPROTO_UDP]
+        self._running = True
+        receiver_thread = threading.Thread(target=self._receive_loop, args=(receivers,), daemon=True)
+        receiver_thread.start()
+
+        sent = 0
+        try:
+            with SendEngine(self.network_ip) as engine:
+                start_time = time.monotonic()
+                for round_index in range(self.rounds):
+                    if stop_event is not None and stop_event.is_set():
+                        break
+                    delay = start_time + round_index * self.interval - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    for type_index, (traffic_type, batch) in enumerate(batches.items()):
+                        sent += self._send_round(engine, traffic_type, batch, type_index, round_index)
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline and self._answered < sent:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                time.sleep(min(0.01, self.timeout))
+        finally:
+            self._running = False
+            receiver_thread.join()
+            for receiver in receivers:
+                receiver.close()
+
+        results = {}
+        for traffic_type, hops in self._hops.items():
+            # Past the first hop the target answered, every hop is the target again
+            reached = next((hop.ttl for hop in hops if hop.reached), None)
+            results[traffic_type] = PathResult(traffic_type, hops[:reached] if reached else hops)
+        return results
+
+    def _build_batch(self, traffic_type, template):
+        # One frame per TTL; tags are written before each round
+        frames = []
+        for ttl in range(1, self.max_hops + 1):
+            frame = template.new_buffer()
+            template.patch(frame, IP_TTL_OFFSET, bytes((ttl, template.protocol)))
+            frames.append(frame)
+        if template.protocol == socket.IPPROTO_TCP:
+            self._flows[traffic_type] = struct.unpack_from("!HH", template.frame, template.ihl)
+            data_offset = (template.frame[template.ihl + 12] >> 4) * 4
+            self._tcp_payload[traffic_type] = len(template.frame) - template.ihl - data_offset
+        batch = FrameBatch(frames, (self.network_ip, 0))
+        batch.templates = [template] * len(frames)
+        return batch
+
+    def _tag(self, key):
+        return 1 + (self._tag_base + key) % TAG_SPACE
+
+    def _send_round(self, engine, traffic_type, batch, type_index, round_index):
+        template = batch.templates[0]
+        ihl = template.ihl
+        flow = _flow_key(template.protocol, template.frame[ihl:])
+        probes = []
+        for index, buffer in enumerate(batch.buffers):
+            tag = self._tag((type_index * self.rounds + round_index) * self.max_hops + index)
+            template.patch(buffer, IP_ID_OFFSET, tag.to_bytes(2, "big"))
+            if template.protocol == socket.IPPROTO_ICMP and len(buffer) >= ihl + 10:
+                # Sequence plus first payload word stay 0xFFFF, and with them the checksum
+                template.patch(buffer, ihl + 6, tag.to_bytes(2, "big"))
+                template.patch(buffer, ihl + 8, (0xFFFF - tag).to_bytes(2, "big"))
+            elif template.protocol == socket.IPPROTO_TCP:
+                template.patch(buffer, ihl + 4, tag.to_bytes(4, "big"))
+            probes.append((tag, _TraceProbe(self._hops[traffic_type][index], flow)))
+
+        sent_ns = time.time_ns()  # Wall clock, to pair with the kernel's receive timestamps
+        with self._lock:
+            for tag, probe in probes:
+                probe.sent_ns = sent_ns
+                probe.hop.sent += 1
+                self._probes[tag] = probe
+        engine.send_batch(batch)
+        return len(probes)
+
+    def _open_receiver(self, protocol):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, protocol)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        except OSError:
+            pass
+        sock.setblocking(False)
+        return sock
+
+    def _receive_loop(self, receivers):
+        while self._running:
+            readable, _, _ = select.select(receivers, [], [], 0.05)
+            for sock in readable:
+                while True:
+                    try:
+                        packet, ancdata, _, _ = sock.recvmsg(65535, 64)
+                    except BlockingIOError:
+                        break
+                    received_ns = _kernel_timestamp(ancdata) or time.time_ns()
+                    match = self._parse_reply(packet)
+                    if match is not None:
+                        self._complete(*match, packet[12:16], received_ns)
+
+    def _parse_reply(self, packet):
+        # Returns (tag, whether the target itself answered, flow key) for replies to
+        # our probes. Tests running alongside probe the same target, so a tag only
+        # counts together with the flow it was sent on.
+        if len(packet) < 20:
+            return None
+        ihl = (packet[0] & 0x0F) * 4
+        protocol = packet[9]
+        from_target = packet[12:16] == self.target
+
+        if protocol == socket.IPPROTO_ICMP and len(packet) >= ihl + 8:
+            icmp_type = packet[ihl]
+            if icmp_type == ICMP_ECHO_REPLY and from_target:
+                return struct.unpack_from("!H", packet, ihl + 6)[0], True, _flow_key(protocol, packet[ihl:])
+            if icmp_type in (ICMP_DEST_UNREACHABLE, ICMP_TIME_EXCEEDED):
+                quoted = packet[ihl + 8:]
+                if len(quoted) < 20 or quoted[16:20] != self.target:
+                    return None
+                quoted_ihl = (quoted[0] & 0x0F) * 4
+                if len(quoted) < quoted_ihl + 8:  # Every router quotes at least 8 bytes past the IP header
+                    return None
+                return (struct.unpack_from("!H", quoted, IP_ID_OFFSET)[0], from_target,
+                        _flow_key(quoted[9], quoted[quoted_ihl:]))
+            return None
+
+        if protocol == socket.IPPROTO_TCP and from_target and len(packet) >= ihl + 14:
+            ports = struct.unpack_from("!HH", packet, ihl)
+            acknowledged = struct.unpack_from("!I", packet, ihl + 8)[0]
+            syn_ack = packet[ihl + 13] & 0x02
+            for traffic_type, (source_port, destination_port) in self._flows.items():
+                if ports != (destination_port, source_port):
+                    continue
+                # A SYN-ACK acknowledges the SYN only, a RST the SYN and its data as well
+                tag = (acknowledged - 1 - (0 if syn_ack else self._tcp_payload[traffic_type])) & 0xFFFFFFFF
+                probe = self._probes.get(tag)
+                if probe is not None:
+                    return tag, True, probe.flow
+        return None
+
+    def _complete(self, tag, from_target, flow, address, received_ns):
+        with self._lock:
+            probe = self._probes.get(tag)
+            if probe is None or probe.answered or probe.flow != flow:
+                return
+            probe.answered = True
+            self._answered += 1
+        probe.hop.record(socket.inet_ntoa(address), max(0, received_ns - probe.sent_ns))
+        if from_target:
+            probe.hop.reached = True
+
+
+def format_path(traffic_type, summary):
+    # Report lines for a PathResult.summary(): one per hop, like mtr
+    hops = summary["hops"]
+    state = f"reached in {len(hops)} hop{'s' if len(hops) > 1 else ''}" if summary["reached"] else "target not reached"
+    lines = [f"{traffic_type} path ({state}):"]
+    for hop in hops:
+        if not hop["received"]:
+            lines.append(f"{hop['ttl']:>3}  *  0/{hop['sent']} replies")
+            continue
+        address = hop["address"] + (f" (+{hop['responders'] - 1} more)" if hop["responders"] > 1 else "")
+        lines.append(f"{hop['ttl']:>3}  {address}  {hop['received']}/{hop['sent']} replies, {hop['packet_loss']:.0f}% loss, "
+                     f"p50/p90/max {hop['p50']:.6f} / {hop['p90']:.6f} / {hop['max_latency']:.6f} seconds")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trace the path to a host with every TTL probed at once (ICMP echo)")
+    parser.add_argument("target")
+    parser.add_argument("--max-hops", type=int, default=DEFAULT_MAX_HOPS)
+    parser.add_argument("--rounds", type=int, default=DEFAULT_TRACE_ROUNDS)
+    parser.add_argument("--interval", type=float, default=DEFAULT_ROUND_INTERVAL, help="Seconds between rounds")
+    parser.add_argument("--timeout", type=float, default=1.0)
+    args = parser.parse_args()
+    template = PacketTemplate(build_icmp_echo(args.target, random.getrandbits(16), 0, bytes(32)))
+    started = time.monotonic()
+    trace = PathTrace(args.target, {"ICMP": template}, args.max_hops, args.rounds, args.interval, args.timeout)
+    for line in format_path("ICMP", trace.run()["ICMP"].summary()):
+        print(line)
+    print(f"Traced in {time.monotonic() - started:.2f} seconds")
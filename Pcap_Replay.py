@@ -0,0 +1,365 @@
+import argparse
+import mmap
+import socket
+import struct
+import time
+
+from Histogram import Histogram
+from Packet_Template import IP_DESTINATION_OFFSET, rewrite_destination
+from Send_Engine import BATCH_SIZE, FrameBatch, SendEngine
+
+# Classic pcap magic numbers (as read little-endian) and their timestamp resolution
+_PCAP_MAGICS = {
+    0xA1B2C3D4: ("<", 1000),
+    0xD4C3B2A1: (">", 1000),
+    0xA1B23C4D: ("<", 1),
+    0x4D3CB2A1: (">", 1),
+}
+_PCAPNG_SECTION_HEADER = 0x0A0D0D0A
+_PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+_PCAPNG_INTERFACE = 1
+_PCAPNG_PACKET = 2  # Obsolete, still written by old tools
+_PCAPNG_SIMPLE_PACKET = 3
+_PCAPNG_ENHANCED_PACKET = 6
+_PCAPNG_OPTION_TSRESOL = 9
+_PCAPNG_OPTION_TSOFFSET = 14
+
+# Link types we can find an IPv4 packet in
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+_ETHERTYPE_IPV4 = 0x0800
+_VLAN_ETHERTYPES = (0x8100, 0x88A8)
+
+# Pages behind the read position are handed back to the kernel this often, so the
+# resident size of a replay stays flat however large the capture is
+DROP_BEHIND_BYTES = 64 << 20
+
+# Packets due within this much of each other go out in one sendmmsg() batch
+BATCH_WINDOW_NS = 100_000
+
+
+class PcapReader:
+    # Streams IPv4 packets out of a pcap or pcapng file through a read-only memory
+    # map. Packets are memoryviews into the map: copy what must outlive the next one.
+    def __init__(self, path):
+        self.path = path
+        self.packets_read = 0
+        self.skipped = 0  # Not IPv4, an unknown link type, or truncated by the capture's snap length
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self._file.close()
+            raise ValueError(f"{path} is empty")
+        if hasattr(self._map, "madvise"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        self._dropped = 0
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        # Yields (capture timestamp in ns, IPv4 packet)
+        data = self._map
+        if len(data) < 24:
+            raise ValueError(f"{self.path} is not a pcap or pcapng file")
+        magic = struct.unpack_from("<I", data)[0]
+        if magic in _PCAP_MAGICS:
+            records = self._pcap_records(data, *_PCAP_MAGICS[magic])
+        elif magic == _PCAPNG_SECTION_HEADER:
+            records = self._pcapng_records(data)
+        else:
+            raise ValueError(f"{self.path} is not a pcap or pcapng file")
+
+        view = memoryview(data)
+        try:
+            for timestamp_ns, linktype, start, captured, _ in records:
+                self._drop_behind(start)
+                packet = _ipv4_packet(view[start:start + captured], linktype)
+                if packet is None:
+                    self.skipped += 1
+                    continue
+                self.packets_read += 1
+                yield timestamp_ns, packet
+        finally:
+            view.release()
+
+    def _drop_behind(self, position):
+        if position - self._dropped < DROP_BEHIND_BYTES or not hasattr(self._map, "madvise"):
+            return
+        end = position - position % mmap.PAGESIZE
+        self._map.madvise(mmap.MADV_DONTNEED, self._dropped, end - self._dropped)
+        self._dropped = end
+
+    @staticmethod
+    def _pcap_records(data, order, ns_per_unit):
+        # Yields (timestamp ns, link type, offset, captured length, original length)
+        linktype = struct.unpack_from(order + "I", data, 20)[0] & 0xFFFF
+        record = struct.Struct(order + "IIII")
+        position = 24
+        while position + record.size <= len(data):
+            seconds, fraction, captured, original = record.unpack_from(data, position)
+            position += record.size
+            if position + captured > len(data):
+                return  # Capture cut off mid-packet
+            yield seconds * 1_000_000_000 + fraction * ns_per_unit, linktype, position, captured, original
+            position += captured
+
+    @staticmethod
+    def _pcapng_records(data):
+        order = "<"
+        interfaces = []  # (link type, snap length, ns per tick as a fraction, offset in ns)
+        timestamp_ns = 0
+        position = 0
+        while position + 12 <= len(data):
+            block_type = struct.unpack_from(order + "I", data, position)[0]
+            if block_type == _PCAPNG_SECTION_HEADER:
+                # Every section sets its own byte order and starts a new list of interfaces
+                order = "<" if struct.unpack_from("<I", data, position + 8)[0] == _PCAPNG_BYTE_ORDER_MAGIC else ">"
+                interfaces = []
+            length = struct.unpack_from(order + "I", data, position + 4)[0]
+            if length < 12 or position + length > len(data):
+                return
+            body = position + 8
+            end = position + length - 4
+
+            if block_type == _PCAPNG_INTERFACE:
+                linktype, _, snaplen = struct.unpack_from(order + "HHI", data, body)
+                interfaces.append((linktype, snaplen) + _pcapng_resolution(data, order, body + 8, end))
+            elif block_type in (_PCAPNG_ENHANCED_PACKET, _PCAPNG_PACKET):
+                if block_type == _PCAPNG_ENHANCED_PACKET:
+                    interface, high, low, captured, original = struct.unpack_from(order + "IIIII", data, body)
+                else:
+                    interface, _, high, low, captured, original = struct.unpack_from(order + "HHIIII", data, body)
+                if interface < len(interfaces):
+                    linktype, _, (numerator, denominator), offset_ns = interfaces[interface]
+                    timestamp_ns = ((high << 32) | low) * numerator // denominator + offset_ns
+                    yield timestamp_ns, linktype, body + 20, min(captured, end - body - 20), original
+            elif block_type == _PCAPNG_SIMPLE_PACKET and interfaces:
+                # No timestamp: it goes out right after the packet before it
+                linktype, snaplen = interfaces[0][:2]
+                original = struct.unpack_from(order + "I", data, body)[0]
+                captured = min(original, snaplen or original, end - body - 4)
+                yield timestamp_ns, linktype, body + 4, captured, original
+            position += length
+
+
+def _pcapng_resolution(data, order, position, end):
+    # if_tsresol and if_tsoffset options -> ((ns per tick as numerator, denominator), offset ns)
+    resolution = (1000, 1)  # Microseconds unless the interface says otherwise
+    offset_ns = 0
+    while position + 4 <= end:
+        code, length = struct.unpack_from(order + "HH", data, position)
+        value = position + 4
+        if code == 0:
+            break
+        if code == _PCAPNG_OPTION_TSRESOL and length >= 1:
+            exponent = data[value]
+            if exponent & 0x80:
+                resolution = (1_000_000_000, 1 << (exponent & 0x7F))
+            else:
+                resolution = (1_000_000_000, 10 ** exponent)
+        elif code == _PCAPNG_OPTION_TSOFFSET and length >= 8:
+            offset_ns = struct.unpack_from(order + "q", data, value)[0] * 1_000_000_000
+        position = value + (length + 3) // 4 * 4
+    return resolution, offset_ns
+
+
+def _ipv4_packet(frame, linktype):
+    # The IPv4 packet inside a link-layer frame, trimmed to its total length (Ethernet
+    # pads short frames); None when there is none or the capture cut it short
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 14
+        if len(frame) < offset:
+            return None
+        ethertype = struct.unpack_from("!H", frame, 12)[0]
+        while ethertype in _VLAN_ETHERTYPES and len(frame) >= offset + 4:
+            ethertype = struct.unpack_from("!H", frame, offset + 2)[0]
+            offset += 4
+        if ethertype != _ETHERTYPE_IPV4:
+            return None
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+        offset = 0
+    elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        offset = 4  # Address family, in an order that depends on the capturing host
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if len(frame) < 16 or struct.unpack_from("!H", frame, 14)[0] != _ETHERTYPE_IPV4:
+            return None
+        offset = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if len(frame) < 20 or struct.unpack_from("!H", frame, 0)[0] != _ETHERTYPE_IPV4:
+            return None
+        offset = 20
+    else:
+        return None
+
+    if len(frame) < offset + 20 or frame[offset] >> 4 != 4:
+        return None
+    total_length = struct.unpack_from("!H", frame, offset + 2)[0]
+    if total_length < 20 or len(frame) < offset + total_length:
+        return None  # Truncated by the snap length: the wire packet cannot be rebuilt
+    return frame[offset:offset + total_length]
+
+
+class ReplayStats:
+    def __init__(self):
+        self.packets = 0
+        self.bytes_sent = 0
+        self.syscalls = 0
+        self.skipped = 0
+        self.elapsed = 0.0
+        self.capture_duration = 0.0  # Span of the replayed packets' capture timestamps
+        self.speed = None  # Timing scale factor; None when replayed as fast as possible
+        self.timing_error = Histogram()  # Per packet: distance of its send time from its scheduled time, ns
+
+    @property
+    def pps(self):
+        return self.packets / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def mbps(self):
+        return self.bytes_sent * 8 / self.elapsed / 1_000_000 if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        # Numeric results; timing errors in seconds
+        summary = {
+            "packets": self.packets,
+            "bytes": self.bytes_sent,
+            "skipped": self.skipped,
+            "elapsed": self.elapsed,
+            "capture_duration": self.capture_duration,
+            "speed": self.speed,
+            "pps": self.pps,
+            "mbps": self.mbps,
+        }
+        if self.speed is not None:
+            summary["timing_error_average"] = self.timing_error.mean / 1_000_000_000
+            for percent in (50, 99):
+                summary[f"timing_error_p{percent}"] = self.timing_error.percentile(percent) / 1_000_000_000
+            summary["timing_error_max"] = (self.timing_error.max or 0) / 1_000_000_000
+        return summary
+
+
+class PcapReplay:
+    # Replays a capture's IPv4 packets through a raw socket. speed scales the
+    # capture's timing (1 = original, 10 = ten times faster); None sends as fast as
+    # possible. With rewrite, every packet goes to network_ip with its checksums
+    # fixed; otherwise each keeps its captured destination. Packets over `mtu` (as
+    # captured after GRO/TSO coalescing) cannot leave a raw socket and are skipped.
+    def __init__(self, path, network_ip, speed=1.0, rewrite=True, batch_size=BATCH_SIZE, mtu=1500):
+        if speed is not None and speed <= 0:
+            raise ValueError("Replay speed must be positive, or None for full speed")
+        self.path = path
+        self.network_ip = socket.gethostbyname(network_ip)
+        self.speed = speed
+        self.rewrite = rewrite
+        self.batch_size = batch_size
+        self.mtu = mtu
+        self._destination = socket.inet_aton(self.network_ip)
+
+    def run(self, stop_event=None, on_batch=None):
+        # on_batch(packets, bytes) after every batch; setting stop_event ends the replay
+        stats = ReplayStats()
+        stats.speed = self.speed
+        pending = []  # Packets of the next batch: (scheduled monotonic ns, view into the capture)
+        first_timestamp = last_timestamp = None
+        start_ns = None
+        oversized = 0
+        with PcapReader(self.path) as reader, SendEngine(self.network_ip, self.batch_size) as engine:
+            packets = iter(reader)
+            try:
+                for timestamp_ns, packet in packets:
+                    if stop_event is not None and stop_event.is_set():
+                        break
+                    if len(packet) > self.mtu:
+                        oversized += 1
+                        continue
+                    if first_timestamp is None:
+                        first_timestamp = timestamp_ns
+                        start_ns = time.monotonic_ns()
+                    last_timestamp = timestamp_ns
+                    scheduled_ns = start_ns
+                    if self.speed is not None:
+                        scheduled_ns += int(max(0, timestamp_ns - first_timestamp) / self.speed)
+
+                    # Flush once the batch is full or this packet is due noticeably later than it
+                    if pending and (len(pending) >= self.batch_size or
+                                    scheduled_ns - pending[0][0] > BATCH_WINDOW_NS):
+                        self._send(engine, pending, stats, stop_event, on_batch)
+                        pending = []
+                    pending.append((scheduled_ns, packet))
+                if pending and not (stop_event is not None and stop_event.is_set()):
+                    self._send(engine, pending, stats, stop_event, on_batch)
+            finally:
+                # The map cannot close while views into it are alive
+                pending = packet = None
+                packets.close()
+            stats.skipped = reader.skipped + oversized
+        if start_ns is not None:
+            stats.elapsed = (time.monotonic_ns() - start_ns) / 1_000_000_000
+            stats.capture_duration = (last_timestamp - first_timestamp) / 1_000_000_000
+        return stats
+
+    def _send(self, engine, pending, stats, stop_event, on_batch):
+        delay = (pending[0][0] - time.monotonic_ns()) / 1_000_000_000
+        if delay > 0:
+            if stop_event is not None:
+                if stop_event.wait(delay):  # Quiet stretches of a capture stay cancellable
+                    return
+            else:
+                time.sleep(delay)
+
+        batch = FrameBatch([packet for _, packet in pending], (self.network_ip, 0))  # The one copy of each packet
+        for index, buffer in enumerate(batch.buffers):
+            if self.rewrite:
+                rewrite_destination(buffer, self._destination)
+            else:
+                batch.set_destination(index, socket.inet_ntoa(buffer[IP_DESTINATION_OFFSET:IP_DESTINATION_OFFSET + 4]))
+        sent_ns = time.monotonic_ns()
+        stats.syscalls += engine.send_batch(batch)
+        stats.packets += len(batch)
+        stats.bytes_sent += batch.total_bytes
+        if self.speed is not None:
+            for scheduled_ns, _ in pending:
+                stats.timing_error.record(abs(sent_ns - scheduled_ns))
+        if on_batch is not None:
+            on_batch(len(batch), batch.total_bytes)
+
+
+def replay_speed(value):
+    # "2", "2x" or "10x"; "max" or 0 for full speed
+    value = value.lower()
+    if value in ("max", "0", "0x"):
+        return None
+    return float(value.rstrip("x"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the IPv4 packets of a pcap or pcapng capture")
+    parser.add_argument("capture")
+    parser.add_argument("network_ip", help="Host to send the packets to")
+    parser.add_argument("--speed", type=replay_speed, default=1.0,
+                        help="Timing scale factor such as 1, 2x or 10x; max sends as fast as possible")
+    parser.add_argument("--keep-destination", action="store_true",
+                        help="Send each packet to its captured destination instead of network_ip")
+    args = parser.parse_args()
+    replay = PcapReplay(args.capture, args.network_ip, args.speed, rewrite=not args.keep_destination)
+    result = replay.run()
+    print(f"Replayed {result.packets} packets ({result.skipped} skipped) in {result.elapsed:.2f} seconds: "
+          f"{result.mbps:.2f} Mbps, {result.pps:.0f} pps")
+    if result.speed is not None:
+        summary = result.summary()
+        print(f"Timing error p50/p99/max: {summary['timing_error_p50']:.6f} / {summary['timing_error_p99']:.6f} / "
+              f"{summary['timing_error_max']:.6f} seconds")
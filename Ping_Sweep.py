@@ -0,0 +1,225 @@
+import argparse
+import ipaddress
+import random
+import select
+import socket
+import struct
+import threading
+import time
+from array import array
+
+from Packet_Template import IP_DESTINATION_OFFSET, PacketTemplate, build_icmp_echo
+from Send_Engine import BATCH_SIZE, FrameBatch, SendEngine
+
+ICMP_ECHO_REPLY = 0
+MAX_SWEEP_HOSTS = 1 << 20
+DEFAULT_SWEEP_COUNT = 3
+DEFAULT_PAYLOAD_SIZE = 32
+
+
+def expand_targets(spec):
+    # "10.1.0.0/22,10.2.0.5,router.example" -> unique IPv4 addresses in order;
+    # networks yield their usable hosts, without network and broadcast addresses
+    hosts = {}
+    for part in spec.split(",") if isinstance(spec, str) else spec:
+        part = part.strip()
+        if not part:
+            continue
+        if "/" in part:
+            network = ipaddress.IPv4Network(part, strict=False)
+            addresses = [str(host) for host in network.hosts()] if network.num_addresses > 1 else [str(network[0])]
+        else:
+            addresses = [socket.gethostbyname(part)]
+        hosts.update(dict.fromkeys(addresses))
+        if len(hosts) > MAX_SWEEP_HOSTS:
+            raise ValueError(f"More than {MAX_SWEEP_HOSTS} hosts in {spec!r}")
+    return list(hosts)
+
+
+class HostPingResult:
+    def __init__(self, host, rtts):
+        self.host = host
+        self.rtts = rtts  # Per-echo RTT in seconds, None when lost
+        self.sent = len(rtts)
+
+    @property
+    def latencies(self):
+        return [rtt for rtt in self.rtts if rtt is not None]
+
+    @property
+    def received(self):
+        return len(self.latencies)
+
+    @property
+    def alive(self):
+        return self.received > 0
+
+    @property
+    def loss_percentage(self):
+        return (self.sent - self.received) / self.sent * 100 if self.sent else 0.0
+
+    @property
+    def average_latency(self):
+        latencies = self.latencies
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def summary(self):
+        # Numeric results in seconds and percent; latencies are None for a silent host
+        latencies = self.latencies
+        return {
+            "sent": self.sent,
+            "received": len(latencies),
+            "packet_loss": self.loss_percentage,
+            "average_latency": self.average_latency,
+            "min_latency": min(latencies) if latencies else None,
+            "max_latency": max(latencies) if latencies else None,
+        }
+
+
+class PingSweep:
+    # Pings many hosts through one raw socket pair: echoes to all hosts go out in
+    # sendmmsg() batches with a per-frame destination, and one receive loop
+    # demultiplexes the replies. Echo `key = round * hosts + host index` is spread
+    # over the ICMP identifier (high bits, offset by a random base) and sequence
+    # number (low 16 bits), so every echo of the sweep is unique.
+    def __init__(self, hosts, count=DEFAULT_SWEEP_COUNT, rate=10000, batch_size=BATCH_SIZE, timeout=1.0,
+                 payload_size=DEFAULT_PAYLOAD_SIZE):
+        self.hosts = list(hosts)
+        if not self.hosts:
+            raise ValueError("No hosts to sweep")
+        self.count = count
+        self.rate = rate
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.payload_size = payload_size
+        self.icmp_id_base = random.getrandbits(16)
+        self.echoes_sent = 0
+        self.elapsed = 0.0
+
+        self._addresses = [socket.inet_aton(host) for host in self.hosts]
+        self._total = len(self.hosts) * count
+        self._sent_ns = array("q", [0]) * self._total
+        self._rtt_ns = array("q", [-1]) * self._total
+        self._received = 0
+        self._lock = threading.Lock()
+        self._running = False
+        self._stop_event = None
+
+    @property
+    def sweep_rate(self):
+        return self.echoes_sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def run(self, stop_event=None):
+        # Returns {host: HostPingResult}. Setting stop_event ends the sweep after the current batch.
+        self._stop_event = stop_event
+        receiver = self._open_receiver()
+        self._running = True
+        receiver_thread = threading.Thread(target=self._receive_loop, args=(receiver,), daemon=True)
+        receiver_thread.start()
+
+        start_time = time.monotonic()
+        try:
+            with SendEngine(self.hosts[0]) as engine:
+                self._send_all(engine)
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline and self._received < self.echoes_sent and not self._stopped():
+                time.sleep(min(0.05, self.timeout))
+        finally:
+            self._running = False
+            receiver_thread.join()
+            receiver.close()
+        self.elapsed = time.monotonic() - start_time
+
+        hosts = len(self.hosts)
+        results = {}
+        for index, host in enumerate(self.hosts):
+            rtts = []
+            for key in range(index, self.echoes_sent, hosts):
+                rtt_ns = self._rtt_ns[key]
+                rtts.append(rtt_ns / 1_000_000_000 if rtt_ns >= 0 else None)
+            results[host] = HostPingResult(host, rtts)
+        return results
+
+    def _send_all(self, engine):
+        template = PacketTemplate(build_icmp_echo(self.hosts[0], self.icmp_id_base, 0, bytes(self.payload_size)))
+        batch = FrameBatch([template.frame] * self.batch_size, (self.hosts[0], 0))
+        hosts = len(self.hosts)
+        sweep_start = time.monotonic()
+        for first in range(0, self._total, self.batch_size):
+            if self._stopped():
+                break
+            keys = range(first, min(first + self.batch_size, self._total))
+            for buffer_index, key in enumerate(keys):
+                host_index = key % hosts
+                buffer = batch.buffers[buffer_index]
+                template.patch(buffer, IP_DESTINATION_OFFSET, self._addresses[host_index])
+                template.patch(buffer, template.ihl + 4, struct.pack("!HH", *self._tag(key)))
+                batch.set_destination(buffer_index, self.hosts[host_index])
+            sent_ns = time.monotonic_ns()
+            for key in keys:
+                self._sent_ns[key] = sent_ns
+            engine.send_batch(batch, len(keys))
+            self.echoes_sent = keys.stop
+
+            # Rate limit per batch rather than per echo
+            delay = sweep_start + self.echoes_sent / self.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _tag(self, key):
+        return (self.icmp_id_base + (key >> 16)) & 0xFFFF, key & 0xFFFF
+
+    def _key(self, identifier, sequence):
+        return ((identifier - self.icmp_id_base) & 0xFFFF) << 16 | sequence
+
+    def _stopped(self):
+        return self._stop_event is not None and self._stop_event.is_set()
+
+    def _open_receiver(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        sock.setblocking(False)
+        return sock
+
+    def _receive_loop(self, receiver):
+        while self._running:
+            readable, _, _ = select.select([receiver], [], [], 0.05)
+            if not readable:
+                continue
+            while True:
+                try:
+                    packet = receiver.recv(65535)
+                except BlockingIOError:
+                    break
+                self._handle_reply(packet, time.monotonic_ns())
+
+    def _handle_reply(self, packet, received_ns):
+        if len(packet) < 20:
+            return
+        ihl = (packet[0] & 0x0F) * 4
+        if packet[9] != socket.IPPROTO_ICMP or len(packet) < ihl + 8 or packet[ihl] != ICMP_ECHO_REPLY:
+            return
+        key = self._key(*struct.unpack_from("!HH", packet, ihl + 4))
+        # The reply must come from the host the echo went to; later duplicates are ignored
+        if key >= self._total or not self._sent_ns[key] or packet[12:16] != self._addresses[key % len(self.hosts)]:
+            return
+        with self._lock:
+            if self._rtt_ns[key] < 0:
+                self._rtt_ns[key] = received_ns - self._sent_ns[key]
+                self._received += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ping every host of CIDR blocks or host lists")
+    parser.add_argument("targets", help="Comma-separated CIDR blocks, addresses or host names")
+    parser.add_argument("--count", type=int, default=DEFAULT_SWEEP_COUNT, help="Echoes per host")
+    parser.add_argument("--rate", type=int, default=10000, help="Echoes per second")
+    parser.add_argument("--timeout", type=float, default=1.0)
+    args = parser.parse_args()
+    sweep = PingSweep(expand_targets(args.targets), args.count, args.rate, timeout=args.timeout)
+    results = sweep.run()
+    for host, result in results.items():
+        if result.alive:
+            print(f"{host}: {result.received}/{result.sent} replies, average {result.average_latency:.6f} seconds")
+    alive = sum(result.alive for result in results.values())
+    print(f"{alive} of {len(results)} hosts answered, {sweep.echoes_sent} echoes in {sweep.elapsed:.2f} seconds")
@@ -0,0 +1,223 @@
+import random
+import select
+import socket
+import struct
+import threading
+import time
+
+from Packet_Template import PacketTemplate
+from Probe_Engine import PROBE_PORT_BASE, PROBE_TAG_BLOCKS, PROBE_TAG_SPACE
+from Send_Engine import BATCH_SIZE, FrameBatch, SendEngine
+
+PORT_OPEN = "open"
+PORT_CLOSED = "closed"
+PORT_FILTERED = "filtered"
+
+# One byte of state per port and host; 0 means the probe is still outstanding
+_PENDING = 0
+_NOT_SCANNED = 0xFF
+_STATES = {1: PORT_OPEN, 2: PORT_CLOSED, 3: PORT_FILTERED}
+_OPEN, _CLOSED, _FILTERED = 1, 2, 3
+
+# Scans run next to probe engines, so the source port comes from above their tag
+# blocks; that is above Linux's default ephemeral ports (to 60999) as well
+SCAN_PORT_BASE = PROBE_PORT_BASE + PROBE_TAG_BLOCKS * PROBE_TAG_SPACE
+if SCAN_PORT_BASE > 0xFFFF:
+    raise ImportError("Probe tag blocks leave no source ports for the SYN scanner")
+
+TCP_SYN_ACK = 0x12
+TCP_RST = 0x04
+ICMP_DEST_UNREACHABLE = 3
+# Unreachable codes that mean a firewall or router dropped the probe
+FILTERED_ICMP_CODES = {1, 2, 3, 9, 10, 13}
+
+
+def parse_ports(spec):
+    # "1-1024,8080,8443" -> sorted list of unique ports
+    ports = set()
+    for part in str(spec).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = (int(value) for value in part.split("-", 1))
+            ports.update(range(first, last + 1))
+        else:
+            ports.add(int(part))
+    if any(port < 1 or port > 65535 for port in ports):
+        raise ValueError(f"Port out of range in {spec!r}")
+    return sorted(ports)
+
+
+class ScanResult:
+    def __init__(self, host, ports, states):
+        self.host = host
+        self.ports = ports
+        self._states = states
+
+    def state(self, port):
+        return _STATES.get(self._states[port], PORT_FILTERED)
+
+    def ports_in_state(self, state):
+        return [port for port in self.ports if self.state(port) == state]
+
+    @property
+    def open_ports(self):
+        return self.ports_in_state(PORT_OPEN)
+
+    @property
+    def closed_ports(self):
+        return self.ports_in_state(PORT_CLOSED)
+
+    @property
+    def filtered_ports(self):
+        return self.ports_in_state(PORT_FILTERED)
+
+
+class SynScanner:
+    def __init__(self, hosts, ports, rate=10000, batch_size=BATCH_SIZE, retries=2, timeout=1.0):
+        self.hosts = [socket.gethostbyname(host) for host in hosts]
+        self.ports = list(ports)
+        self.rate = rate
+        self.batch_size = batch_size
+        self.retries = retries
+        self.timeout = timeout
+        self.source_port = random.randint(SCAN_PORT_BASE, 0xFFFF)
+        self.probes_sent = 0
+        self.elapsed = 0.0
+
+        self._addresses = {socket.inet_aton(host): host for host in self.hosts}
+        self._states = {}
+        for host in self.hosts:
+            states = bytearray([_NOT_SCANNED]) * 65536
+            for port in self.ports:
+                states[port] = _PENDING
+            self._states[host] = states
+        self._outstanding = 0
+        self._lock = threading.Lock()
+        self._running = False
+        self._stop_event = None
+
+    @property
+    def scan_rate(self):
+        return self.probes_sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def run(self, stop_event=None):
+        # Setting stop_event ends the scan after the current batch; ports not probed stay filtered
+        self._stop_event = stop_event
+        receivers = [self._open_receiver(socket.IPPROTO_TCP), self._open_receiver(socket.IPPROTO_ICMP)]
+        self._running = True
+        receiver_thread = threading.Thread(target=self._receive_loop, args=(receivers,), daemon=True)
+        receiver_thread.start()
+
+        start_time = time.monotonic()
+        try:
+            with SendEngine(self.hosts[0]) as engine:
+                for _ in range(self.retries + 1):
+                    # Only ports that have not answered yet are probed again
+                    pending = {host: [port for port in self.ports if self._states[host][port] == _PENDING]
+                               for host in self.hosts}
+                    with self._lock:
+                        self._outstanding = sum(len(ports) for ports in pending.values())
+                    if not self._outstanding or self._stopped():
+                        break
+                    self._send_pass(engine, pending)
+                    self._wait_for_replies()
+        finally:
+            self._running = False
+            receiver_thread.join()
+            for receiver in receivers:
+                receiver.close()
+        self.elapsed = time.monotonic() - start_time
+
+        return {host: ScanResult(host, self.ports, self._states[host]) for host in self.hosts}
+
+    def _send_pass(self, engine, pending_by_host):
+        from scapy.all import IP, TCP  # Imported on use: scapy takes seconds to load
+
+        pass_start = time.monotonic()
+        pass_sent = 0
+        for host, pending in pending_by_host.items():
+            if not pending:
+                continue
+
+            template = PacketTemplate(IP(dst=host) / TCP(sport=self.source_port, dport=0, flags="S"))
+            batch = FrameBatch([template.frame] * self.batch_size, (host, 0))
+            for offset in range(0, len(pending), self.batch_size):
+                if self._stopped():
+                    break
+                chunk = pending[offset:offset + self.batch_size]
+                for buffer, port in zip(batch.buffers, chunk):
+                    template.patch(buffer, template.ihl + 2, port.to_bytes(2, "big"))
+                engine.send_batch(batch, len(chunk))
+                pass_sent += len(chunk)
+
+                # Rate limit per batch rather than per packet
+                delay = pass_start + pass_sent / self.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+        self.probes_sent += pass_sent
+
+    def _wait_for_replies(self):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline and self._outstanding > 0 and not self._stopped():
+            time.sleep(min(0.05, self.timeout))
+
+    def _stopped(self):
+        return self._stop_event is not None and self._stop_event.is_set()
+
+    def _open_receiver(self, protocol):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, protocol)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        sock.setblocking(False)
+        return sock
+
+    def _receive_loop(self, receivers):
+        while self._running:
+            readable, _, _ = select.select(receivers, [], [], 0.05)
+            for sock in readable:
+                while True:
+                    try:
+                        packet = sock.recv(65535)
+                    except BlockingIOError:
+                        break
+                    self._handle_reply(packet)
+
+    def _handle_reply(self, packet):
+        if len(packet) < 20:
+            return
+        ihl = (packet[0] & 0x0F) * 4
+        protocol = packet[9]
+
+        if protocol == socket.IPPROTO_TCP and len(packet) >= ihl + 14:
+            host = self._addresses.get(packet[12:16])
+            source_port, destination_port = struct.unpack_from("!HH", packet, ihl)
+            if host is None or destination_port != self.source_port:
+                return
+            flags = packet[ihl + 13]
+            # The kernel answers a SYN-ACK for a port it never opened with an RST,
+            # so open ports are torn down without sending one ourselves
+            if flags & TCP_SYN_ACK == TCP_SYN_ACK:
+                self._set_state(host, source_port, _OPEN)
+            elif flags & TCP_RST:
+                self._set_state(host, source_port, _CLOSED)
+
+        elif protocol == socket.IPPROTO_ICMP and len(packet) >= ihl + 8 + 28:
+            if packet[ihl] != ICMP_DEST_UNREACHABLE or packet[ihl + 1] not in FILTERED_ICMP_CODES:
+                return
+            quoted = packet[ihl + 8:]
+            quoted_ihl = (quoted[0] & 0x0F) * 4
+            host = self._addresses.get(quoted[16:20])
+            if host is None or quoted[9] != socket.IPPROTO_TCP or len(quoted) < quoted_ihl + 4:
+                return
+            source_port, destination_port = struct.unpack_from("!HH", quoted, quoted_ihl)
+            if source_port == self.source_port:
+                self._set_state(host, destination_port, _FILTERED)
+
+    def _set_state(self, host, port, state):
+        states = self._states[host]
+        with self._lock:
+            if states[port] == _PENDING:
+                states[port] = state
+                self._outstanding -= 1
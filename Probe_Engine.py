@@ -0,0 +1,414 @@
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+from Histogram import DEFAULT_PERCENTILES, Histogram, JitterEstimator
+from Metrics import REGISTRY
+from Packet_Template import PacketTemplate, build_icmp_echo
+from Send_Engine import SendEngine
+
+# Probes are tagged through the TCP/UDP source port or the ICMP echo sequence
+# number, so replies can be matched back to the probe that caused them. Each
+# engine claims its own block of ports and ICMP identifier so that engines
+# running at the same time never match each other's replies. A block is held
+# until the engine is closed, so engines kept open between runs keep theirs.
+PROBE_PORT_BASE = 33000
+PROBE_TAG_SPACE = 4096
+PROBE_TAG_BLOCKS = 7  # As many as fit below port 65536
+_free_tag_blocks = set(range(PROBE_TAG_BLOCKS))
+_tag_block_lock = threading.Lock()
+
+ICMP_ECHO_REPLY = 0
+ICMP_DEST_UNREACHABLE = 3
+ICMP_TIME_EXCEEDED = 11
+RECEIVE_BUFFER_SIZE = 1 << 20
+
+# Kernel receive timestamps (CLOCK_REALTIME, nanoseconds); Linux only
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+CALIBRATION_PROBES = 50
+
+RECEIVE_TIME = REGISTRY.timer("ntg_probe_receive_seconds", "Time in recvmsg() per packet on the probe receivers")
+MATCH_TIME = REGISTRY.timer("ntg_probe_match_seconds", "Parsing a received packet and matching it to its probe")
+UNMATCHED = REGISTRY.counter("ntg_probe_unmatched_total", "Packets on the probe receivers that answer no probe")
+
+
+class ProbeResult:
+    # RTTs go into a histogram (nanoseconds), so memory does not grow with the
+    # probe count; per-probe RTTs are only kept when asked for.
+    def __init__(self, traffic_type, count, keep_samples=False):
+        self.traffic_type = traffic_type
+        self.sent = count
+        self.histogram = Histogram()
+        self.jitter_estimator = JitterEstimator()
+        self.rtts = [None] * count if keep_samples else None  # Per-probe RTT in seconds, None when lost
+
+    def record(self, index, rtt_ns):
+        self.histogram.record(rtt_ns)
+        self.jitter_estimator.update(rtt_ns)
+        if self.rtts is not None:
+            self.rtts[index] = rtt_ns / 1_000_000_000
+
+    def merge(self, other):
+        self.sent += other.sent
+        self.histogram.merge(other.histogram)
+        return self
+
+    @property
+    def latencies(self):
+        return [rtt for rtt in self.rtts if rtt is not None] if self.rtts is not None else []
+
+    @property
+    def received(self):
+        return self.histogram.count
+
+    @property
+    def loss_percentage(self):
+        return (self.sent - self.received) / self.sent * 100 if self.sent else 0.0
+
+    @property
+    def average_latency(self):
+        return self.histogram.mean / 1_000_000_000
+
+    @property
+    def min_latency(self):
+        return (self.histogram.min or 0) / 1_000_000_000
+
+    @property
+    def jitter(self):
+        return self.jitter_estimator.jitter / 1_000_000_000
+
+    def percentile(self, percent):
+        return self.histogram.percentile(percent) / 1_000_000_000
+
+    def summary(self, percents=DEFAULT_PERCENTILES):
+        # Numeric results in seconds and percent
+        summary = {
+            "sent": self.sent,
+            "received": self.received,
+            "packet_loss": self.loss_percentage,
+            "average_latency": self.average_latency,
+            "jitter": self.jitter,
+            "min_latency": self.min_latency,
+            "max_latency": (self.histogram.max or 0) / 1_000_000_000,
+        }
+        for percent in percents:
+            summary[f"p{percent:g}"] = self.percentile(percent)
+        return summary
+
+
+class _ProbeCounters:
+    __slots__ = ("sent", "replies", "timeouts")
+
+    def __init__(self, traffic_type):
+        self.sent = REGISTRY.counter("ntg_probes_sent_total", "Probes sent", traffic_type=traffic_type)
+        self.replies = REGISTRY.counter("ntg_probe_replies_total", "Probes answered in time",
+                                        traffic_type=traffic_type)
+        self.timeouts = REGISTRY.counter("ntg_probe_timeouts_total", "Probes that timed out",
+                                         traffic_type=traffic_type)
+
+
+class _Probe:
+    # sent_ns is monotonic and paired with the reply's monotonic arrival time;
+    # tx_ns is the kernel transmit stamp, paired with the kernel receive stamp
+    __slots__ = ("result", "index", "reply_port", "sent_ns", "send_id", "tx_ns")
+
+    def __init__(self, result, index, reply_port, sent_ns):
+        self.result = result
+        self.index = index
+        self.reply_port = reply_port
+        self.sent_ns = sent_ns
+        self.send_id = None
+        self.tx_ns = None
+
+
+class ProbeEngine:
+    def __init__(self, network_ip, interval=0.01, window=64, timeout=1.0, kernel_timestamps=True, overhead_ns=0,
+                 keep_open=False):
+        self.network_ip = network_ip
+        self.interval = interval
+        self.window = min(window, PROBE_TAG_SPACE // 2)
+        self.timeout = timeout
+        self.timeout_ns = int(timeout * 1_000_000_000)
+        self.kernel_timestamps = kernel_timestamps and sys.platform.startswith("linux")
+        self.overhead_ns = overhead_ns  # Tool overhead subtracted from every RTT, see calibrate()
+        self.target = socket.inet_aton(socket.gethostbyname(network_ip))
+        self._tag_block = None
+        self._claim_tag_block()
+
+        self._outstanding = {}
+        self._tx_pending = {}
+        self._counters = {}  # traffic type -> _ProbeCounters
+        self._lock = threading.Lock()
+        self._tx_lock = threading.Lock()
+        self._engine = None
+        self._slots = None
+        self._on_rtt = None
+        self._running = False
+
+        # With keep_open the raw sockets outlive a run and are reused by the next
+        # one, until close(); a long-running agent then never reopens them
+        self.keep_open = keep_open
+        self._send_engine = None
+        self._receivers = {}
+
+    def _claim_tag_block(self):
+        with _tag_block_lock:
+            if not _free_tag_blocks:
+                raise RuntimeError(f"All {PROBE_TAG_BLOCKS} probe tag blocks are in use by open probe engines")
+            self._tag_block = min(_free_tag_blocks)
+            _free_tag_blocks.remove(self._tag_block)
+        self.port_base = PROBE_PORT_BASE + self._tag_block * PROBE_TAG_SPACE
+        self.icmp_id = (os.getpid() + self._tag_block) & 0xFFFF
+
+    def calibrate(self, count=CALIBRATION_PROBES):
+        # Measure the tool's own overhead (stack traversal, wakeups, matching) with
+        # ICMP echoes to loopback; the fastest loopback RTT is subtracted from every
+        # RTT measured afterwards
+        loopback = ProbeEngine("127.0.0.1", interval=0.001, window=8, timeout=self.timeout,
+                               kernel_timestamps=self.kernel_timestamps)
+        template = PacketTemplate(build_icmp_echo("127.0.0.1", payload=bytes(32)))
+        histogram = loopback.run({"ICMP": template}, count)["ICMP"].histogram
+        self.overhead_ns = histogram.min or 0
+        return self.overhead_ns
+
+    def run(self, templates, count, keep_samples=False, stop_event=None, on_rtt=None, on_sent=None):
+        # templates maps traffic type -> PacketTemplate; probes of all types are
+        # interleaved so the whole run takes about count * len(templates) * interval.
+        # Setting stop_event stops sending; on_rtt(traffic_type, rtt_ns) is called from
+        # the receiver thread for every reply and must not block. on_sent(traffic_type)
+        # is called from the sending thread as every probe goes out.
+        results = {traffic_type: ProbeResult(traffic_type, count, keep_samples) for traffic_type in templates}
+        schedule = ((traffic_type, i) for i in range(count) for traffic_type in templates)
+        buffers = {traffic_type: template.new_buffer() for traffic_type, template in templates.items()}
+        protocols = {template.protocol for template in templates.values()} | {socket.IPPROTO_ICMP}
+
+        if self._tag_block is None:
+            self._claim_tag_block()  # Closed after an earlier run
+        receivers = [self._receiver(protocol) for protocol in protocols]
+        self._outstanding = {}
+        self._tx_pending = {}
+        self._slots = threading.Semaphore(self.window)
+        self._on_rtt = on_rtt
+        self._counters = {traffic_type: _ProbeCounters(traffic_type) for traffic_type in templates}
+        sent = dict.fromkeys(templates, 0)
+        self._running = True
+        receiver_thread = threading.Thread(target=self._receive_loop, args=(receivers,), daemon=True)
+        receiver_thread.start()
+
+        if self._send_engine is None:
+            self._send_engine = SendEngine(self.network_ip)
+        engine = self._send_engine
+        try:
+            engine.open()
+            self._engine = engine
+            tx_timestamps = self.kernel_timestamps and engine.enable_tx_timestamps()
+            next_send = time.monotonic()
+            for tag, (traffic_type, index) in enumerate(schedule):
+                if stop_event is not None and stop_event.is_set():
+                    break
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                while not self._slots.acquire(timeout=self.interval or 0.001):
+                    self._expire()
+
+                template = templates[traffic_type]
+                buffer = template.next_frame(buffers[traffic_type])
+                key = tag % PROBE_TAG_SPACE
+                reply_port = self._tag(template, buffer, key)
+                probe = _Probe(results[traffic_type], index, reply_port, time.monotonic_ns())
+                with self._lock:
+                    self._outstanding[key] = probe
+                    if tx_timestamps:
+                        probe.send_id = engine.frames_sent
+                        self._tx_pending[probe.send_id] = probe
+                if on_sent is not None:
+                    on_sent(traffic_type)  # Before sending: on loopback the reply can beat send_frame() back
+                engine.send_frame(buffer)
+                sent[traffic_type] += 1
+                self._counters[traffic_type].sent.add()
+                if tx_timestamps:
+                    self._collect_tx_timestamps()
+
+                next_send += self.interval
+                self._expire()
+
+            deadline = time.monotonic() + self.timeout
+            while self._outstanding and time.monotonic() < deadline:
+                time.sleep(min(0.01, self.timeout))
+                self._expire()
+        finally:
+            self._engine = None
+            self._running = False
+            receiver_thread.join()
+            if not self.keep_open:
+                self.close()
+
+        for traffic_type, result in results.items():
+            result.sent = sent[traffic_type]  # Fewer than count when the run was stopped
+        return results
+
+    def close(self):
+        for receiver in self._receivers.values():
+            receiver.close()
+        self._receivers = {}
+        if self._send_engine is not None:
+            self._send_engine.close()
+            self._send_engine = None
+        if self._tag_block is not None:
+            with _tag_block_lock:
+                _free_tag_blocks.add(self._tag_block)
+            self._tag_block = None
+
+    def _receiver(self, protocol):
+        sock = self._receivers.get(protocol)
+        if sock is None:
+            sock = self._receivers[protocol] = self._open_receiver(protocol)
+        else:
+            # A kept-open raw socket has queued up everything since the last run
+            while True:
+                try:
+                    sock.recv(65535)
+                except (BlockingIOError, InterruptedError):
+                    break
+        return sock
+
+    def _tag(self, template, buffer, key):
+        # Write the probe tag into the frame; returns the port replies must come from
+        if template.protocol == socket.IPPROTO_ICMP:
+            template.patch(buffer, template.ihl + 4, struct.pack("!HH", self.icmp_id, key))
+            return None
+        template.patch(buffer, template.ihl, struct.pack("!H", self.port_base + key))
+        return struct.unpack_from("!H", buffer, template.ihl + 2)[0]
+
+    def _open_receiver(self, protocol):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, protocol)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        if self.kernel_timestamps:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+            except OSError:
+                pass
+        sock.setblocking(False)
+        return sock
+
+    def _receive_loop(self, receivers):
+        while self._running:
+            readable, _, _ = select.select(receivers, [], [], 0.05)
+            for sock in readable:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        packet, ancdata, _, _ = sock.recvmsg(65535, 64)
+                    except BlockingIOError:
+                        break
+                    received_ns = time.monotonic_ns()
+                    received = time.perf_counter()
+                    RECEIVE_TIME.observe(received - started)
+                    match = self._parse_reply(packet)
+                    if match is not None:
+                        self._complete(match[0], match[1], received_ns, _kernel_timestamp(ancdata))
+                    else:
+                        UNMATCHED.add()
+                    MATCH_TIME.observe(time.perf_counter() - received)
+
+    def _parse_reply(self, packet):
+        # Returns (tag, source port of the reply or None) for replies to our probes
+        if len(packet) < 20:
+            return None
+        ihl = (packet[0] & 0x0F) * 4
+        protocol = packet[9]
+
+        if protocol == socket.IPPROTO_ICMP and len(packet) >= ihl + 8:
+            icmp_type = packet[ihl]
+            if icmp_type == ICMP_ECHO_REPLY:
+                if packet[12:16] != self.target:
+                    return None
+                icmp_id, sequence = struct.unpack_from("!HH", packet, ihl + 4)
+                return (sequence, None) if icmp_id == self.icmp_id else None
+            if icmp_type in (ICMP_DEST_UNREACHABLE, ICMP_TIME_EXCEEDED):
+                return self._parse_quoted(packet[ihl + 8:])
+            return None
+
+        if protocol in (socket.IPPROTO_TCP, socket.IPPROTO_UDP) and len(packet) >= ihl + 4:
+            if packet[12:16] != self.target:
+                return None
+            source_port, destination_port = struct.unpack_from("!HH", packet, ihl)
+            key = destination_port - self.port_base
+            if 0 <= key < PROBE_TAG_SPACE:
+                return key, source_port
+        return None
+
+    def _parse_quoted(self, quoted):
+        # ICMP errors quote the IP header and first 8 bytes of the probe that triggered them
+        if len(quoted) < 28 or quoted[16:20] != self.target:
+            return None
+        ihl = (quoted[0] & 0x0F) * 4
+        if len(quoted) < ihl + 8:
+            return None
+        if quoted[9] == socket.IPPROTO_ICMP:
+            icmp_id, sequence = struct.unpack_from("!HH", quoted, ihl + 4)
+            return (sequence, None) if icmp_id == self.icmp_id else None
+        source_port, destination_port = struct.unpack_from("!HH", quoted, ihl)
+        key = source_port - self.port_base
+        if 0 <= key < PROBE_TAG_SPACE:
+            return key, destination_port
+        return None
+
+    def _collect_tx_timestamps(self):
+        with self._tx_lock:
+            engine = self._engine
+            if engine is None:
+                return
+            for send_id, tx_ns in engine.read_tx_timestamps():
+                with self._lock:
+                    probe = self._tx_pending.pop(send_id, None)
+                if probe is not None:
+                    probe.tx_ns = tx_ns
+
+    def _complete(self, key, reply_port, received_ns, kernel_received_ns):
+        with self._lock:
+            probe = self._outstanding.get(key)
+            if probe is None or (reply_port is not None and probe.reply_port != reply_port):
+                return
+            del self._outstanding[key]
+        if kernel_received_ns is not None and probe.tx_ns is None and probe.send_id is not None:
+            self._collect_tx_timestamps()
+
+        # Prefer the kernel's transmit/receive stamps: they leave out packet building,
+        # Python wakeups and matching. Otherwise fall back to the monotonic pair.
+        if kernel_received_ns is not None and probe.tx_ns is not None:
+            rtt_ns = kernel_received_ns - probe.tx_ns
+        else:
+            rtt_ns = received_ns - probe.sent_ns
+        with self._lock:
+            self._tx_pending.pop(probe.send_id, None)
+        rtt_ns = max(0, rtt_ns - self.overhead_ns)
+        probe.result.record(probe.index, rtt_ns)
+        self._counters[probe.result.traffic_type].replies.add()
+        if self._on_rtt is not None:
+            self._on_rtt(probe.result.traffic_type, rtt_ns)
+        self._slots.release()
+
+    def _expire(self):
+        now = time.monotonic_ns()
+        with self._lock:
+            expired = [key for key, probe in self._outstanding.items() if now - probe.sent_ns >= self.timeout_ns]
+            for key in expired:
+                probe = self._outstanding.pop(key)
+                self._tx_pending.pop(probe.send_id, None)
+                self._counters[probe.result.traffic_type].timeouts.add()
+        for _ in expired:
+            self._slots.release()
+
+
+def _kernel_timestamp(ancdata):
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(data) >= 16:
+            seconds, nanoseconds = struct.unpack_from("qq", data)
+            return seconds * 1_000_000_000 + nanoseconds
+    return None
@@ -1,36 +1,25 @@
-from scapy.all import IP, TCP, Raw, sr1
-import statistics
-import time
+from scapy.all import IP, TCP, Raw
+
+from Packet_Template import PacketTemplate
+from Probe_Engine import ProbeEngine
 
 def measure_qos():
     network_ip = input("Enter the IP address for QoS test: ")
     packet_count = int(input("Enter the number of packets for QoS test: "))
+    calibrate = input("Calibrate the tool's own overhead on loopback first? (y/n): ").strip().lower() == "y"
     traffic_type = "TCP"
-    latencies = []
-    packet_loss_count = 0
-
-    for _ in range(packet_count):
-        packet = IP(dst=network_ip) / TCP(dport=80) / Raw(load='X' * 64)
-        start_time = time.time()
-        response = sr1(packet, timeout=1, verbose=False)
-        end_time = time.time()
-
-        if response:
-            latencies.append(end_time - start_time)
-        else:
-            packet_loss_count += 1
-
-    if latencies:
-        average_latency = sum(latencies) / len(latencies)
-        jitter = statistics.stdev(latencies) if len(latencies) > 1 else 0.0
-    else:
-        average_latency = jitter = 0.0
 
-    packet_loss_percentage = (packet_loss_count / packet_count) * 100
+    template = PacketTemplate(IP(dst=network_ip) / TCP(dport=80) / Raw(load='X' * 64))
+    engine = ProbeEngine(network_ip, timeout=1)
+    if calibrate:
+        print(f"Tool overhead: {engine.calibrate() / 1000:.1f} microseconds")
+    probe_result = engine.run({traffic_type: template}, packet_count)[traffic_type]
 
-    return (f"Average Latency: {average_latency:.6f} seconds",
-            f"Jitter: {jitter:.6f} seconds",
-            f"Packet Loss: {packet_loss_percentage:.2f}%")
+    percentiles = " / ".join(f"{probe_result.percentile(percent):.6f}" for percent in (50, 90, 99, 99.9, 100))
+    return (f"Average Latency: {probe_result.average_latency:.6f} seconds",
+            f"Latency p50/p90/p99/p99.9/max: {percentiles} seconds",
+            f"Jitter: {probe_result.jitter:.6f} seconds",
+            f"Packet Loss: {probe_result.loss_percentage:.2f}%")
 
 qos_results = measure_qos()
 for result in qos_results:
@@ -0,0 +1,315 @@
+import random
+import threading
+import time
+
+from Pacer import ConstantRate
+from Traffic_Mix import ETHERNET_OVERHEAD, MIN_FRAME_SIZE
+
+# RFC 2544 benchmarking of a device between the sender and a Reflector.py sink:
+# per frame size, the highest rate forwarded without loss (26.1), latency at that
+# rate (26.2) and the longest back-to-back burst forwarded without loss (26.4).
+# Loss is counted at the receiving end: every trial is a fresh reflector stream.
+# Frame sizes are Ethernet frame sizes, as in the RFC; the IP packets sent are
+# ETHERNET_OVERHEAD bytes shorter.
+RFC2544_FRAME_SIZES = (64, 128, 256, 512, 1024, 1280, 1518)
+WIRE_OVERHEAD = 20  # Preamble and inter-frame gap: what a frame occupies on the link beyond its own bytes
+DEFAULT_TRIAL_DURATION = 60.0  # Section 24: trials of at least 60 seconds
+DEFAULT_SETTLE_TIME = 2.0  # Section 23: wait two seconds for frames still in flight before counting
+DEFAULT_RESOLUTION = 1.0  # Searches stop once the bounds are this many percent of the best load apart
+DEFAULT_LATENCY_DURATION = 120.0  # Section 26.2: a 120 second stream at the throughput rate
+DEFAULT_BURST_SECONDS = 2.0  # Section 26.4: bursts of at least two seconds at the maximum rate
+DEFAULT_BURST_TRIALS = 5  # Section 26.4 asks for 50 repetitions; each is a search of its own
+SENDER_LIMIT = 0.99  # A trial reaching less of its offered rate than this was limited by the sender
+
+
+def parse_frame_sizes(spec):
+    # "64,512,1518" -> (64, 512, 1518)
+    sizes = tuple(int(size) for size in spec.split(",") if size.strip())
+    if not sizes:
+        raise ValueError("No frame sizes given")
+    if any(size < MIN_FRAME_SIZE for size in sizes):
+        raise ValueError(f"Frame sizes must be at least {MIN_FRAME_SIZE} bytes")
+    return sizes
+
+
+def packet_length(frame_size):
+    # IP packet length of an Ethernet frame of frame_size bytes
+    return frame_size - ETHERNET_OVERHEAD
+
+
+def line_rate_pps(link_mbps, frame_size):
+    # Frames per second that fill a link of link_mbps with frames of frame_size bytes
+    return link_mbps * 1_000_000 / ((frame_size + WIRE_OVERHEAD) * 8)
+
+
+class Trial:
+    # One offered load: a stream at `offered` pps (None for as fast as possible),
+    # or a back-to-back burst of `offered` frames
+    def __init__(self, offered, stats, received):
+        self.offered = offered
+        self.sent = stats.packets
+        self.elapsed = stats.elapsed
+        self.pps = stats.pps
+        self.received = received["received"]
+        self.stream = received  # Reflector StreamStats.to_dict() of the trial's stream
+
+    @property
+    def lost(self):
+        # Against what was sent rather than the highest sequence seen, so losing the last frames counts too
+        return max(0, self.sent - self.received)
+
+    @property
+    def loss_percentage(self):
+        return self.lost / self.sent * 100 if self.sent else 0.0
+
+    @property
+    def sender_limited(self):
+        return self.offered is not None and self.pps < self.offered * SENDER_LIMIT
+
+    def summary(self):
+        return {"offered": self.offered, "sent": self.sent, "received": self.received, "lost": self.lost,
+                "loss_percentage": self.loss_percentage, "pps": self.pps, "elapsed": self.elapsed}
+
+
+class FrameSizeResult:
+    def __init__(self, frame_size, link_mbps=None):
+        self.frame_size = frame_size
+        self.link_mbps = link_mbps
+        self.max_pps = None  # Line rate with a link speed, else what the sender managed unpaced
+        self.throughput = None  # Trial at the highest rate that passed, None when none did
+        self.trials = []  # Rate trials in the order run
+        self.sender_limited = False
+        self.latency = None  # Probe RTT summary at the throughput rate, plus the stream's one-way delay
+        self.bursts = []  # Longest lossless burst found by each back-to-back repetition
+        self.burst_trials = []
+
+    @property
+    def throughput_pps(self):
+        return self.throughput.pps if self.throughput is not None else 0.0
+
+    def summary(self):
+        # Numeric results; rates in frames per second, Mbps counting the whole Ethernet frames
+        summary = {
+            "frame_size": self.frame_size,
+            "max_pps": self.max_pps,
+            "throughput_pps": self.throughput_pps,
+            "throughput_mbps": self.throughput_pps * self.frame_size * 8 / 1_000_000,
+            "loss_percentage": self.throughput.loss_percentage if self.throughput is not None else None,
+            "trials": len(self.trials),
+            "sender_limited": self.sender_limited,
+        }
+        if self.link_mbps:
+            summary["line_rate_percentage"] = self.throughput_pps / line_rate_pps(self.link_mbps,
+                                                                                  self.frame_size) * 100
+        if self.latency is not None:
+            summary["latency"] = self.latency
+        if self.bursts:
+            summary["back_to_back"] = sum(self.bursts) / len(self.bursts)
+            summary["back_to_back_min"] = min(self.bursts)
+            summary["back_to_back_max"] = max(self.bursts)
+            summary["back_to_back_searches"] = len(self.bursts)
+            summary["burst_trials"] = len(self.burst_trials)
+        return summary
+
+
+class RFC2544Test:
+    # loss_tolerance (percent) is the loss a throughput trial may show and still
+    # pass; the RFC's zero loss is the default. Bursts always have to arrive whole.
+    # Without link_mbps the maximum rate is whatever the sender reaches unpaced,
+    # so a device faster than the sender reports as sender limited.
+    def __init__(self, frame_sizes=RFC2544_FRAME_SIZES, trial_duration=DEFAULT_TRIAL_DURATION, loss_tolerance=0.0,
+                 link_mbps=None, resolution=DEFAULT_RESOLUTION, latency_duration=DEFAULT_LATENCY_DURATION,
+                 burst_seconds=DEFAULT_BURST_SECONDS, burst_trials=DEFAULT_BURST_TRIALS,
+                 settle_time=DEFAULT_SETTLE_TIME):
+        if any(size < MIN_FRAME_SIZE for size in frame_sizes):
+            raise ValueError(f"Frame sizes must be at least {MIN_FRAME_SIZE} bytes")
+        if trial_duration <= 0 or not 0 < resolution < 100 or loss_tolerance < 0:
+            raise ValueError("Trial duration and resolution must be positive, loss tolerance not negative")
+        if link_mbps is not None and link_mbps <= 0:
+            raise ValueError("Link speed must be positive")
+        self.frame_sizes = tuple(frame_sizes)
+        self.trial_duration = trial_duration
+        self.loss_tolerance = loss_tolerance
+        self.link_mbps = link_mbps
+        self.resolution = resolution
+        self.latency_duration = latency_duration
+        self.burst_seconds = burst_seconds
+        self.burst_trials = burst_trials
+        self.settle_time = settle_time
+        self._stream_id = 0
+
+    def run(self, sender, templates, client, probe=None, stop_event=None, on_trial=None):
+        # templates holds a reflector test stream PacketTemplate per frame size, of
+        # packet_length(frame size); client is a ReflectorClient for the sink. probe(duration),
+        # when given, measures RTTs through the device while the latency stream runs and
+        # returns their summary. on_trial(frame_size, kind, trial) sees every "rate" and
+        # "burst" trial. Returns {frame size: FrameSizeResult}, as far as it got before stop_event.
+        self._stream_id = random.getrandbits(24) << 8
+        results = {}
+        for frame_size in self.frame_sizes:
+            if stop_event is not None and stop_event.is_set():
+                break
+            result = results[frame_size] = FrameSizeResult(frame_size, self.link_mbps)
+            template = templates[frame_size]
+            self._throughput(result, sender, template, client, stop_event, on_trial)
+            if result.throughput is not None and self.latency_duration > 0:
+                self._latency(result, sender, template, client, probe, stop_event)
+            if self.burst_trials > 0:
+                self._back_to_back(result, sender, template, client, stop_event, on_trial)
+        return results
+
+    def _stopped(self, stop_event):
+        return stop_event is not None and stop_event.is_set()
+
+    def _collect(self, client, stream_id, sent, stop_event):
+        # The stream's counts at the reflector once frames still in flight have arrived
+        if stop_event is not None:
+            stop_event.wait(self.settle_time)
+        else:
+            time.sleep(self.settle_time)
+        received = client.query(stream_id, sent=sent)
+        client.reset(stream_id)
+        return received
+
+    def _rate_trial(self, sender, template, client, pps, duration, stop_event):
+        self._stream_id += 1
+        stream = template.for_stream(self._stream_id)
+        stats = sender.run(stream, duration, ConstantRate(pps) if pps else None, stop_event)
+        received = self._collect(client, self._stream_id, stats.packets, stop_event)
+        return Trial(pps, stats, received)
+
+    def _throughput(self, result, sender, template, client, stop_event, on_trial):
+        # Section 26.1: binary search for the highest rate with no more than the tolerated loss
+
+        def trial(pps):
+            rate_trial = self._rate_trial(sender, template, client, pps, self.trial_duration, stop_event)
+            if self._stopped(stop_event):
+                return None  # Cut short: its loss says nothing
+            result.trials.append(rate_trial)
+            if on_trial is not None:
+                on_trial(result.frame_size, "rate", rate_trial)
+            return rate_trial
+
+        first = None
+        if self.link_mbps:
+            result.max_pps = line_rate_pps(self.link_mbps, result.frame_size)
+        else:
+            first = trial(None)
+            if first is None:
+                return
+            result.max_pps = first.pps
+        passed = lambda rate_trial: rate_trial.loss_percentage <= self.loss_tolerance
+        _, result.throughput = _search(result.max_pps, trial, passed, self.resolution, first)
+        # Passing unpaced, or short of its offered rate, shows the sender's limit rather than the device's
+        result.sender_limited = result.throughput is not None and (result.throughput is first or
+                                                                   result.throughput.sender_limited)
+
+    def _latency(self, result, sender, template, client, probe, stop_event):
+        # Section 26.2: a stream at the throughput rate, with RTT probes through the device alongside
+        latency = {}
+        errors = []
+
+        def run_probe():
+            try:
+                latency.update(probe(self.latency_duration))
+            except Exception as e:
+                errors.append(e)
+
+        thread = None
+        if probe is not None:
+            thread = threading.Thread(target=run_probe, daemon=True)
+            thread.start()
+        stream = self._rate_trial(sender, template, client, result.throughput_pps, self.latency_duration,
+                                  stop_event)
+        if thread is not None:
+            thread.join()
+        if errors:
+            raise errors[0]
+        if self._stopped(stop_event):
+            return
+        # Meaningful only with synchronized clocks at both ends
+        latency["one_way_delay_p50"] = stream.stream["one_way_delay_p50"]
+        latency["one_way_delay_p99"] = stream.stream["one_way_delay_p99"]
+        latency["stream_loss_percentage"] = stream.loss_percentage
+        result.latency = latency
+
+    def _back_to_back(self, result, sender, template, client, stop_event, on_trial):
+        # Section 26.4: binary search for the longest burst at the maximum rate that
+        # arrives whole, repeated burst_trials times
+        maximum = max(1, int(result.max_pps * self.burst_seconds)) if result.max_pps else 0
+        if not maximum:
+            return
+
+        def trial(frames):
+            self._stream_id += 1
+            stats = sender.burst(template.for_stream(self._stream_id), frames)
+            received = self._collect(client, self._stream_id, stats.packets, stop_event)
+            if self._stopped(stop_event):
+                return None
+            burst = Trial(frames, stats, received)
+            result.burst_trials.append(burst)
+            if on_trial is not None:
+                on_trial(result.frame_size, "burst", burst)
+            return burst
+
+        for _ in range(self.burst_trials):
+            frames, _ = _search(maximum, trial, lambda burst: burst.lost == 0, self.resolution, integer=True)
+            if self._stopped(stop_event):
+                return
+            result.bursts.append(frames)
+
+
+def _search(maximum, trial, passed, resolution, first=None, integer=False):
+    # Highest load in (0, maximum] whose trial passes, found by halving the interval
+    # between the highest passing and the lowest failing load until it is no wider
+    # than `resolution` percent of the passing load (of maximum while none passed).
+    # The first trial is at maximum, or is `first` when that was already run.
+    # Returns (load, its trial), (0, None) when nothing passed; a trial returning None stops the search.
+    best = (0, None)
+    low, high = 0, maximum
+    load = maximum
+    while True:
+        result = first if first is not None else trial(load)
+        first = None
+        if result is None:
+            return best
+        if passed(result):
+            best = (load, result)
+            low = load
+        else:
+            high = load
+        if high - low <= (low or maximum) * resolution / 100:
+            return best
+        load = (low + high) // 2 if integer else (low + high) / 2
+        if integer and load == low:
+            return best
+
+
+def format_rfc2544(summaries):
+    # Report lines from {frame size: FrameSizeResult.summary()}
+    lines = []
+    for frame_size, summary in summaries.items():
+        if summary["loss_percentage"] is None:
+            lines.append(f"{frame_size}B: no rate passed ({summary['trials']} trials)")
+        else:
+            text = (f"{frame_size}B: throughput {summary['throughput_pps']:,.0f} fps "
+                    f"({summary['throughput_mbps']:.2f} Mbps")
+            if "line_rate_percentage" in summary:
+                text += f", {summary['line_rate_percentage']:.2f}% of line rate"
+            text += f"), {summary['loss_percentage']:.4f}% loss, {summary['trials']} trials"
+            if summary["sender_limited"]:
+                text += ", limited by the sender"
+            lines.append(text)
+        latency = summary.get("latency")
+        if latency is not None and latency.get("received"):
+            lines.append(f"{frame_size}B: latency at throughput p50/p99/max: {latency['p50']:.6f} / "
+                         f"{latency['p99']:.6f} / {latency['max_latency']:.6f} seconds, "
+                         f"jitter {latency['jitter']:.6f} seconds")
+        elif latency is not None:
+            lines.append(f"{frame_size}B: latency at throughput: one-way p50/p99 {latency['one_way_delay_p50']:.6f} / "
+                         f"{latency['one_way_delay_p99']:.6f} seconds")
+        if "back_to_back" in summary:
+            lines.append(f"{frame_size}B: back-to-back {summary['back_to_back']:,.0f} frames "
+                         f"(min {summary['back_to_back_min']:,}, max {summary['back_to_back_max']:,} "
+                         f"over {summary['back_to_back_searches']} searches)")
+    return lines
@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import threading
+import time
+
+from Histogram import Histogram
+
+REFLECTOR_PORT = 8625
+MODE_SINK = "sink"
+MODE_REFLECT = "reflect"
+READ_BATCH = 64
+
+# Test packets carry this header at the start of the UDP payload:
+# magic, stream id, sequence number, sender timestamp (CLOCK_REALTIME ns)
+TEST_HEADER = struct.Struct("!4sIQQ")
+TEST_MAGIC = b"NTGT"
+TEST_STREAM_OFFSET = 4  # Offsets of the fields inside the header
+TEST_SEQUENCE_OFFSET = 8
+# Packets too short for it (a 64 byte Ethernet frame leaves 18 bytes of UDP payload)
+# carry a short header without the timestamp: magic, stream id, 32-bit sequence number
+SHORT_TEST_HEADER = struct.Struct("!4sII")
+SHORT_TEST_MAGIC = b"NTGS"
+
+# Control datagrams: magic, first stream id, stream count. Queries are answered
+# with the JSON stats of those streams merged together; the sender appends how
+# many packets it sent on them, which the loss is counted against.
+_CONTROL = struct.Struct("!4sII")
+_QUERY = struct.Struct("!4sIIQ")
+_QUERY_MAGIC = b"NTGQ"
+_RESET_MAGIC = b"NTGX"
+
+# IPv4 + UDP headers, counted so receive rates compare with the IP-level send rates
+_IP_UDP_HEADERS = 28
+
+# Sequence numbers this far behind the highest one seen can still be recognized as duplicates
+DUPLICATE_WINDOW = 1 << 16
+
+
+class StreamStats:
+    def __init__(self):
+        self.received = 0
+        self.bytes_received = 0
+        self.highest = -1
+        self.reordered = 0
+        self.duplicates = 0
+        self.first_ns = None
+        self.last_ns = None
+        self.one_way_delay = Histogram()
+        self._seen = bytearray(DUPLICATE_WINDOW // 8)
+
+    def record(self, sequence, size, sent_ns, received_ns):
+        if sequence > self.highest:
+            # Forget the window slots the new high-water mark moves over
+            if sequence - self.highest >= DUPLICATE_WINDOW:
+                self._seen = bytearray(DUPLICATE_WINDOW // 8)
+            else:
+                for skipped in range(self.highest + 1, sequence + 1):
+                    slot = skipped % DUPLICATE_WINDOW
+                    self._seen[slot >> 3] &= ~(1 << (slot & 7)) & 0xFF
+            self.highest = sequence
+        elif self.highest - sequence < DUPLICATE_WINDOW:
+            slot = sequence % DUPLICATE_WINDOW
+            if self._seen[slot >> 3] & (1 << (slot & 7)):
+                self.duplicates += 1
+                return
+            self.reordered += 1
+        else:
+            self.reordered += 1
+        slot = sequence % DUPLICATE_WINDOW
+        self._seen[slot >> 3] |= 1 << (slot & 7)
+
+        self.received += 1
+        self.bytes_received += size
+        if self.first_ns is None:
+            self.first_ns = received_ns
+        self.last_ns = received_ns
+        # Only meaningful when both clocks are synchronized (or on loopback)
+        if sent_ns is not None and received_ns >= sent_ns:
+            self.one_way_delay.record(received_ns - sent_ns)
+
+    def merge(self, other):
+        # Combines counts only; duplicate detection stays per stream
+        self.received += other.received
+        self.bytes_received += other.bytes_received
+        self.reordered += other.reordered
+        self.duplicates += other.duplicates
+        if other.first_ns is not None:
+            self.first_ns = other.first_ns if self.first_ns is None else min(self.first_ns, other.first_ns)
+            self.last_ns = other.last_ns if self.last_ns is None else max(self.last_ns, other.last_ns)
+        self.one_way_delay.merge(other.one_way_delay)
+        return self
+
+    def to_dict(self, sent=None):
+        # Loss counts against what the sender says it sent, so packets lost at the
+        # end of a stream count too; without that count it is None
+        elapsed = (self.last_ns - self.first_ns) / 1_000_000_000 if self.first_ns is not None else 0.0
+        lost = max(0, sent - self.received) if sent is not None else None
+        return {
+            "received": self.received,
+            "bytes_received": self.bytes_received,
+            "sent": sent,
+            "lost": lost,
+            "loss_percentage": (lost / sent * 100 if sent else 0.0) if sent is not None else None,
+            "reordered": self.reordered,
+            "duplicates": self.duplicates,
+            "receive_mbps": self.bytes_received * 8 / elapsed / 1_000_000 if elapsed > 0 else 0.0,
+            "receive_pps": self.received / elapsed if elapsed > 0 else 0.0,
+            "one_way_delay_p50": self.one_way_delay.percentile(50) / 1_000_000_000,
+            "one_way_delay_p99": self.one_way_delay.percentile(99) / 1_000_000_000,
+        }
+
+
+class Reflector:
+    # Far-end daemon: counts (sink) or echoes back (reflect) test packets and
+    # answers stats queries from NetworkTester
+    def __init__(self, host="0.0.0.0", port=REFLECTOR_PORT, mode=MODE_SINK, read_batch=READ_BATCH):
+        if mode not in (MODE_SINK, MODE_REFLECT):
+            raise ValueError(f"Unknown reflector mode: {mode}")
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.read_batch = read_batch
+        self.streams = {}
+        self._sock = None
+        self._buffer = bytearray(65536)
+        self._loop = None
+        self._stopped = None
+        self._thread = None
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 23)
+        self._sock.bind((self.host, self.port))
+        self.port = self._sock.getsockname()[1]
+        self._sock.setblocking(False)
+        self._loop.add_reader(self._sock.fileno(), self._on_readable)
+        try:
+            await self._stopped.wait()
+        finally:
+            self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+
+    def start(self):
+        # Run the reflector on its own event loop thread (e.g. on loopback next to the tester)
+        ready = threading.Event()
+
+        async def main():
+            serving = asyncio.ensure_future(self.serve())
+            while self._stopped is None or self._sock is None:
+                await asyncio.sleep(0)
+            ready.set()
+            await serving
+
+        self._thread = threading.Thread(target=asyncio.run, args=(main(),), daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _on_readable(self):
+        # Drain up to read_batch datagrams per wakeup into one reused buffer
+        buffer = self._buffer
+        for _ in range(self.read_batch):
+            try:
+                size, address = self._sock.recvfrom_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            received_ns = time.time_ns()
+            magic = bytes(buffer[:4])
+            if magic == TEST_MAGIC and size >= TEST_HEADER.size:
+                _, stream_id, sequence, sent_ns = TEST_HEADER.unpack_from(buffer)
+                self._record(stream_id, sequence, size, sent_ns, received_ns, address)
+            elif magic == SHORT_TEST_MAGIC and size >= SHORT_TEST_HEADER.size:
+                _, stream_id, sequence = SHORT_TEST_HEADER.unpack_from(buffer)
+                self._record(stream_id, sequence, size, None, received_ns, address)
+            elif magic == _QUERY_MAGIC and size >= _CONTROL.size:
+                _, first, count = _CONTROL.unpack_from(buffer)
+                sent = _QUERY.unpack_from(buffer)[3] if size >= _QUERY.size else None
+                stats = StreamStats()
+                for stream_id in range(first, first + count):
+                    if stream_id in self.streams:
+                        stats.merge(self.streams[stream_id])
+                self._send(json.dumps(stats.to_dict(sent)).encode(), address)
+            elif magic == _RESET_MAGIC and size >= _CONTROL.size:
+                _, first, count = _CONTROL.unpack_from(buffer)
+                for stream_id in range(first, first + count):
+                    self.streams.pop(stream_id, None)
+                self._send(b"{}", address)
+
+    def _record(self, stream_id, sequence, size, sent_ns, received_ns, address):
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            stream = self.streams[stream_id] = StreamStats()
+        stream.record(sequence, size + _IP_UDP_HEADERS, sent_ns, received_ns)
+        if self.mode == MODE_REFLECT:
+            self._send(self._buffer[:size], address)
+
+    def _send(self, data, address):
+        try:
+            self._sock.sendto(data, address)
+        except (BlockingIOError, OSError):
+            pass
+
+
+class ReflectorClient:
+    def __init__(self, host, port=REFLECTOR_PORT, timeout=1.0, retries=3):
+        self.address = (socket.gethostbyname(host), port)
+        self.timeout = timeout
+        self.retries = retries
+
+    def _request(self, message):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(self.timeout)
+            for _ in range(self.retries):
+                sock.sendto(message, self.address)
+                try:
+                    return json.loads(sock.recv(65536))
+                except socket.timeout:
+                    continue
+        raise TimeoutError(f"No answer from reflector at {self.address[0]}:{self.address[1]}")
+
+    def query(self, stream_id, count=1, sent=None):
+        # StreamStats.to_dict() of streams stream_id .. stream_id + count - 1 combined,
+        # with loss against `sent`, the packets sent on them
+        if sent is None:
+            return self._request(_CONTROL.pack(_QUERY_MAGIC, stream_id, count))
+        return self._request(_QUERY.pack(_QUERY_MAGIC, stream_id, count, sent))
+
+    def reset(self, stream_id, count=1):
+        self._request(_CONTROL.pack(_RESET_MAGIC, stream_id, count))
+
+
+def test_payload(stream_id, size):
+    # UDP payload of `size` bytes starting with a test header at sequence 0; the short
+    # header when the full one does not fit
+    if size >= TEST_HEADER.size:
+        return TEST_HEADER.pack(TEST_MAGIC, stream_id, 0, 0) + bytes(size - TEST_HEADER.size)
+    if size >= SHORT_TEST_HEADER.size:
+        return SHORT_TEST_HEADER.pack(SHORT_TEST_MAGIC, stream_id, 0) + bytes(size - SHORT_TEST_HEADER.size)
+    raise ValueError(f"A {size} byte UDP payload cannot hold a test header")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UDP test packet reflector")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=REFLECTOR_PORT)
+    parser.add_argument("--mode", choices=(MODE_SINK, MODE_REFLECT), default=MODE_SINK)
+    args = parser.parse_args()
+    print(f"Reflector ({args.mode}) listening on {args.host}:{args.port}")
+    asyncio.run(Reflector(args.host, args.port, args.mode).serve())
@@ -0,0 +1,399 @@
+import argparse
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+
+# Test results as one row per numeric metric: (time, test, target, traffic type,
+# frame length, metric, value). The file is a run of fixed-capacity blocks, each
+# with its columns stored contiguously, so a reader maps the file and takes whole
+# columns at once. Strings are dictionary-encoded with a file-wide dictionary whose
+# new entries live in the block that first used them. A block's header is written
+# after its rows, so a crash mid-append leaves only rows that were never counted.
+DEFAULT_BLOCK_ROWS = 1 << 16
+DEFAULT_BLOCK_STRING_BYTES = 1 << 16
+STORE_MAGIC = b"NTGCOLS1"
+BLOCK_MAGIC = b"NTGBLK01"
+COLUMNS = ("time", "test", "target", "traffic_type", "frame_length", "metric", "value")
+STRING_COLUMNS = ("test", "target", "traffic_type", "metric")
+
+# magic, block row capacity, block string capacity in bytes
+_FILE_HEADER = struct.Struct("<8sII48x")
+# magic, rows, strings, string bytes used, first and last time
+_BLOCK_HEADER = struct.Struct("<8sIII4xdd16x")
+# Column layout inside a block, widest first so every column stays aligned
+_COLUMN_TYPES = (("time", "d"), ("value", "d"), ("frame_length", "I"), ("test", "H"), ("target", "H"),
+                 ("traffic_type", "H"), ("metric", "H"))
+_STRING_LENGTH = struct.Struct("<H")
+_RUN = re.compile(b"\x01+")
+_MIN_RUN = 8  # Matching rows per run, on average, from which runs are copied as slices
+MAX_STRINGS = 0xFFFF
+
+
+class ResultRecord:
+    # One test result for one target and traffic type; metrics maps names to numbers
+    __slots__ = ("time", "test", "target", "traffic_type", "frame_length", "metrics")
+
+    def __init__(self, time, test, target, traffic_type=None, frame_length=0, metrics=None):
+        self.time = time
+        self.test = test
+        self.target = target
+        self.traffic_type = traffic_type or ""
+        self.frame_length = frame_length or 0
+        self.metrics = metrics or {}
+
+
+def flatten_metrics(values, prefix=""):
+    # {"p50": 0.1, "convergence": {"samples": 30}} -> {"p50": 0.1, "convergence.samples": 30};
+    # anything that is not a number (None, text, lists) is left out
+    metrics = {}
+    for key, value in values.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def _block_layout(block_rows, string_bytes):
+    # {column: (offset from the block start, typecode)}, offset of the string region, block size
+    offsets = {}
+    offset = _BLOCK_HEADER.size
+    for name, typecode in _COLUMN_TYPES:
+        offsets[name] = (offset, typecode)
+        offset += block_rows * array(typecode).itemsize
+    return offsets, offset, offset + string_bytes
+
+
+class ResultsWriter:
+    # Appends records to a store, creating it if needed. One writer per file at a time.
+    def __init__(self, path, block_rows=DEFAULT_BLOCK_ROWS, block_string_bytes=DEFAULT_BLOCK_STRING_BYTES):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._lock = threading.Lock()
+        header = os.pread(self._fd, _FILE_HEADER.size, 0)
+        if len(header) < _FILE_HEADER.size:
+            os.pwrite(self._fd, _FILE_HEADER.pack(STORE_MAGIC, block_rows, block_string_bytes), 0)
+        else:
+            magic, block_rows, block_string_bytes = _FILE_HEADER.unpack(header)
+            if magic != STORE_MAGIC:
+                os.close(self._fd)
+                raise ValueError(f"{path} is not a results store")
+        self.block_rows = block_rows
+        self.block_string_bytes = block_string_bytes
+        self._columns, self._string_offset, self._block_size = _block_layout(block_rows, block_string_bytes)
+
+        # Find the last block and the string dictionary so far
+        self._codes = {}
+        self._block = None
+        offset = _FILE_HEADER.size
+        size = os.fstat(self._fd).st_size
+        while offset + _BLOCK_HEADER.size <= size:
+            magic, rows, strings, string_used, first, last = _BLOCK_HEADER.unpack(
+                os.pread(self._fd, _BLOCK_HEADER.size, offset))
+            if magic != BLOCK_MAGIC:
+                break
+            for string in _read_strings(os.pread(self._fd, string_used, offset + self._string_offset), strings):
+                self._codes[string] = len(self._codes)
+            self._block = [offset, rows, strings, string_used, first, last]
+            offset += self._block_size
+
+    def append(self, records, sync=False):
+        # Returns the number of rows written, one per metric of every record
+        rows = [(record.time, record.test, record.target, record.traffic_type, record.frame_length, metric, value)
+                for record in records for metric, value in record.metrics.items()]
+        with self._lock:
+            while rows:
+                rows = rows[self._append_block(rows):]
+            if sync:
+                os.fsync(self._fd)
+        return sum(len(record.metrics) for record in records)
+
+    def _append_block(self, rows):
+        # Writes as many rows as fit into the last block; returns how many that was
+        if self._block is None or self._block[1] >= self.block_rows:
+            self._new_block()
+        offset, used, strings, string_used, first, last = self._block
+
+        new_strings = []
+        new_bytes = bytearray()
+        count = 0
+        for row in rows[:self.block_rows - used]:
+            added = [value for value in (row[1], row[2], row[3], row[5])
+                     if value not in self._codes and value not in new_strings]
+            encoded = b"".join(_STRING_LENGTH.pack(len(value.encode())) + value.encode() for value in added)
+            if string_used + len(new_bytes) + len(encoded) > self.block_string_bytes:
+                break  # The rest starts a new block, with room for its strings
+            if len(self._codes) + len(new_strings) + len(added) > MAX_STRINGS:
+                raise ValueError(f"{self.path} holds the most distinct strings a store can")
+            new_strings.extend(added)
+            new_bytes += encoded
+            count += 1
+        if count == 0:
+            if used == 0:
+                raise ValueError("A record's strings do not fit into an empty block")
+            self._block[1] = self.block_rows  # Strings are full; the next rows go to a new block
+            return 0
+
+        codes = dict(self._codes)
+        for string in new_strings:
+            codes[string] = len(codes)
+        chunk = rows[:count]
+        values = {
+            "time": [row[0] for row in chunk],
+            "test": [codes[row[1]] for row in chunk],
+            "target": [codes[row[2]] for row in chunk],
+            "traffic_type": [codes[row[3]] for row in chunk],
+            "frame_length": [row[4] for row in chunk],
+            "metric": [codes[row[5]] for row in chunk],
+            "value": [float(row[6]) for row in chunk],
+        }
+        for name, (column_offset, typecode) in self._columns.items():
+            data = array(typecode, values[name])
+            os.pwrite(self._fd, data.tobytes(), offset + column_offset + used * data.itemsize)
+        if new_bytes:
+            os.pwrite(self._fd, bytes(new_bytes), offset + self._string_offset + string_used)
+
+        # The header last: until it is written the new rows and strings do not exist
+        times = values["time"]
+        first = min(times) if not used else min(first, min(times))
+        last = max(times) if not used else max(last, max(times))
+        self._block = [offset, used + count, strings + len(new_strings), string_used + len(new_bytes), first, last]
+        os.pwrite(self._fd, _BLOCK_HEADER.pack(BLOCK_MAGIC, *self._block[1:]), offset)
+        self._codes = codes
+        return count
+
+    def _new_block(self):
+        offset = _FILE_HEADER.size if self._block is None else self._block[0] + self._block_size
+        os.ftruncate(self._fd, offset + self._block_size)  # Sparse until written
+        os.pwrite(self._fd, _BLOCK_HEADER.pack(BLOCK_MAGIC, 0, 0, 0, 0.0, 0.0), offset)
+        self._block = [offset, 0, 0, 0, 0.0, 0.0]
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _code_mask(data, codes):
+    # Mask of the rows of a dictionary-coded column (its raw bytes) holding one of
+    # codes. Each code is matched on its low and high byte with bytes.translate.
+    low, high = data[0::2], data[1::2]
+    mask = 0
+    for code in codes:
+        mask |= (int.from_bytes(low.translate(_byte_table(code & 0xFF)), "little")
+                 & int.from_bytes(high.translate(_byte_table(code >> 8)), "little"))
+    return mask
+
+
+def _byte_table(value):
+    # Translation table mapping byte `value` to 1 and every other byte to 0
+    return bytes(value) + b"\x01" + bytes(255 - value)
+
+
+def _read_strings(data, count):
+    strings = []
+    offset = 0
+    for _ in range(count):
+        (length,) = _STRING_LENGTH.unpack_from(data, offset)
+        offset += _STRING_LENGTH.size
+        strings.append(bytes(data[offset:offset + length]).decode())
+        offset += length
+    return strings
+
+
+class ResultTable:
+    # Query result, column by column; string columns hold dictionary codes until read
+    def __init__(self, columns, strings):
+        self._columns = columns
+        self.strings = strings
+
+    def __len__(self):
+        return len(self._columns["time"])
+
+    def column(self, name):
+        values = self._columns[name]
+        if name in STRING_COLUMNS:
+            return list(map(self.strings.__getitem__, values))
+        return values
+
+    def rows(self):
+        # (time, test, target, traffic type, frame length, metric, value) tuples
+        return zip(*(self.column(name) for name in COLUMNS))
+
+    def records(self):
+        return (dict(zip(COLUMNS, row)) for row in self.rows())
+
+    def to_csv(self, file):
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        writer.writerows(self.rows())
+
+    def to_json(self, file):
+        # One JSON object per row (JSON Lines), so exports of any size stream
+        for record in self.records():
+            file.write(json.dumps(record) + "\n")
+
+
+class ResultsStore:
+    # Read side: maps the file as it is when opened; reopen to see later appends
+    def __init__(self, path):
+        self.path = path
+        self.strings = []
+        self.blocks = []  # (offset, rows, first time, last time)
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if len(self._map) < _FILE_HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is not a results store")
+        magic, block_rows, string_bytes = _FILE_HEADER.unpack_from(self._map, 0)
+        if magic != STORE_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a results store")
+        self._columns, string_offset, block_size = _block_layout(block_rows, string_bytes)
+
+        offset = _FILE_HEADER.size
+        while offset + block_size <= len(self._map):
+            magic, rows, strings, string_used, first, last = _BLOCK_HEADER.unpack_from(self._map, offset)
+            if magic != BLOCK_MAGIC:
+                break
+            start = offset + string_offset
+            self.strings.extend(_read_strings(self._map[start:start + string_used], strings))
+            if rows:
+                self.blocks.append((offset, rows, first, last))
+            offset += block_size
+        self._codes = {string: code for code, string in enumerate(self.strings)}
+
+    def __len__(self):
+        return sum(rows for _, rows, _, _ in self.blocks)
+
+    def values(self, column):
+        # Distinct values of a string column, e.g. every target in the store
+        codes = set()
+        for offset, rows, _, _ in self.blocks:
+            codes.update(self._column(offset, rows, column))
+        return sorted(self.strings[code] for code in codes)
+
+    def _column(self, offset, rows, name):
+        column_offset, typecode = self._columns[name]
+        start = offset + column_offset
+        return memoryview(self._map)[start:start + rows * array(typecode).itemsize].cast(typecode)
+
+    def query(self, test=None, target=None, traffic_type=None, metric=None, since=None, until=None):
+        # Rows matching every filter given: string filters take one value or a
+        # collection of them, since/until (epoch seconds) bound time as [since, until)
+        since = None if since is None else float(since)
+        until = None if until is None else float(until)
+        filters = {}
+        for name, wanted in (("test", test), ("target", target), ("traffic_type", traffic_type),
+                             ("metric", metric)):
+            if wanted is None:
+                continue
+            wanted = [wanted] if isinstance(wanted, str) else wanted
+            codes = {self._codes[value] for value in wanted if value in self._codes}
+            if not codes:
+                return ResultTable({name: [] for name in COLUMNS}, self.strings)
+            filters[name] = codes
+
+        columns = {name: array(typecode) for name, (_, typecode) in self._columns.items()}
+        for offset, rows, first, last in self.blocks:
+            if (since is not None and last < since) or (until is not None and first >= until):
+                continue
+            # A mask is one byte per row, 1 where the row matches, held as an int so
+            # that combining masks is a single C-level AND
+            everything = int.from_bytes(b"\x01" * rows, "little")
+            mask = everything
+            for name, codes in filters.items():
+                mask &= _code_mask(self._column(offset, rows, name).tobytes(), codes)
+            times = self._column(offset, rows, "time")
+            if since is not None and first < since:
+                mask &= int.from_bytes(bytes(map(since.__le__, times)), "little")
+            if until is not None and last >= until:
+                mask &= int.from_bytes(bytes(map(until.__gt__, times)), "little")
+            if mask == everything:
+                for name, values in columns.items():
+                    values.frombytes(self._column(offset, rows, name).tobytes())
+            elif mask:
+                selected = mask.to_bytes(rows, "little")
+                runs = selected.count(b"\x00\x01") + selected[0]
+                if runs * _MIN_RUN <= selected.count(1):
+                    # Matches come in long runs (a time range, one test's rows): copy each run whole
+                    spans = [match.span() for match in _RUN.finditer(selected)]
+                    for name, values in columns.items():
+                        column = self._column(offset, rows, name)
+                        for run_start, run_end in spans:
+                            values.frombytes(column[run_start:run_end].tobytes())
+                    continue
+                # Scattered matches: gather with a struct format that reads each matching
+                # row and skips the rest, e.g. "=d8xdd" for rows 0, 2 and 3 of a float column
+                gathers = {}
+                for name, values in columns.items():
+                    column_offset, typecode = self._columns[name]
+                    if typecode not in gathers:
+                        skip = b"%dx" % values.itemsize
+                        gathers[typecode] = struct.Struct(
+                            b"=" + selected.replace(b"\x00", skip).replace(b"\x01", typecode.encode()))
+                    values += array(typecode, gathers[typecode].unpack_from(self._map, offset + column_offset))
+        return ResultTable(columns, self.strings)
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._map = b""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _timestamp(value):
+    # Epoch seconds or an ISO 8601 date/time (local time unless it says otherwise)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a timestamp: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query a results store and export the rows")
+    parser.add_argument("store")
+    parser.add_argument("--test", action="append", help="Only this test (repeatable)")
+    parser.add_argument("--target", action="append", help="Only this target (repeatable)")
+    parser.add_argument("--type", action="append", dest="traffic_type", help="Only this traffic type (repeatable)")
+    parser.add_argument("--metric", action="append", help="Only this metric (repeatable)")
+    parser.add_argument("--since", type=_timestamp, help="From this time: epoch seconds or ISO 8601")
+    parser.add_argument("--until", type=_timestamp, help="Before this time: epoch seconds or ISO 8601")
+    parser.add_argument("--format", choices=("csv", "json", "count"), default="csv")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with ResultsStore(args.store) as store:
+        table = store.query(args.test, args.target, args.traffic_type, args.metric, args.since, args.until)
+        if args.format == "count":
+            print(f"{len(table)} of {len(store)} rows in {time.perf_counter() - started:.3f} seconds")
+        elif args.format == "json":
+            table.to_json(sys.stdout)
+        else:
+            table.to_csv(sys.stdout)
@@ -1,4 +1,4 @@
-from scapy.all import IP, TCP, sr1, send
+from Port_Scanner import SynScanner, parse_ports
 
 TRAFFIC_TYPE_PORT_MAP = {
     "TCP": 80,
@@ -15,22 +15,28 @@ TRAFFIC_TYPE_PORT_MAP = {
 }
 
 def perform_port_scan():
-    network_ip = input("Enter the IP address for port scan: ")
-    traffic_types = ["TCP", "FTP", "HTTP", "SMTP", "POP3", "SSH", "NTP", "Telnet", "EIGRP", "OSPF", "RTP"]
+    hosts = [host.strip() for host in input("Enter the IP address(es) for port scan (comma separated): ").split(",")]
+    port_spec = input("Enter the ports to scan (e.g. 1-65535 or 22,80,443), blank for known services: ")
+    ports = parse_ports(port_spec) if port_spec.strip() else sorted(set(TRAFFIC_TYPE_PORT_MAP.values()))
+    service_names = {port: traffic_type for traffic_type, port in reversed(TRAFFIC_TYPE_PORT_MAP.items())}
+
+    scanner = SynScanner(hosts, ports)
+    scan_results = scanner.run()
     open_ports = []
+    for host, scan_result in scan_results.items():
+        for port in scan_result.open_ports:
+            open_ports.append((host, service_names.get(port, "TCP"), port))
 
-    for traffic_type in traffic_types:
-        port = TRAFFIC_TYPE_PORT_MAP.get(traffic_type, None)
-        if port:
-            packet = IP(dst=network_ip) / TCP(dport=port, flags="S")
-            response = sr1(packet, timeout=0.5, verbose=False)
-            if response and response.haslayer(TCP) and response.getlayer(TCP).flags == 0x12:
-                open_ports.append((traffic_type, port))
-                send(IP(dst=network_ip) / TCP(dport=port, flags="R"), verbose=False)
-    return open_ports
+    summary = (f"Scanned {len(ports)} port(s) on {len(hosts)} host(s) in {scanner.elapsed:.2f} seconds "
+               f"({scanner.scan_rate:.0f} probes/s)")
+    return open_ports, scan_results, summary
 
-open_ports = perform_port_scan()
+open_ports, scan_results, summary = perform_port_scan()
 for port in open_ports:
-    print(f"{port[0]}: Open port: {port[1]}")
+    print(f"{port[0]} {port[1]}: Open port: {port[2]}")
 if not open_ports:
     print("No open ports found.")
+for host, scan_result in scan_results.items():
+    print(f"{host}: {len(scan_result.open_ports)} open, {len(scan_result.closed_ports)} closed, "
+          f"{len(scan_result.filtered_ports)} filtered")
+print(summary)
@@ -0,0 +1,405 @@
+import ctypes
+import errno
+import socket
+import struct
+import sys
+import time
+
+from Metrics import REGISTRY
+from Packet_Template import PacketTemplate
+
+# Number of frames pushed to the kernel per sendmmsg() call
+BATCH_SIZE = 64
+
+SEND_SYSCALLS = REGISTRY.counter("ntg_send_syscalls_total", "sendto() and sendmmsg() calls")
+SEND_TIME = REGISTRY.timer("ntg_send_seconds", "Time in send calls, per batch or single frame")
+
+# Linux software transmit timestamps; the socket module does not export these
+SO_TIMESTAMPING = getattr(socket, "SO_TIMESTAMPING", 37)
+SOF_TIMESTAMPING_TX_SOFTWARE = 1 << 1
+SOF_TIMESTAMPING_SOFTWARE = 1 << 4
+SOF_TIMESTAMPING_OPT_ID = 1 << 7
+SOF_TIMESTAMPING_OPT_TSONLY = 1 << 11
+IP_RECVERR = 11
+SO_EE_ORIGIN_TIMESTAMPING = 4
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IoVec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr),
+                ("msg_len", ctypes.c_uint)]
+
+
+def _load_sendmmsg():
+    # sendmmsg() is Linux only; everywhere else we fall back to one sendto() per frame
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+class SendStats:
+    def __init__(self, packets=0, bytes_sent=0, syscalls=0, elapsed=0.0, target_pps=None):
+        self.packets = packets
+        self.bytes_sent = bytes_sent
+        self.syscalls = syscalls
+        self.elapsed = elapsed
+        self.target_pps = target_pps  # Set when the run was paced
+        self.received = None  # Reflector.StreamStats.to_dict() when a far-end reflector counted the traffic
+        self.convergence = None  # Convergence.ConvergenceMonitor.summary() when the run was adaptive
+
+    @property
+    def pps(self):
+        return self.packets / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def mbps(self):
+        return (self.bytes_sent * 8) / self.elapsed / 1_000_000 if self.elapsed > 0 else 0.0
+
+    @property
+    def rate_deviation(self):
+        # Achieved rate relative to the paced target, in percent
+        if not self.target_pps:
+            return None
+        return (self.pps - self.target_pps) / self.target_pps * 100
+
+    def summary(self):
+        # Numeric results, with the reflector's receive stats and convergence nested when present
+        summary = {"packets": self.packets, "bytes": self.bytes_sent, "syscalls": self.syscalls,
+                   "elapsed": self.elapsed, "pps": self.pps, "mbps": self.mbps}
+        if self.target_pps:
+            summary["target_pps"] = self.target_pps
+            summary["rate_deviation"] = self.rate_deviation
+        if self.received is not None:
+            summary["received"] = self.received
+        if self.convergence is not None:
+            summary["convergence"] = self.convergence
+        return summary
+
+    def __str__(self):
+        text = f"{self.mbps:.2f} Mbps, {self.pps:.0f} pps, {self.syscalls} syscalls"
+        if self.target_pps:
+            text += f", {self.rate_deviation:+.2f}% from target {self.target_pps:.0f} pps"
+        return text
+
+
+class FrameBatch:
+    # Preallocated frame buffers wired into an mmsghdr array once, so every
+    # send of the batch is a single sendmmsg() call with no per-packet setup.
+    def __init__(self, frames, address):
+        self.buffers = [bytearray(frame) for frame in frames]
+        self.lengths = [len(buffer) for buffer in self.buffers]
+        self.total_bytes = sum(self.lengths)
+        self.address = address
+        self.destinations = None  # Per-frame (ip, port) once set_destination() was used
+        self.templates = None  # Per-frame PacketTemplates for a batch of mixed frames, advanced by pump()
+
+        count = len(self.buffers)
+        self._sockaddr = _sockaddr_in(*address)
+        self._iov = (_IoVec * count)()
+        self._msgs = (_MMsgHdr * count)()
+        self._views = []
+        for i, buffer in enumerate(self.buffers):
+            view = (ctypes.c_char * len(buffer)).from_buffer(buffer)
+            self._views.append(view)
+            self._iov[i].iov_base = ctypes.addressof(view)
+            self._iov[i].iov_len = len(buffer)
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._sockaddr)
+            hdr.msg_namelen = ctypes.sizeof(self._sockaddr)
+            hdr.msg_iov = ctypes.pointer(self._iov[i])
+            hdr.msg_iovlen = 1
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def set_destination(self, index, ip):
+        # Send one frame of the batch to its own address, so a single sendmmsg() can
+        # reach many hosts. The frame's IP header must name the same destination.
+        if self.destinations is None:
+            self.destinations = [self.address] * len(self.buffers)
+            self._frame_sockaddrs = [None] * len(self.buffers)
+        sockaddr = self._frame_sockaddrs[index]
+        if sockaddr is None:
+            sockaddr = self._frame_sockaddrs[index] = _sockaddr_in(ip, self.address[1])
+            self._msgs[index].msg_hdr.msg_name = ctypes.addressof(sockaddr)
+        else:
+            ctypes.memmove(ctypes.addressof(sockaddr) + 4, socket.inet_aton(ip), 4)
+        self.destinations[index] = (ip, self.address[1])
+
+
+def _sockaddr_in(ip, port=0):
+    # struct sockaddr_in as the kernel expects it: family, port, address, padding
+    raw = socket.AF_INET.to_bytes(2, sys.byteorder) + port.to_bytes(2, "big") + socket.inet_aton(ip) + bytes(8)
+    return (ctypes.c_char * len(raw)).from_buffer_copy(raw)
+
+
+class MemoryTransport:
+    # Stands in for the raw socket and only counts what it is given, so the send
+    # path above the kernel can be measured without root or a network
+    port = 0
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    def __call__(self):
+        return self
+
+    def sendto(self, data, address):
+        self.frames += 1
+        self.bytes += len(data)
+        return len(data)
+
+    def setsockopt(self, *args):
+        raise OSError("MemoryTransport has no socket options")
+
+    def close(self):
+        pass
+
+
+class LoopbackTransport:
+    # Sends the frames as UDP datagrams to a sink socket on 127.0.0.1 that never
+    # reads them: the kernel drops them on arrival, but the sender still pays for
+    # every sendmmsg() call. Needs no root; the engine must target 127.0.0.1.
+    def __init__(self):
+        self.sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.sink.bind(("127.0.0.1", 0))
+        self.port = self.sink.getsockname()[1]
+
+    def __call__(self):
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def close(self):
+        self.sink.close()
+
+
+class SendEngine:
+    def __init__(self, network_ip, batch_size=BATCH_SIZE, transport=None):
+        self.network_ip = network_ip
+        self.batch_size = batch_size
+        # transport() returns the socket to send on, with the destination port it
+        # needs on transport.port; None opens a raw IPv4 socket (needs root)
+        self.transport = transport
+        self.address = (socket.gethostbyname(network_ip), transport.port if transport is not None else 0)
+        self.sock = None
+        self.frames_sent = 0
+        self.tx_timestamps = False
+
+    def open(self):
+        if self.sock is None:
+            if self.transport is not None:
+                self.sock = self.transport()
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+                self.sock = sock
+        return self
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            self.tx_timestamps = False
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def make_batch(self, frame, count=None):
+        # Serialize once (scapy packets are converted with bytes()) and replicate
+        frame = bytes(frame)
+        return FrameBatch([frame] * (count or self.batch_size), self.address)
+
+    def send_batch(self, batch, count=None, start=0):
+        # Sends `count` frames (default the rest) from frame `start` on; returns the number of syscalls it took
+        started = time.perf_counter()
+        syscalls = self._send_batch(batch, len(batch) - start if count is None else count, start)
+        SEND_TIME.observe(time.perf_counter() - started)
+        SEND_SYSCALLS.add(syscalls)
+        return syscalls
+
+    def _send_batch(self, batch, count, start):
+        if _sendmmsg is None or not isinstance(self.sock, socket.socket):
+            destinations = batch.destinations or [batch.address] * len(batch)
+            for buffer, address in zip(batch.buffers[start:start + count], destinations[start:]):
+                self.sock.sendto(buffer, address)
+            return count
+
+        fd = self.sock.fileno()
+        msg_size = ctypes.sizeof(_MMsgHdr)
+        base = ctypes.addressof(batch._msgs) + start * msg_size
+        done = 0
+        syscalls = 0
+        while done < count:
+            msgs = ctypes.cast(base + done * msg_size, ctypes.POINTER(_MMsgHdr))
+            sent = _sendmmsg(fd, msgs, count - done, 0)
+            syscalls += 1
+            if sent < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOBUFS, errno.EAGAIN, errno.EINTR):
+                    # Transmit queue is full; give the NIC a moment and retry
+                    time.sleep(0)
+                    continue
+                raise OSError(err, f"sendmmsg failed: {errno.errorcode.get(err, err)}")
+            done += sent
+        return syscalls
+
+    def send_frame(self, frame):
+        # Returns the frame's send id, which matches the id of its transmit timestamp
+        started = time.perf_counter()
+        self.sock.sendto(frame, self.address)
+        SEND_TIME.observe(time.perf_counter() - started)
+        SEND_SYSCALLS.add()
+        send_id = self.frames_sent
+        self.frames_sent += 1
+        return send_id
+
+    def enable_tx_timestamps(self):
+        # Ask the kernel to report when each frame actually left the stack (Linux only)
+        self.open()
+        if self.tx_timestamps:
+            return True  # Already on; setting it again would not restart the kernel's ids
+        if not sys.platform.startswith("linux"):
+            return False
+        flags = (SOF_TIMESTAMPING_TX_SOFTWARE | SOF_TIMESTAMPING_SOFTWARE |
+                 SOF_TIMESTAMPING_OPT_ID | SOF_TIMESTAMPING_OPT_TSONLY)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPING, flags)
+        except OSError:
+            return False
+        self.frames_sent = 0  # The kernel's timestamp ids restart when the option is set
+        self.tx_timestamps = True
+        return True
+
+    def read_tx_timestamps(self):
+        # Drains the error queue; returns [(send id, CLOCK_REALTIME ns)]
+        timestamps = []
+        while True:
+            try:
+                _, ancdata, _, _ = self.sock.recvmsg(0, 512, socket.MSG_ERRQUEUE | socket.MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                return timestamps
+            stamp = send_id = None
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPING and len(data) >= 16:
+                    seconds, nanoseconds = struct.unpack_from("qq", data)
+                    stamp = seconds * 1_000_000_000 + nanoseconds
+                elif kind == IP_RECVERR and len(data) >= 16:
+                    _, origin, _, _, _, _, send_id = struct.unpack_from("IBBBBII", data)
+                    if origin != SO_EE_ORIGIN_TIMESTAMPING:
+                        send_id = None
+            if stamp is not None and send_id is not None:
+                timestamps.append((send_id, stamp))
+
+    def burst(self, frame, count):
+        # Sends exactly `count` frames back to back, as fast as the socket takes them;
+        # a PacketTemplate is advanced for every frame as in pump()
+        self.open()
+        template = frame if isinstance(frame, PacketTemplate) else None
+        batch = self.make_batch(template.frame if template is not None else frame)
+        stats = SendStats()
+        start_time = time.monotonic()
+        while stats.packets < count:
+            size = min(len(batch), count - stats.packets)
+            if template is not None:
+                for buffer in batch.buffers[:size]:
+                    template.next_frame(buffer)
+            stats.syscalls += self.send_batch(batch, size)
+            stats.packets += size
+            stats.bytes_sent += batch.total_bytes if size == len(batch) else sum(batch.lengths[:size])
+        stats.elapsed = time.monotonic() - start_time
+        return stats
+
+    def run(self, frame, duration, profile=None, stop_event=None, on_batch=None):
+        # frame is a scapy packet, raw bytes, or a PacketTemplate whose
+        # per-packet fields are advanced in place before every batch
+        return self.pump([frame], duration, profile, on_batch, stop_event)
+
+    def pump(self, frames, duration, profile=None, on_batch=None, stop_event=None):
+        # Sends the frames round-robin, one batch each in turn, for `duration`
+        # seconds or until stop_event is set. A prebuilt FrameBatch is sent as it is,
+        # so it can hold a mix of frames; when pacing sends only part of one, the
+        # next send resumes where it stopped. With a RateProfile the sender sleeps
+        # until the next batch is owed instead of polling the clock.
+        # on_batch(index, packets, bytes, syscalls) is called after every send
+        # for per-frame accounting; it must not block.
+        self.open()
+        sources = []
+        for frame in frames:
+            if isinstance(frame, FrameBatch):
+                sources.append((None, frame))
+                continue
+            template = frame if isinstance(frame, PacketTemplate) else None
+            sources.append((template, self.make_batch(template.frame if template is not None else frame)))
+        frame_bytes = sum(batch.total_bytes for _, batch in sources) / sum(len(batch) for _, batch in sources)
+        stats = SendStats(target_pps=profile.target_pps(duration, frame_bytes) if profile else None)
+
+        start_time = time.monotonic()
+        deadline = start_time + duration
+        now = start_time
+        index = offset = 0  # Next source, and the frame a partly sent mixed batch resumes at
+        while now < deadline and not (stop_event is not None and stop_event.is_set()):
+            template, batch = sources[index]
+            count = len(batch) - offset
+            if profile is not None:
+                count = profile.allowance(now - start_time, stats.packets, frame_bytes, count)
+                if count == 0:
+                    wake_at = start_time + profile.next_send_time(stats.packets, frame_bytes, len(batch))
+                    delay = max(0.0, min(wake_at, deadline) - time.monotonic())
+                    if stop_event is not None:
+                        stop_event.wait(delay)  # Long gaps (e.g. between bursts) stay cancellable
+                    else:
+                        time.sleep(delay)
+                    now = time.monotonic()
+                    continue
+
+            end = offset + count
+            if template is not None:
+                for buffer in batch.buffers[:count]:
+                    template.next_frame(buffer)
+            elif batch.templates is not None:
+                for buffer, frame_template in zip(batch.buffers[offset:end], batch.templates[offset:end]):
+                    frame_template.next_frame(buffer)
+            syscalls = self.send_batch(batch, count, offset)
+            sent_bytes = batch.total_bytes if count == len(batch) else sum(batch.lengths[offset:end])
+            stats.syscalls += syscalls
+            stats.packets += count
+            stats.bytes_sent += sent_bytes
+            if on_batch is not None:
+                on_batch(index, count, sent_bytes, syscalls)
+
+            # Batches of one repeated frame lose nothing by starting over; mixed ones finish first
+            offset = end if batch.templates is not None and end < len(batch) else 0
+            if not offset:
+                index = (index + 1) % len(sources)
+            now = time.monotonic()
+
+        stats.elapsed = now - start_time
+        return stats
@@ -0,0 +1,422 @@
+import argparse
+import json
+import math
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import deque
+
+from Histogram import DEFAULT_PERCENTILES, Histogram, JitterEstimator
+
+# Soak tests probe for hours. Replies are rolled up into fixed windows (by default
+# 1 second and 1 minute, aligned to the wall clock); a closed window goes to a
+# bounded ring of recent windows and is appended to the soak file, so memory stays
+# flat however long the run lasts and a crash loses at most the open windows.
+DEFAULT_WINDOWS = (1, 60)
+DEFAULT_RING_SIZE = 300  # Closed windows kept in memory, per window length
+DEFAULT_SOAK_INTERVAL = 0.1
+DEFAULT_SOAK_FILE = "soak.ntgs"
+
+# File layout: magic, length of the JSON settings, the settings, then one record per
+# closed window and traffic type, each followed by its histogram's non-empty buckets
+SOAK_MAGIC = b"NTGSOAK1"
+_HEADER = struct.Struct("<8sI")
+# start, length, seconds covered, traffic type index, sent, received, jitter ns, min, max and total RTT ns, buckets
+_RECORD = struct.Struct("<dffHIIdQQQH")
+_BUCKET = struct.Struct("<HI")
+
+
+def parse_duration(value):
+    # "90", "90s", "45m", "12h" -> seconds
+    value = value.strip().lower()
+    scale = {"s": 1, "m": 60, "h": 3600}.get(value[-1:], None)
+    seconds = float(value[:-1] if scale else value) * (scale or 1)
+    if seconds <= 0:
+        raise ValueError("Duration must be positive")
+    return seconds
+
+
+def parse_windows(spec):
+    # "1,60" -> [1.0, 60.0]
+    windows = sorted({float(item) for item in spec.split(",") if item.strip()})
+    if not windows or windows[0] <= 0:
+        raise ValueError("Window lengths must be positive")
+    return windows
+
+
+class WindowSummary:
+    # One closed window of one traffic type; latencies are in seconds
+    __slots__ = ("start", "length", "covered", "traffic_type", "sent", "received", "jitter", "min_latency",
+                 "max_latency", "average_latency", "percentiles")
+
+    def __init__(self, start, length, covered, traffic_type, sent, histogram, jitter_ns):
+        self.start = start
+        self.length = length
+        self.covered = covered  # Seconds of the window the run was going; less for its first and last windows
+        self.traffic_type = traffic_type
+        self.sent = sent
+        self.received = histogram.count
+        self.jitter = jitter_ns / 1_000_000_000
+        self.min_latency = (histogram.min or 0) / 1_000_000_000
+        self.max_latency = (histogram.max or 0) / 1_000_000_000
+        self.average_latency = histogram.mean / 1_000_000_000
+        self.percentiles = {percent: value / 1_000_000_000 for percent, value in histogram.percentiles().items()}
+
+    @property
+    def loss_percentage(self):
+        return max(0, self.sent - self.received) / self.sent * 100 if self.sent else 0.0
+
+    def summary(self):
+        summary = {
+            "start": self.start,
+            "length": self.length,
+            "sent": self.sent,
+            "received": self.received,
+            "packet_loss": self.loss_percentage,
+            "average_latency": self.average_latency,
+            "jitter": self.jitter,
+            "min_latency": self.min_latency,
+            "max_latency": self.max_latency,
+        }
+        for percent, value in self.percentiles.items():
+            summary[f"p{percent:g}"] = value
+        return summary
+
+
+class _OpenWindow:
+    __slots__ = ("sent", "histogram")
+
+    def __init__(self):
+        self.sent = 0
+        self.histogram = Histogram()
+
+
+class WindowRollup:
+    # Replies count toward the window their probe was sent in, so a window closes
+    # only `grace` seconds (the probe timeout) after it ends; by then each of its
+    # probes was answered or is lost. on_close(WindowSummary, histogram) gets every
+    # closed window, oldest first.
+    def __init__(self, traffic_types, lengths=DEFAULT_WINDOWS, grace=1.0, ring_size=DEFAULT_RING_SIZE,
+                 on_close=None):
+        self.traffic_types = list(traffic_types)
+        self.lengths = sorted(lengths)
+        self.grace = grace
+        self.on_close = on_close
+        self.recent = {length: deque(maxlen=ring_size) for length in self.lengths}
+        # Run totals, from the shortest windows (which together cover the whole run)
+        self.totals = {traffic_type: Histogram() for traffic_type in self.traffic_types}
+        self.sent_totals = dict.fromkeys(self.traffic_types, 0)
+        self.started = time.time()
+        self.ended = None
+        self._open = {length: {} for length in self.lengths}  # length -> {start: {traffic_type: _OpenWindow}}
+        self._jitter = {traffic_type: JitterEstimator() for traffic_type in self.traffic_types}
+        self._next_close = math.inf
+        self._lock = threading.Lock()
+
+    def sent(self, traffic_type):
+        now = time.time()
+        with self._lock:
+            for length, windows in self._open.items():
+                start = now - now % length
+                window = windows.get(start)
+                if window is None:
+                    window = windows[start] = {name: _OpenWindow() for name in self.traffic_types}
+                    self._next_close = min(self._next_close, start + length + self.grace)
+                window[traffic_type].sent += 1
+        if now >= self._next_close:
+            self.close_due(now)
+
+    def reply(self, traffic_type, rtt_ns):
+        # The send time is worked back from the RTT, so a probe sent right at a window
+        # edge can land a few microseconds off; a window with all its probes answered
+        # hands the reply on to its neighbour
+        sent_at = time.time() - rtt_ns / 1_000_000_000
+        with self._lock:
+            self._jitter[traffic_type].update(rtt_ns)
+            for length, windows in self._open.items():
+                start = sent_at - sent_at % length
+                for candidate in (start, start - length, start + length):
+                    window = windows.get(candidate)
+                    if window is not None and window[traffic_type].histogram.count < window[traffic_type].sent:
+                        window[traffic_type].histogram.record(rtt_ns)
+                        break
+
+    def close_due(self, now=None):
+        now = time.time() if now is None else now
+        closed = []
+        with self._lock:
+            for length, windows in self._open.items():
+                for start in [start for start in windows if start + length + self.grace <= now]:
+                    closed.append((length, start, windows.pop(start)))
+            self._next_close = min((start + length + self.grace for length, windows in self._open.items()
+                                    for start in windows), default=math.inf)
+        for length, start, window in sorted(closed, key=lambda item: (item[1], item[0])):
+            self._close(length, start, window)
+
+    def close_all(self):
+        # End of the run: every open window closes, covering only the time the run was going
+        self.ended = time.time()
+        with self._lock:
+            closed = [(length, start, window) for length, windows in self._open.items()
+                      for start, window in windows.items()]
+            for windows in self._open.values():
+                windows.clear()
+        for length, start, window in sorted(closed, key=lambda item: (item[1], item[0])):
+            self._close(length, start, window)
+
+    def _close(self, length, start, window):
+        covered = min(start + length, self.ended or math.inf) - max(start, self.started)
+        for traffic_type, stats in window.items():
+            summary = WindowSummary(start, length, covered, traffic_type, stats.sent, stats.histogram,
+                                    self._jitter[traffic_type].jitter)
+            self.add(summary, stats.histogram)
+            if self.on_close is not None:
+                self.on_close(summary, stats.histogram)
+
+    def add(self, summary, histogram):
+        # Takes in a closed window, from this run or read back from a soak file
+        if summary.length == self.lengths[0]:
+            self.totals[summary.traffic_type].merge(histogram)
+            self.sent_totals[summary.traffic_type] += summary.sent
+        self.recent[summary.length].append(summary)
+
+
+def _sparse_buckets(histogram):
+    return [(index, count) for index, count in enumerate(histogram.counts) if count]
+
+
+def _histogram_from_buckets(buckets, received, minimum, maximum, total):
+    histogram = Histogram()
+    if buckets:
+        histogram.counts = array("Q", [0]) * (buckets[-1][0] + 1)
+        for index, count in buckets:
+            histogram.counts[index] = count
+    histogram.count = received
+    histogram.total = total
+    if received:
+        histogram.min = minimum
+        histogram.max = maximum
+    return histogram
+
+
+class SoakFile:
+    # Append-only record of a soak run: its settings, then the closed windows
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._types = None
+
+    @staticmethod
+    def read(path):
+        # Returns (settings, records, end). records yields (WindowSummary, histogram) one
+        # at a time; a record cut short by a crash ends it. Once records is exhausted,
+        # end[0] is the offset just past the last complete record.
+        file = open(path, "rb")
+        try:
+            magic, settings_length = _HEADER.unpack(file.read(_HEADER.size))
+        except struct.error:
+            file.close()
+            raise ValueError(f"{path} is not a soak file")
+        if magic != SOAK_MAGIC:
+            file.close()
+            raise ValueError(f"{path} is not a soak file")
+        settings = json.loads(file.read(settings_length))
+        end = [file.tell()]
+
+        def records():
+            with file:
+                while True:
+                    header = file.read(_RECORD.size)
+                    if len(header) < _RECORD.size:
+                        return
+                    (start, length, covered, type_index, sent, received, jitter_ns, minimum, maximum, total,
+                     bucket_count) = _RECORD.unpack(header)
+                    data = file.read(bucket_count * _BUCKET.size)
+                    if len(data) < bucket_count * _BUCKET.size:
+                        return
+                    end[0] = file.tell()
+                    buckets = list(_BUCKET.iter_unpack(data))
+                    histogram = _histogram_from_buckets(buckets, received, minimum, maximum, total)
+                    yield WindowSummary(start, length, covered, settings["traffic_types"][type_index], sent,
+                                        histogram, jitter_ns), histogram
+        return settings, records(), end
+
+    def create(self, settings):
+        # Refuses to overwrite an earlier run; resume() continues one
+        self._file = open(self.path, "xb")
+        encoded = json.dumps(settings, sort_keys=True).encode()
+        self._file.write(_HEADER.pack(SOAK_MAGIC, len(encoded)) + encoded)
+        self._file.flush()
+        self._types = {traffic_type: i for i, traffic_type in enumerate(settings["traffic_types"])}
+
+    def resume(self, end):
+        # Appends after the last complete record, dropping a partial one left by a crash
+        self._file = open(self.path, "r+b")
+        self._file.truncate(end)
+        self._file.seek(end)
+
+    def set_types(self, traffic_types):
+        self._types = {traffic_type: i for i, traffic_type in enumerate(traffic_types)}
+
+    def append(self, window, histogram, sync=False):
+        buckets = _sparse_buckets(histogram)
+        record = _RECORD.pack(window.start, window.length, window.covered, self._types[window.traffic_type],
+                              window.sent, histogram.count, window.jitter * 1_000_000_000, histogram.min or 0,
+                              histogram.max or 0, histogram.total, len(buckets))
+        self._file.write(record + b"".join(_BUCKET.pack(index, count) for index, count in buckets))
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SoakTest:
+    # Probes the traffic types' templates every `interval` for `duration` seconds of
+    # run time in total, rolling replies up into windows recorded in the soak file.
+    # A resumed run reads the file back and only runs for the time still owed.
+    def __init__(self, path, templates, duration, windows=DEFAULT_WINDOWS, ring_size=DEFAULT_RING_SIZE,
+                 settings=None):
+        self.path = path
+        self.templates = templates
+        self.duration = duration
+        self.windows = sorted(float(length) for length in windows)
+        self.ring_size = ring_size
+        self.settings = dict(settings or {}, traffic_types=list(templates), windows=self.windows, duration=duration)
+        self.rollup = None
+        self.elapsed = 0.0  # Run time covered by the file, earlier runs included
+        self.resumed = False
+
+    def run(self, engine, stop_event=None, on_window=None, resume=False, on_rtt=None):
+        # engine is a ProbeEngine. on_window(WindowSummary) gets every closed window
+        # from the probing threads; it must not block. Returns summary().
+        soak_file = SoakFile(self.path)
+        self.rollup = rollup = WindowRollup(self.templates, self.windows, engine.timeout, self.ring_size)
+        if resume and os.path.exists(self.path):
+            self._load(rollup)
+            soak_file.resume(self._end)
+            soak_file.set_types(self.settings["traffic_types"])
+            self.resumed = True
+        else:
+            soak_file.create(self.settings)
+        rollup.started = time.time()
+
+        def on_close(window, histogram):
+            if window.length == self.windows[0] and window.traffic_type == rollup.traffic_types[0]:
+                self.elapsed += window.covered
+            # Every longest window is forced to disk; shorter ones reach it with the OS's writeback
+            soak_file.append(window, histogram, sync=window.length == self.windows[-1])
+            if on_window is not None:
+                on_window(window)
+        rollup.on_close = on_close
+
+        def on_reply(traffic_type, rtt_ns):
+            rollup.reply(traffic_type, rtt_ns)
+            if on_rtt is not None:
+                on_rtt(traffic_type, rtt_ns)
+
+        remaining = self.duration - self.elapsed
+        try:
+            if remaining > 0:
+                deadline = _Deadline(time.monotonic() + remaining, stop_event)
+                count = int(remaining / (engine.interval * len(self.templates))) + 1
+                engine.run(self.templates, count, stop_event=deadline, on_rtt=on_reply, on_sent=rollup.sent)
+            rollup.close_all()
+        finally:
+            soak_file.close()
+        return self.summary()
+
+    def _load(self, rollup):
+        settings, records, end = SoakFile.read(self.path)
+        for key in ("traffic_types", "windows"):
+            if settings[key] != self.settings[key]:
+                raise ValueError(f"{self.path} was recorded with {key} {settings[key]}, not {self.settings[key]}")
+        self.settings = dict(settings, duration=self.duration)
+        self.elapsed = _restore(rollup, records)
+        self._end = end[0]
+
+    def summary(self):
+        # {"elapsed", "file", "resumed", "traffic_types": {type: totals with the worst window}}
+        return soak_summary(self.rollup, self.path, self.elapsed, self.resumed)
+
+
+def soak_summary(rollup, path, elapsed, resumed=False):
+    traffic_types = {}
+    for traffic_type in rollup.traffic_types:
+        histogram = rollup.totals[traffic_type]
+        sent = rollup.sent_totals[traffic_type]
+        summary = {
+            "sent": sent,
+            "received": histogram.count,
+            "packet_loss": max(0, sent - histogram.count) / sent * 100 if sent else 0.0,
+            "average_latency": histogram.mean / 1_000_000_000,
+            "min_latency": (histogram.min or 0) / 1_000_000_000,
+            "max_latency": (histogram.max or 0) / 1_000_000_000,
+        }
+        for percent in DEFAULT_PERCENTILES:
+            summary[f"p{percent:g}"] = histogram.percentile(percent) / 1_000_000_000
+        # Worst of the recent longest windows still in memory
+        windows = [window for window in rollup.recent[rollup.lengths[-1]] if window.traffic_type == traffic_type]
+        if windows:
+            summary["worst_window"] = max(windows, key=lambda window: (window.loss_percentage,
+                                                                       window.percentiles.get(99, 0))).summary()
+        traffic_types[traffic_type] = summary
+    return {"elapsed": elapsed, "file": path, "resumed": resumed, "traffic_types": traffic_types}
+
+
+def format_soak(summary):
+    lines = [f"Soak Test: {summary['elapsed']:.0f} seconds{' (resumed)' if summary['resumed'] else ''}, "
+             f"windows in {summary['file']}"]
+    for traffic_type, totals in summary["traffic_types"].items():
+        lines.append(f"{traffic_type}: {totals['received']}/{totals['sent']} replies, "
+                     f"{totals['packet_loss']:.2f}% loss, average {totals['average_latency']:.6f} seconds")
+        percentiles = " / ".join(f"{totals[f'p{percent:g}']:.6f}" for percent in DEFAULT_PERCENTILES)
+        lines.append(f"{traffic_type} Latency p{'/p'.join(f'{p:g}' for p in DEFAULT_PERCENTILES)}/max: "
+                     f"{percentiles} / {totals['max_latency']:.6f} seconds")
+        worst = totals.get("worst_window")
+        if worst is not None:
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(worst["start"]))
+            lines.append(f"{traffic_type} worst {worst['length']:g} second window at {started}: "
+                         f"{worst['packet_loss']:.2f}% loss, p99 {worst['p99']:.6f} seconds")
+    return "\n".join(lines)
+
+
+class _Deadline:
+    # Stands in for the stop_event of ProbeEngine.run: set once the soak's time is up
+    def __init__(self, deadline, stop_event=None):
+        self.deadline = deadline
+        self.stop_event = stop_event
+
+    def is_set(self):
+        return time.monotonic() >= self.deadline or (self.stop_event is not None and self.stop_event.is_set())
+
+
+def _restore(rollup, records):
+    # Feeds a soak file's windows into a rollup; returns the run time they cover
+    elapsed = 0.0
+    for window, histogram in records:
+        rollup.add(window, histogram)
+        if window.length == rollup.lengths[0] and window.traffic_type == rollup.traffic_types[0]:
+            elapsed += window.covered
+    return elapsed
+
+
+def load_summary(path, ring_size=DEFAULT_RING_SIZE):
+    # Totals of a soak file without running anything, e.g. for a run in progress
+    settings, records, _ = SoakFile.read(path)
+    rollup = WindowRollup(settings["traffic_types"], settings["windows"], ring_size=ring_size)
+    return soak_summary(rollup, path, _restore(rollup, records))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a soak test file")
+    parser.add_argument("file", nargs="?", default=DEFAULT_SOAK_FILE)
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+    result = load_summary(args.file)
+    print(json.dumps(result, indent=2) if args.json else format_soak(result))
@@ -0,0 +1,76 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that must not be loaded just by importing the tester or starting the CLI
+HEAVY_MODULES = ("tkinter", "scapy", "speedtest", "ping3", "asyncio")
+DEFAULT_RUNS = 10
+DEFAULT_BUDGET_MS = 150.0
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_CHECK_MODULES = (
+    "import sys, N_T_G_CLI\n"
+    f"loaded = sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules)\n"
+    "print(','.join(loaded))\n"
+)
+
+
+def _time_command(command, runs):
+    # Wall-clock milliseconds of a fresh interpreter running `command`, best and median of `runs`
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=_HERE, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), statistics.median(timings)
+
+
+def _slowest_imports(count=10):
+    # Cumulative import times from `python -X importtime`, slowest first
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import N_T_G_CLI"], cwd=_HERE,
+                            check=True, capture_output=True, text=True).stderr
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how long the headless tester takes to start")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Fail if starting the CLI (median, ms) exceeds this, on top of a bare interpreter")
+    args = parser.parse_args(argv)
+
+    baseline = _time_command([sys.executable, "-c", "pass"], args.runs)
+    startup = _time_command([sys.executable, "N_T_G_CLI.py", "--help"], args.runs)
+    overhead = startup[1] - baseline[1]
+    print(f"Bare interpreter: {baseline[0]:.1f} ms best, {baseline[1]:.1f} ms median")
+    print(f"N_T_G_CLI --help: {startup[0]:.1f} ms best, {startup[1]:.1f} ms median ({overhead:+.1f} ms)")
+
+    print("Slowest imports (cumulative):")
+    for microseconds, name in _slowest_imports():
+        print(f"  {microseconds / 1000:8.1f} ms  {name}")
+
+    loaded = subprocess.run([sys.executable, "-c", _CHECK_MODULES], cwd=_HERE, check=True,
+                            capture_output=True, text=True).stdout.strip()
+    failed = False
+    if loaded:
+        print(f"FAIL: importing the CLI loads {loaded.replace(',', ', ')}")
+        failed = True
+    if overhead > args.budget:
+        print(f"FAIL: startup overhead {overhead:.1f} ms is over the {args.budget:.0f} ms budget")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import threading
+import time
+
+# Resource classes: shared tests only probe the link lightly and may overlap
+# with each other; exclusive tests saturate it and must run alone.
+RESOURCE_SHARED = "shared"
+RESOURCE_EXCLUSIVE = "exclusive"
+
+
+class ScheduledTest:
+    def __init__(self, name, func, resource_class):
+        self.name = name
+        self.func = func
+        self.resource_class = resource_class
+        self.result = None
+        self.error = None
+        self.wall_time = 0.0
+        self.ran = False  # False when the run was stopped before this test's phase
+
+    def run(self, on_done=None):
+        # Exceptions are kept on self.error; TestScheduler.run decides whether to raise them
+        start_time = time.monotonic()
+        try:
+            self.result = self.func()
+        except Exception as e:
+            self.error = e
+        self.wall_time = time.monotonic() - start_time
+        self.ran = True
+        if on_done is not None:
+            on_done(self)
+
+
+class TestScheduler:
+    def __init__(self):
+        self.tests = []
+        self.elapsed = 0.0
+
+    def add(self, name, func, resource_class=RESOURCE_SHARED):
+        if resource_class not in (RESOURCE_SHARED, RESOURCE_EXCLUSIVE):
+            raise ValueError(f"Unknown resource class: {resource_class}")
+        test = ScheduledTest(name, func, resource_class)
+        self.tests.append(test)
+        return test
+
+    def phases(self):
+        # Consecutive shared tests form one concurrent phase; each exclusive test is its own phase
+        phases = []
+        for test in self.tests:
+            if test.resource_class == RESOURCE_SHARED and phases and phases[-1][0].resource_class == RESOURCE_SHARED:
+                phases[-1].append(test)
+            else:
+                phases.append([test])
+        return phases
+
+    def run(self, raise_errors=True, stop_event=None, on_test_done=None):
+        # With raise_errors=False a failing test does not stop the run; it is left
+        # out of the results and its exception stays on ScheduledTest.error.
+        # Once stop_event is set no further phase starts. on_test_done(test) is
+        # called as each test finishes, from the thread that ran it.
+        start_time = time.monotonic()
+        for phase in self.phases():
+            if stop_event is not None and stop_event.is_set():
+                break
+            if len(phase) == 1:
+                phase[0].run(on_test_done)
+            else:
+                threads = [threading.Thread(target=test.run, args=(on_test_done,), name=test.name) for test in phase]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            if raise_errors:
+                for test in phase:
+                    if test.error is not None:
+                        raise test.error
+        self.elapsed = time.monotonic() - start_time
+        return {test.name: test.result for test in self.tests if test.ran and test.error is None}
+
+    @property
+    def time_saved(self):
+        return max(0.0, sum(test.wall_time for test in self.tests) - self.elapsed)
+
+    def summary(self):
+        lines = [f"{test.name}: {test.wall_time:.2f} seconds ({test.resource_class})" for test in self.tests if test.ran]
+        lines.append(f"Total: {self.elapsed:.2f} seconds, {self.time_saved:.2f} seconds saved by overlapping tests")
+        return lines
@@ -1,23 +1,39 @@
-from scapy.all import IP, UDP, Raw, send
+import random
 import time
 
+from scapy.all import IP, UDP, Raw
+
+from Packet_Template import PacketTemplate
+from Reflector import ReflectorClient, test_payload
+from Send_Engine import SendEngine
+
 def measure_throughput():
     network_ip = input("Enter the IP address for throughput test: ")
     packet_size = int(input("Enter the packet size for throughput test (bytes): "))
     duration = int(input("Enter the duration for throughput test (seconds): "))
-    packet = IP(dst=network_ip) / UDP(dport=80) / Raw(load='X' * (packet_size - 20 - 8))
-    start_time = time.time()
-    packet_count = 0
+    reflector_port = input("Enter the port of a reflector on the target (blank if none): ")
+
+    if reflector_port.strip():
+        # Sequence-numbered test stream, counted at the far end by Reflector.py
+        stream_id = random.getrandbits(32)
+        packet = IP(dst=network_ip) / UDP(dport=int(reflector_port)) / Raw(load=test_payload(stream_id, packet_size - 20 - 8))
+        frame = PacketTemplate(packet, test_header_offset=20 + 8)
+    else:
+        frame = IP(dst=network_ip) / UDP(dport=80) / Raw(load='X' * (packet_size - 20 - 8))
 
-    while time.time() - start_time < duration:
-        send(packet, verbose=False)
-        packet_count += 1
+    with SendEngine(network_ip) as engine:
+        stats = engine.run(frame, duration)
 
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    throughput = (packet_size * packet_count * 8) / elapsed_time  # bits per second
-    throughput_mbps = throughput / 1_000_000  # Mbps
-    return f"Throughput: {throughput_mbps:.2f} Mbps"
+    results = (f"Throughput: {stats.mbps:.2f} Mbps",
+               f"Packets: {stats.packets} ({stats.pps:.0f} pps) in {stats.syscalls} syscalls")
+    if reflector_port.strip():
+        time.sleep(0.25)  # Let packets still in flight reach the reflector
+        received = ReflectorClient(network_ip, int(reflector_port)).query(stream_id, sent=stats.packets)
+        results += (f"Received: {received['receive_mbps']:.2f} Mbps ({received['received']} packets)",
+                    f"Loss: {received['loss_percentage']:.2f}%, reordered: {received['reordered']}, "
+                    f"duplicates: {received['duplicates']}")
+    return results
 
-throughput_result = measure_throughput()
-print(throughput_result)
+throughput_results = measure_throughput()
+for result in throughput_results:
+    print(result)
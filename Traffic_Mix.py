@@ -0,0 +1,141 @@
+from array import array
+
+from Send_Engine import BATCH_SIZE, FrameBatch, SendStats
+
+# Frame sizes are Ethernet frame sizes, as IMIX is specified; the IP packet sent is
+# this much smaller (14 byte header, 4 byte FCS)
+ETHERNET_OVERHEAD = 18
+MIN_FRAME_SIZE = 64
+
+# Simple IMIX: 7 parts 64 byte, 4 parts 594 byte, 1 part 1518 byte frames
+IMIX_SIMPLE = ((64, 7), (594, 4), (1518, 1))
+FRAME_MIXES = {"imix": IMIX_SIMPLE}
+
+# Frames in the precomputed schedule; the sender cycles through it
+SCHEDULE_LENGTH = 4096
+
+
+def parse_weights(spec, key=str):
+    # "TCP=5,HTTP=3,NTP" -> [("TCP", 5.0), ("HTTP", 3.0), ("NTP", 1.0)]
+    weights = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        weight = float(weight) if weight.strip() else 1.0
+        if weight <= 0:
+            raise ValueError(f"Weight of {name.strip()} must be positive")
+        weights.append((key(name.strip()), weight))
+    if not weights:
+        raise ValueError("No weights given")
+    return weights
+
+
+def parse_frame_mix(spec):
+    # "imix" or "64=7,594=4,1518=1" -> ((size, weight), ...)
+    if spec.strip().lower() in FRAME_MIXES:
+        return FRAME_MIXES[spec.strip().lower()]
+    sizes = tuple(parse_weights(spec, int))
+    if any(size < MIN_FRAME_SIZE for size, _ in sizes):
+        raise ValueError(f"Frame sizes must be at least {MIN_FRAME_SIZE} bytes")
+    return sizes
+
+
+class TrafficMix:
+    # Weighted traffic types crossed with a frame size distribution. Each
+    # (traffic type, frame size) pair is a class, weighted by the product of its
+    # two weights, and every class gets its share of a fixed-length schedule.
+    def __init__(self, type_weights, frame_sizes=IMIX_SIMPLE, schedule_length=SCHEDULE_LENGTH):
+        type_weights = list(type_weights.items()) if isinstance(type_weights, dict) else list(type_weights)
+        self.type_weights = type_weights
+        self.frame_sizes = tuple(frame_sizes)
+        self.schedule_length = schedule_length
+        self.classes = [(traffic_type, size) for traffic_type, _ in type_weights for size, _ in self.frame_sizes]
+        self.weights = [type_weight * size_weight for _, type_weight in type_weights
+                        for _, size_weight in self.frame_sizes]
+
+    @staticmethod
+    def label(traffic_type, size):
+        return f"{traffic_type} {size}B"
+
+    @property
+    def labels(self):
+        return [self.label(traffic_type, size) for traffic_type, size in self.classes]
+
+    def schedule(self):
+        # Class index per frame slot. Counts are apportioned by largest remainder,
+        # then spread with smooth weighted round-robin, so every class recurs at an
+        # even spacing instead of arriving in runs.
+        total_weight = sum(self.weights)
+        quotas = [weight / total_weight * self.schedule_length for weight in self.weights]
+        counts = [int(quota) for quota in quotas]
+        by_remainder = sorted(range(len(quotas)), key=lambda i: quotas[i] - counts[i], reverse=True)
+        for i in by_remainder[:self.schedule_length - sum(counts)]:
+            counts[i] += 1
+
+        schedule = array("H")
+        current = [0] * len(counts)
+        for _ in range(self.schedule_length):
+            for i, count in enumerate(counts):
+                current[i] += count
+            chosen = max(range(len(counts)), key=current.__getitem__)
+            current[chosen] -= self.schedule_length
+            schedule.append(chosen)
+        return schedule
+
+    def build_batches(self, templates, address, batch_size=BATCH_SIZE):
+        # templates holds a PacketTemplate per class, in self.classes order. Returns
+        # MixBatches that together send the schedule once.
+        schedule = self.schedule()
+        batches = []
+        for first in range(0, len(schedule), batch_size):
+            class_ids = schedule[first:first + batch_size]
+            batch = FrameBatch([templates[i].frame for i in class_ids], address)
+            batch.templates = [templates[i] for i in class_ids]
+            batches.append(MixBatch(batch, class_ids, len(self.classes)))
+        return batches
+
+
+class MixBatch:
+    # A FrameBatch of mixed classes and what a full send of it adds to each class
+    def __init__(self, batch, class_ids, classes):
+        self.batch = batch
+        self.class_ids = class_ids
+        self.packets = [0] * classes
+        self.bytes = [0] * classes
+        for class_id, length in zip(class_ids, batch.lengths):
+            self.packets[class_id] += 1
+            self.bytes[class_id] += length
+
+
+class MixStats:
+    # Per-class counters filled from pump()'s on_batch callback
+    def __init__(self, mix, batches):
+        self.mix = mix
+        self.batches = batches
+        self.packets = [0] * len(mix.classes)
+        self.bytes = [0] * len(mix.classes)
+        self._offset = 0  # pump() finishes a partly sent batch before moving on
+
+    def on_batch(self, index, packets, bytes_sent, syscalls):
+        mix_batch = self.batches[index]
+        if packets == len(mix_batch.batch):
+            for class_id, (class_packets, class_bytes) in enumerate(zip(mix_batch.packets, mix_batch.bytes)):
+                self.packets[class_id] += class_packets
+                self.bytes[class_id] += class_bytes
+            return
+        end = self._offset + packets
+        for class_id, length in zip(mix_batch.class_ids[self._offset:end], mix_batch.batch.lengths[self._offset:end]):
+            self.packets[class_id] += 1
+            self.bytes[class_id] += length
+        self._offset = end % len(mix_batch.batch)
+
+    def results(self, total):
+        # {class label: SendStats} sharing the run's elapsed time; a paced run's target is split by packet share
+        results = {}
+        for class_id, label in enumerate(self.mix.labels):
+            stats = SendStats(self.packets[class_id], self.bytes[class_id], elapsed=total.elapsed)
+            if total.target_pps and total.packets:
+                stats.target_pps = total.target_pps * self.packets[class_id] / total.packets
+            results[label] = stats
+        return results
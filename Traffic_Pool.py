@@ -0,0 +1,145 @@
+import multiprocessing
+import multiprocessing.connection
+import threading
+import time
+
+from Send_Engine import BATCH_SIZE, SEND_SYSCALLS, SendEngine, SendStats
+
+POOL_BY_TRAFFIC_TYPE = "traffic_type"
+POOL_BY_FLOW = "flow"
+
+# Shared counters per assignment slot: packets, bytes, syscalls
+_COUNTERS_PER_SLOT = 3
+_START_TIMEOUT = 30
+PROGRESS_INTERVAL = 0.1
+
+# Workers are never plain fork()s of the parent: it runs threads (metrics server,
+# GUI worker, scheduler phases) that may hold a lock, such as a REGISTRY metric's,
+# at fork time, and a child that inherits it deadlocks on its first send. A fork
+# server starts them from a clean single-threaded process instead.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _CONTEXT = multiprocessing.get_context("forkserver")
+    _CONTEXT.set_forkserver_preload(["Traffic_Pool"])
+else:
+    _CONTEXT = multiprocessing.get_context("spawn")
+
+
+def split_by_flow(traffic_type, template, workers):
+    # Every worker sends the same traffic type on its own source port
+    return [[(traffic_type, template.for_flow(flow))] for flow in range(workers)]
+
+
+def split_by_traffic_type(templates, workers):
+    # Spread traffic types over the workers; spare workers add flows to the types round-robin
+    traffic_types = list(templates)
+    assignments = [[] for _ in range(workers)]
+    flows = dict.fromkeys(traffic_types, 0)
+    for i in range(max(workers, len(traffic_types))):
+        traffic_type = traffic_types[i % len(traffic_types)]
+        assignments[i % workers].append((traffic_type, templates[traffic_type].for_flow(flows[traffic_type])))
+        flows[traffic_type] += 1
+    return assignments
+
+
+def _worker(index, network_ip, batch_size, assignment, first_slot, duration, profile, counters, elapsed, barrier,
+            stop):
+    try:
+        engine = SendEngine(network_ip, batch_size).open()
+    except Exception:
+        barrier.abort()
+        raise
+    barrier.wait()
+
+    def on_batch(source, packets, bytes_sent, syscalls):
+        base = (first_slot + source) * _COUNTERS_PER_SLOT
+        counters[base] += packets
+        counters[base + 1] += bytes_sent
+        counters[base + 2] += syscalls
+
+    # A worker with several traffic types rotates through them batch by batch
+    stats = engine.pump([template for _, template in assignment], duration, profile, on_batch, stop)
+    elapsed[index] = stats.elapsed
+    engine.close()
+
+
+class TrafficPool:
+    def __init__(self, network_ip, workers=None, batch_size=BATCH_SIZE):
+        self.network_ip = network_ip
+        self.workers = workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+
+    def run(self, assignments, duration, profile=None, stop_event=None, on_progress=None):
+        # assignments holds one list of (label, template) per worker; returns {label: SendStats}.
+        # A rate profile is split evenly between the workers. Setting stop_event ends the
+        # run early; on_progress(label, packets, bytes) gets running totals every PROGRESS_INTERVAL.
+        slots = []
+        first_slots = []
+        for assignment in assignments:
+            first_slots.append(len(slots))
+            slots.extend(label for label, _ in assignment)
+
+        # Workers only ever add to their own slots, so the counters need no lock
+        counters = _CONTEXT.RawArray("Q", len(slots) * _COUNTERS_PER_SLOT)
+        elapsed = _CONTEXT.RawArray("d", len(assignments))
+        barrier = _CONTEXT.Barrier(len(assignments) + 1)
+        stop = _CONTEXT.Event()
+
+        processes = [
+            _CONTEXT.Process(
+                target=_worker,
+                args=(i, self.network_ip, self.batch_size, assignment, first_slots[i], duration,
+                      profile.scaled(1 / len(assignments)) if profile else None, counters, elapsed, barrier,
+                      stop),
+                daemon=True)
+            for i, assignment in enumerate(assignments)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            barrier.wait(timeout=_START_TIMEOUT)
+        except threading.BrokenBarrierError:
+            for process in processes:
+                process.terminate()
+            raise RuntimeError("Traffic pool workers failed to start (raw sockets need root)")
+        # Wait on the process sentinels in short steps so stop requests and progress get through
+        running = processes
+        while running:
+            multiprocessing.connection.wait([process.sentinel for process in running], PROGRESS_INTERVAL)
+            running = [process for process in running if process.is_alive()]
+            if stop_event is not None and stop_event.is_set():
+                stop.set()
+            if on_progress is not None:
+                self._report(slots, counters, on_progress)
+        for process in processes:
+            process.join()
+
+        run_time = max(elapsed) if elapsed else 0.0
+        stats = {}
+        for slot, label in enumerate(slots):
+            label_stats = stats.setdefault(label, SendStats(elapsed=run_time))
+            base = slot * _COUNTERS_PER_SLOT
+            label_stats.packets += counters[base]
+            label_stats.bytes_sent += counters[base + 1]
+            label_stats.syscalls += counters[base + 2]
+        # The workers' own metrics die with them; their send calls are counted here
+        SEND_SYSCALLS.add(sum(counters[slot * _COUNTERS_PER_SLOT + 2] for slot in range(len(slots))))
+
+        if profile is not None:
+            # Each worker's share of the rate is spread evenly over the sources it rotates through
+            worker_profile = profile.scaled(1 / len(assignments))
+            for assignment in assignments:
+                frame_bytes = sum(len(template) for _, template in assignment) / len(assignment)
+                share = worker_profile.target_pps(duration, frame_bytes) / len(assignment)
+                for label, _ in assignment:
+                    stats[label].target_pps = (stats[label].target_pps or 0.0) + share
+        return stats
+
+    @staticmethod
+    def _report(slots, counters, on_progress):
+        totals = {}
+        for slot, label in enumerate(slots):
+            base = slot * _COUNTERS_PER_SLOT
+            packets, bytes_sent = totals.get(label, (0, 0))
+            totals[label] = (packets + counters[base], bytes_sent + counters[base + 1])
+        for label, (packets, bytes_sent) in totals.items():
+            on_progress(label, packets, bytes_sent)